@@ -4,6 +4,7 @@ from __future__ import annotations
 import json
 import os
 import sys
+import tempfile
 from http.server import BaseHTTPRequestHandler
 from typing import Any
 
@@ -19,6 +20,19 @@ try:
 except Exception:
     pass
 
+# Na Vercel katalog projektu jest tylko do odczytu – cache w /tmp (współdzielony w ramach instancji)
+if os.environ.get("VERCEL"):
+    os.environ.setdefault(
+        "IMAGE_CACHE_DIR",
+        os.path.join(tempfile.gettempdir(), "photogen_cache", "images"),
+    )
+    os.environ.setdefault(
+        "CACHE_DB_PATH",
+        os.path.join(tempfile.gettempdir(), "photogen_cache", "cache.sqlite"),
+    )
+    # preprocessing zdjęć w wątkach – bez puli procesów w funkcji serverless
+    os.environ.setdefault("IMAGE_PREPROCESS_PROCESSES", "0")
+
 
 def parse_json_body(handler: BaseHTTPRequestHandler) -> dict[str, Any] | None:
     content_length = int(handler.headers.get("Content-Length", 0))
@@ -0,0 +1,164 @@
+"""
+POST /api/batch_generate
+Body: {
+  "products": [
+    { "ean": "...", "productName": "...", "imageUrls": [...], "uploadedImages": [...] },
+    ...
+  ],  // max 6 (MAX_PRODUCTS)
+  "generationMode": "two_step" | "single"  // opcjonalne, wspólne dla wszystkich
+}
+Produkty z żądania: run_from_images dla każdego, równolegle (config.BATCH_GENERATE_CONCURRENCY
+produktów naraz, wspólny limit wywołań Claude CLAUDE_CONCURRENCY). Żądanie obejmuje jedną falę
+produktów, żeby zmieścić się w maxDuration (vercel.json) – frontend dzieli większą listę na kolejne
+żądania. Produkty niezakończone po BATCH_GENERATE_DEADLINE_S są przerywane z błędem "timeout".
+Odpowiedź strumieniowa NDJSON (application/x-ndjson) – jedna linia na produkt, gdy tylko skończy:
+  { "index": 0, ...wynik jak /api/run_from_images }  lub  { "index": 0, "ean": "...", "error": "..." }
+Ostatnia linia: { "done": true, "count": N }.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler
+from typing import Any
+
+from api._shared import parse_json_body, send_error
+
+# jedna fala przy domyślnym BATCH_GENERATE_CONCURRENCY (GENERATE_CHUNK_PRODUCTS w app/page.tsx)
+MAX_PRODUCTS = 6
+TIMEOUT_ERROR = "Przekroczony limit czasu żądania – wygeneruj ten produkt ponownie"
+
+
+def _product_input(item: Any) -> dict[str, Any]:
+    item = item if isinstance(item, dict) else {}
+    return {
+        "ean": str(item.get("ean") or "").strip(),
+        "product_name": (item.get("productName") or item.get("product_name") or "").strip(),
+        "image_urls": list(item.get("imageUrls") or item.get("image_urls") or []),
+        "uploaded": list(item.get("uploadedImages") or item.get("uploaded_images") or []),
+    }
+
+
+def _input_error(product: dict[str, Any]) -> str | None:
+    if not product["product_name"]:
+        return "Wymagane: productName"
+    if not product["image_urls"] and not product["uploaded"]:
+        return "Brak wybranych zdjęć"
+    return None
+
+
+class handler(BaseHTTPRequestHandler):
+    def do_OPTIONS(self):
+        self.send_response(204)
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Allow-Methods", "POST, OPTIONS")
+        self.send_header("Access-Control-Allow-Headers", "Content-Type")
+        self.end_headers()
+
+    def do_POST(self):
+        body = parse_json_body(self)
+        if not body or not isinstance(body.get("products"), list):
+            send_error(self, 400, "Brak pola 'products' w body")
+            return
+        products = [_product_input(p) for p in body["products"]]
+        if not products:
+            send_error(self, 400, "Lista produktów jest pusta")
+            return
+        if len(products) > MAX_PRODUCTS:
+            send_error(self, 400, f"Maksymalnie {MAX_PRODUCTS} produktów w jednym żądaniu")
+            return
+        generation_mode = body.get("generationMode") or body.get("generation_mode") or None
+        try:
+            import config
+            from src.claude_client import run_with_claude
+            from src.pipeline import GENERATION_MODES, run_pipeline_from_selected_images_async
+        except Exception as e:
+            send_error(self, 500, f"Import: {e!s}")
+            return
+        if generation_mode is not None and generation_mode not in GENERATION_MODES:
+            send_error(self, 400, f"generationMode: dozwolone {', '.join(GENERATION_MODES)}")
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("X-Accel-Buffering", "no")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+
+        with tempfile.TemporaryDirectory(prefix="photogen_batch_") as tmp:
+            run_with_claude(self._generate(
+                products,
+                generation_mode,
+                Path(tmp),
+                config.BATCH_GENERATE_CONCURRENCY,
+                run_pipeline_from_selected_images_async,
+                config.BATCH_GENERATE_DEADLINE_S,
+            ))
+
+    async def _generate(self, products, generation_mode, work_root, concurrency, run_async, deadline_s) -> None:
+        """
+        Produkty równolegle (limit concurrency); każdy wynik wysyłany zaraz po ukończeniu.
+        Po deadline_s niezakończone produkty są anulowane i zgłaszane jako błąd (zamiast urwanego strumienia).
+        Linie zapisywane do gniazda w osobnym wątku (kolejność zachowana), nie blokują pętli.
+        Przed powrotem czeka także na pracę w wątkach anulowanych produktów – work_root jest usuwany zaraz potem.
+        """
+        limit = asyncio.Semaphore(max(1, concurrency))
+        loop = asyncio.get_running_loop()
+        writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ndjson")
+
+        async def write(data: dict[str, Any]) -> None:
+            await loop.run_in_executor(writer, self._write_line, data)
+
+        async def run(index: int, product: dict[str, Any]) -> dict[str, Any]:
+            error = _input_error(product)
+            if error is not None:
+                return {"index": index, "ean": product["ean"], "error": error}
+            async with limit:
+                try:
+                    result = await run_async(
+                        product["ean"] or "0",
+                        product["product_name"],
+                        image_urls=product["image_urls"],
+                        uploaded_images_base64=product["uploaded"],
+                        work_dir=work_root / f"{index:03d}",
+                        save_to_db=False,
+                        generation_mode=generation_mode,
+                    )
+                except Exception as e:
+                    return {"index": index, "ean": product["ean"], "error": str(e)}
+            return {"index": index, **result}
+
+        tasks = [asyncio.create_task(run(i, p)) for i, p in enumerate(products)]
+        deadline = loop.time() + deadline_s
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, deadline - loop.time()), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    break
+                for t in done:
+                    await write(t.result())
+            for i, t in enumerate(tasks):
+                if t in pending:
+                    t.cancel()
+                    await write({"index": i, "ean": products[i]["ean"], "error": TIMEOUT_ERROR})
+            await write({"done": True, "count": len(products)})
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # klient się rozłączył – reszta produktów anulowana
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # anulowanie nie przerywa asyncio.to_thread – poczekaj, aż wątki przestaną pisać w work_root
+            await loop.shutdown_default_executor()
+            writer.shutdown(wait=False)
+
+    def _write_line(self, data: dict[str, Any]) -> None:
+        self.wfile.write(json.dumps(data, ensure_ascii=False).encode("utf-8") + b"\n")
+        self.wfile.flush()
@@ -1,15 +1,18 @@
 """
 POST /api/batch_search
-Body: { "eans": ["590...", ...] }  (max 10)
+Body: { "eans": ["590...", ...], "refresh": false }  (max 30; refresh = pomiń cache lookupu EAN)
+EAN-y przetwarzane równolegle (SEARCH_WORKERS naraz).
 Zwraca: { "products": { "ean": { "product": { name, ean, brand }, "sources": [ { image_url, page_url, title } ] } } }
 """
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
 from http.server import BaseHTTPRequestHandler
 
 from api._shared import parse_json_body, send_error, send_json
 
-MAX_EANS = 10
+MAX_EANS = 30
+SEARCH_WORKERS = 8
 
 
 class handler(BaseHTTPRequestHandler):
@@ -36,20 +39,20 @@ class handler(BaseHTTPRequestHandler):
         except Exception as e:
             send_error(self, 500, f"Import: {e!s}")
             return
-        products = {}
-        for ean in eans:
+        refresh = bool(body.get("refresh"))
+
+        def search(ean: str) -> tuple[str, dict]:
             ean_clean = "".join(c for c in ean if c.isdigit())
             if not ean_clean:
-                products[ean] = {"error": "Invalid EAN"}
-                continue
+                return ean, {"error": "Invalid EAN"}
             try:
-                product = lookup_product(ean_clean)
+                product = lookup_product(ean_clean, refresh=refresh)
                 sources, _ = search_image_sources(
                     product.name,
                     ean=product.ean,
                     min_count=config.MIN_IMAGES_TO_FETCH,
                 )
-                products[ean_clean] = {
+                return ean_clean, {
                     "product": {
                         "name": product.name,
                         "ean": product.ean,
@@ -67,5 +70,8 @@ class handler(BaseHTTPRequestHandler):
                     ],
                 }
             except Exception as e:
-                products[ean_clean] = {"error": str(e)}
+                return ean_clean, {"error": str(e)}
+
+        with ThreadPoolExecutor(max_workers=min(SEARCH_WORKERS, len(eans))) as pool:
+            products = dict(pool.map(search, eans))
         send_json(self, 200, {"products": products})
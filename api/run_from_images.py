@@ -4,7 +4,8 @@ Body: {
   "ean": "...",
   "productName": "...",
   "imageUrls": ["url1", "url2", ...],
-  "uploadedImages": ["data:image/jpeg;base64,...", ...]  // opcjonalne
+  "uploadedImages": ["data:image/jpeg;base64,...", ...],  // opcjonalne
+  "generationMode": "two_step" | "single"  // opcjonalne
 }
 Używa tylko wybranych/wgranych zdjęć (bez search, bez matching). Zwraca wynik jak pipeline.
 """
@@ -34,6 +35,7 @@ class handler(BaseHTTPRequestHandler):
         product_name = (body.get("productName") or body.get("product_name") or "").strip()
         image_urls = list(body.get("imageUrls") or body.get("image_urls") or [])
         uploaded = list(body.get("uploadedImages") or body.get("uploaded_images") or [])
+        generation_mode = body.get("generationMode") or body.get("generation_mode") or None
         if not product_name:
             send_error(self, 400, "Wymagane: productName")
             return
@@ -41,10 +43,13 @@ class handler(BaseHTTPRequestHandler):
             send_error(self, 400, "Podaj imageUrls lub uploadedImages")
             return
         try:
-            from src.pipeline import run_pipeline_from_selected_images
+            from src.pipeline import GENERATION_MODES, run_pipeline_from_selected_images
         except Exception as e:
             send_error(self, 500, f"Import: {e!s}")
             return
+        if generation_mode is not None and generation_mode not in GENERATION_MODES:
+            send_error(self, 400, f"generationMode: dozwolone {', '.join(GENERATION_MODES)}")
+            return
         with tempfile.TemporaryDirectory(prefix="photogen_") as tmp:
             work_dir = Path(tmp)
             try:
@@ -55,6 +60,7 @@ class handler(BaseHTTPRequestHandler):
                     uploaded_images_base64=uploaded,
                     work_dir=work_dir,
                     save_to_db=False,
+                    generation_mode=generation_mode,
                 )
                 send_json(self, 200, result)
             except Exception as e:
@@ -1,7 +1,9 @@
 """
 POST /api/search_more
-Body: { "ean": "...", "productName": "..." }
-Zwraca: { "sources": [ { image_url, page_url, title } ] }  – kolejna porcja zdjęć
+Body: { "ean": "...", "productName": "...", "cursor": "..." | null, "excludeUrls": ["...", ...] }
+Zwraca: { "sources": [ { image_url, page_url, title } ], "nextCursor": "..." | null }
+– kolejna porcja zdjęć: od pozycji z kursora (poprzednia odpowiedź), bez URL-i z excludeUrls
+(zdjęcia już pokazane). nextCursor = null – wyniki wyszukiwania się skończyły.
 """
 from __future__ import annotations
 
@@ -9,6 +11,8 @@ from http.server import BaseHTTPRequestHandler
 
 from api._shared import parse_json_body, send_error, send_json
 
+MAX_EXCLUDE_URLS = 1000
+
 
 class handler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
@@ -28,16 +32,23 @@ class handler(BaseHTTPRequestHandler):
         if not product_name:
             send_error(self, 400, "productName nie może być puste")
             return
+        cursor = body.get("cursor") or None
+        if cursor is not None and not isinstance(cursor, str):
+            send_error(self, 400, "cursor musi być tekstem")
+            return
+        exclude_urls = [u for u in (body.get("excludeUrls") or []) if isinstance(u, str)][:MAX_EXCLUDE_URLS]
         try:
             import config
-            from src.source_search import search_image_sources
+            from src.source_search import search_more_sources
         except Exception as e:
             send_error(self, 500, f"Import: {e!s}")
             return
         try:
-            sources, _ = search_image_sources(
+            sources, next_cursor = search_more_sources(
                 product_name,
                 ean=ean or None,
+                cursor=cursor,
+                exclude_urls=exclude_urls,
                 min_count=config.MIN_IMAGES_TO_FETCH,
             )
             send_json(self, 200, {
@@ -50,6 +61,7 @@ class handler(BaseHTTPRequestHandler):
                     }
                     for s in sources
                 ],
+                "nextCursor": next_cursor,
             })
         except Exception as e:
             send_error(self, 500, str(e))
@@ -2,8 +2,12 @@
 
 import { useState, useCallback } from "react";
 
-const MAX_PRODUCTS = 10;
+const MAX_PRODUCTS = 30;
 const API = ""; // względny URL na tym samym hoście (Vercel)
+// /api/batch_generate: jedno żądanie = jedna fala produktów (BATCH_GENERATE_CONCURRENCY, MAX_PRODUCTS w api/batch_generate.py)
+// w limicie czasu funkcji (maxDuration 300 s); body poniżej limitu rozmiaru żądania funkcji Vercel (4,5 MB)
+const GENERATE_CHUNK_PRODUCTS = 6;
+const GENERATE_CHUNK_BYTES = 4_000_000;
 
 type ProductInfo = {
   name: string;
@@ -27,6 +31,10 @@ type ProductData = {
 
 type SelectedImage = { url: string; type: "url" } | { data: string; type: "upload" };
 
+type GenerateProduct = { ean: string; productName: string; imageUrls: string[]; uploadedImages: string[] };
+// produkt w żądaniu /api/batch_generate + indeks jego wiersza w tabeli wyników
+type GenerateItem = { product: GenerateProduct; row: number };
+
 type ResultRow = {
   ean: string;
   productName: string;
@@ -44,6 +52,8 @@ export default function Home() {
   const [products, setProducts] = useState<Record<string, ProductData>>({});
   const [selectedByEan, setSelectedByEan] = useState<Record<string, SelectedImage[]>>({});
   const [extraSourcesByEan, setExtraSourcesByEan] = useState<Record<string, ImageSource[]>>({});
+  // kursor /api/search_more per EAN: brak = od początku, null = wyniki się skończyły
+  const [cursorByEan, setCursorByEan] = useState<Record<string, string | null>>({});
   const [step, setStep] = useState<"batch" | "validate" | "generating" | "results">("batch");
   const [results, setResults] = useState<ResultRow[]>([]);
 
@@ -79,6 +89,7 @@ export default function Home() {
       }
       setSelectedByEan(initial);
       setExtraSourcesByEan(extra);
+      setCursorByEan({});
       setStep("validate");
     } catch (e) {
       setError(e instanceof Error ? e.message : "Błąd ładowania");
@@ -90,10 +101,14 @@ export default function Home() {
   const searchMore = useCallback(async (ean: string, productName: string) => {
     setLoading(true);
     try {
+      // URL-e już pokazane – serwer zwraca tylko nowe zdjęcia
+      const excludeUrls = [...(products[ean]?.sources || []), ...(extraSourcesByEan[ean] || [])].map(
+        (s) => s.image_url
+      );
       const res = await fetch(`${API}/api/search_more`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ ean, productName }),
+        body: JSON.stringify({ ean, productName, cursor: cursorByEan[ean] ?? null, excludeUrls }),
       });
       const data = await res.json();
       if (!res.ok) throw new Error(data.error || "Błąd");
@@ -101,12 +116,13 @@ export default function Home() {
         ...prev,
         [ean]: [...(prev[ean] || []), ...(data.sources || [])],
       }));
+      setCursorByEan((prev) => ({ ...prev, [ean]: data.nextCursor ?? null }));
     } catch (e) {
       setError(e instanceof Error ? e.message : "Błąd");
     } finally {
       setLoading(false);
     }
-  }, []);
+  }, [products, extraSourcesByEan, cursorByEan]);
 
   const toggleImage = useCallback((ean: string, item: SelectedImage) => {
     setSelectedByEan((prev) => {
@@ -144,48 +160,103 @@ export default function Home() {
     setStep("generating");
     setError(null);
     setLoading(true);
-    const rows: ResultRow[] = [];
     const eans = Object.keys(products).filter((e) => !products[e].error);
-    for (const ean of eans) {
+    // wiersze w kolejności EAN-ów; wyniki z /api/batch_generate (NDJSON) przychodzą w kolejności ukończenia
+    const rows: (ResultRow | undefined)[] = eans.map(() => undefined);
+    const show = () => setResults(rows.filter((r): r is ResultRow => r !== undefined));
+    const errorRow = (ean: string, error: string): ResultRow => ({
+      ean,
+      productName: products[ean].product.name,
+      description: "",
+      error,
+    });
+    // żądania po max GENERATE_CHUNK_PRODUCTS produktów i GENERATE_CHUNK_BYTES body
+    const chunks: GenerateItem[][] = [];
+    let chunk: GenerateItem[] = [];
+    let chunkBytes = 0;
+    eans.forEach((ean, i) => {
       const sel = selectedByEan[ean] || [];
       const urls = sel.filter((s): s is { url: string; type: "url" } => s.type === "url").map((s) => s.url);
       const uploads = sel.filter((s): s is { data: string; type: "upload" } => s.type === "upload").map((s) => s.data);
       if (urls.length === 0 && uploads.length === 0) {
-        rows.push({ ean, productName: products[ean].product.name, description: "", error: "Brak wybranych zdjęć" });
-        setResults([...rows]);
-        continue;
+        rows[i] = errorRow(ean, "Brak wybranych zdjęć");
+        return;
+      }
+      const product = { ean, productName: products[ean].product.name, imageUrls: urls, uploadedImages: uploads };
+      const bytes = new Blob([JSON.stringify(product)]).size;
+      if (bytes > GENERATE_CHUNK_BYTES) {
+        rows[i] = errorRow(ean, "Wgrane zdjęcia przekraczają limit rozmiaru żądania – wybierz mniej lub mniejsze pliki");
+        return;
+      }
+      if (chunk.length >= GENERATE_CHUNK_PRODUCTS || chunkBytes + bytes > GENERATE_CHUNK_BYTES) {
+        chunks.push(chunk);
+        chunk = [];
+        chunkBytes = 0;
       }
+      chunk.push({ product, row: i });
+      chunkBytes += bytes;
+    });
+    if (chunk.length > 0) chunks.push(chunk);
+    show();
+
+    const generateChunk = async (batch: GenerateItem[]) => {
       try {
-        const res = await fetch(`${API}/api/run_from_images`, {
+        const res = await fetch(`${API}/api/batch_generate`, {
           method: "POST",
           headers: { "Content-Type": "application/json" },
-          body: JSON.stringify({
-            ean,
-            productName: products[ean].product.name,
-            imageUrls: urls,
-            uploadedImages: uploads,
-          }),
-        });
-        const data = await res.json();
-        if (!res.ok) throw new Error(data.error || "Błąd API");
-        const verified = data.verified || {};
-        rows.push({
-          ean: data.ean || ean,
-          productName: data.product?.name || products[ean].product.name,
-          description: verified.description_verified || data.base_description || "",
-          eanFromImages: verified.ean_from_images,
-          dimensions: verified.dimensions_from_images,
-          volumeOrWeight: verified.volume_or_weight_from_images,
+          body: JSON.stringify({ products: batch.map((b) => b.product) }),
         });
+        if (!res.ok || !res.body) {
+          const data = await res.json().catch(() => ({}));
+          throw new Error(data.error || "Błąd API");
+        }
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        const handleLine = (line: string) => {
+          if (!line.trim()) return;
+          const data = JSON.parse(line);
+          if (data.done || typeof data.index !== "number") return;
+          const { product, row } = batch[data.index];
+          const ean = product.ean;
+          const verified = data.verified || {};
+          rows[row] = data.error
+            ? errorRow(ean, data.error)
+            : {
+                ean: data.ean || ean,
+                productName: data.product?.name || products[ean].product.name,
+                description: verified.description_verified || data.base_description || "",
+                eanFromImages: verified.ean_from_images,
+                dimensions: verified.dimensions_from_images,
+                volumeOrWeight: verified.volume_or_weight_from_images,
+              };
+          show();
+        };
+        for (;;) {
+          const { done, value } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+          const lines = buffer.split("\n");
+          buffer = lines.pop() ?? "";
+          lines.forEach(handleLine);
+        }
+        handleLine(buffer + decoder.decode());
       } catch (e) {
-        rows.push({
-          ean,
-          productName: products[ean].product.name,
-          description: "",
-          error: e instanceof Error ? e.message : "Błąd generacji",
+        const message = e instanceof Error ? e.message : "Błąd generacji";
+        batch.forEach(({ product, row }) => {
+          if (!rows[row]) rows[row] = errorRow(product.ean, message);
         });
       }
-      setResults([...rows]);
+      // produkty bez wyniku (np. przerwany strumień)
+      batch.forEach(({ product, row }) => {
+        if (!rows[row]) rows[row] = errorRow(product.ean, "Brak wyniku generacji");
+      });
+      show();
+    };
+
+    // kolejno: każde żądanie ma własny limit czasu funkcji; równoległe żądania (osobne procesy) sumowałyby CLAUDE_CONCURRENCY
+    for (const batch of chunks) {
+      await generateChunk(batch);
     }
     setStep("results");
     setLoading(false);
@@ -291,9 +362,9 @@ export default function Home() {
                     type="button"
                     className="btn-secondary"
                     onClick={() => searchMore(ean, data.product.name)}
-                    disabled={loading}
+                    disabled={loading || cursorByEan[ean] === null}
                   >
-                    Szukaj więcej zdjęć
+                    {cursorByEan[ean] === null ? "Brak kolejnych zdjęć" : "Szukaj więcej zdjęć"}
                   </button>
                   <label className="btn-secondary" style={{ margin: 0 }}>
                     Wgraj zdjęcia
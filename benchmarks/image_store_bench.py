@@ -0,0 +1,107 @@
+"""
+Mikrobenchmark zapisu zdjęć do bazy (src.image_store.resize_image_for_storage): ms/zdjęcie
+i bajty/zdjęcie dla każdego formatu (jpeg, webp, avif) oraz dla dawnej ścieżki JPEG
+(pełne dekodowanie + pełny LANCZOS) jako punktu odniesienia.
+
+    python benchmarks/image_store_bench.py                      # zdjęcia z data/images/
+    python benchmarks/image_store_bench.py --images DIR --repeat 5
+    python benchmarks/image_store_bench.py --synthetic 8        # wygenerowane 4000x3000 JPEG
+
+Bez zdjęć w katalogu generuje syntetyczne (gradient + szum) w katalogu tymczasowym.
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from PIL import Image  # noqa: E402
+
+import config  # noqa: E402
+from src.image_store import _STORE_FORMATS, _fit_size, _to_rgb, resize_image_for_storage, store_format  # noqa: E402
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def _legacy_jpeg(path: Path) -> tuple[bytes, str, int, int]:
+    """Dawna ścieżka: pełne dekodowanie, convert RGB, pełny LANCZOS, JPEG."""
+    img = _to_rgb(Image.open(path))
+    size = _fit_size(*img.size, config.IMAGE_STORE_MAX_PX)
+    if size != img.size:
+        img = img.resize(size, Image.Resampling.LANCZOS)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=config.IMAGE_STORE_QUALITY, optimize=True)
+    return buf.getvalue(), "image/jpeg", img.width, img.height
+
+
+def _synthetic_images(dest: Path, count: int, size: tuple[int, int] = (4000, 3000)) -> list[Path]:
+    """Zdjęcia „aparatowe”: gradienty + szum, JPEG q=92."""
+    paths = []
+    w, h = size
+    for i in range(count):
+        r = Image.linear_gradient("L").resize(size)
+        g = Image.linear_gradient("L").rotate(90 + 30 * i).resize(size)
+        b = Image.effect_noise(size, 40 + 5 * i)
+        path = dest / f"synthetic_{i:02d}_{w}x{h}.jpg"
+        Image.merge("RGB", (r, g, b)).save(path, format="JPEG", quality=92)
+        paths.append(path)
+    return paths
+
+
+def _bench(fn: Callable[[Path], tuple[bytes, str, int, int]], paths: list[Path], repeat: int) -> tuple[float, float]:
+    """(ms/zdjęcie – mediana z powtórzeń, bajty/zdjęcie – średnio)."""
+    runs = []
+    sizes: list[int] = []
+    for _ in range(repeat):
+        sizes = []
+        t0 = time.perf_counter()
+        for p in paths:
+            sizes.append(len(fn(p)[0]))
+        runs.append((time.perf_counter() - t0) * 1000 / len(paths))
+    return statistics.median(runs), sum(sizes) / len(sizes)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark resize_image_for_storage (ms i bajty na zdjęcie)")
+    parser.add_argument("--images", default=str(config.IMAGES_DIR), help="Katalog ze zdjęciami (rekurencyjnie)")
+    parser.add_argument("--limit", type=int, default=20, help="Max liczba zdjęć")
+    parser.add_argument("--repeat", type=int, default=3, help="Powtórzenia (mediana)")
+    parser.add_argument("--synthetic", type=int, default=0, help="Użyj N wygenerowanych zdjęć 4000x3000")
+    parser.add_argument("--formats", default=",".join(_STORE_FORMATS), help="Formaty, np. jpeg,webp,avif")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="image_store_bench_") as tmp:
+        paths: list[Path] = []
+        if not args.synthetic:
+            root = Path(args.images)
+            if root.exists():
+                paths = sorted(p for p in root.rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)[: args.limit]
+        if not paths:
+            paths = _synthetic_images(Path(tmp), args.synthetic or 8)
+            print(f"Zdjęcia syntetyczne: {len(paths)} x 4000x3000 JPEG")
+        else:
+            print(f"Zdjęcia: {len(paths)} z {args.images}")
+        print(f"IMAGE_STORE_MAX_PX={config.IMAGE_STORE_MAX_PX}, powtórzeń: {args.repeat}\n")
+
+        rows = [("jpeg (pełne dekodowanie)", _legacy_jpeg)]
+        for fmt in [f.strip().lower() for f in args.formats.split(",") if f.strip()]:
+            if store_format(fmt) != fmt:
+                print(f"{fmt}: brak kodeka w Pillow – pominięty")
+                continue
+            rows.append((fmt, lambda p, fmt=fmt: resize_image_for_storage(p, fmt=fmt)))
+
+        print(f"{'wariant':<26}{'ms/zdjęcie':>12}{'bajty/zdjęcie':>16}")
+        for name, fn in rows:
+            ms, size = _bench(fn, paths, max(1, args.repeat))
+            print(f"{name:<26}{ms:>12.1f}{size:>16,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+PhotoGenSeo – tryb wsadowy: wiele EAN-ów, wywołania Claude przez Message Batches API (ok. 0,5× ceny).
+
+Użycie:
+  python bulk.py eans.txt                      # jeden EAN w linii
+  python bulk.py eans.txt --state data/bulk/nightly.json
+  python bulk.py --state data/bulk/nightly.json  # wznowienie przerwanego pollera
+  python bulk.py eans.txt --local              # lokalny zamiennik endpointu batchy (zwykłe wywołania)
+"""
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+# dodaj root projektu do ścieżki
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import config
+from src.bulk import AnthropicBatchBackend, BulkRunner, LocalBatchBackend
+from src.pipeline import GENERATION_MODES
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="PhotoGenSeo: wiele EAN-ów → opisy, wywołania Claude przez Message Batches API"
+    )
+    parser.add_argument(
+        "eans_file",
+        nargs="?",
+        default=None,
+        help="Plik z EAN-ami (jeden w linii). Bez pliku – tylko wznowienie stanu z --state.",
+    )
+    parser.add_argument(
+        "--state",
+        type=Path,
+        default=config.DATA_DIR / "bulk" / "state.json",
+        help="Plik stanu (wznowienie po przerwaniu; domyślnie data/bulk/state.json)",
+    )
+    parser.add_argument(
+        "--poll",
+        type=float,
+        default=config.BULK_POLL_INTERVAL_S,
+        help="Odstęp odpytywania batchy w sekundach (domyślnie %s)" % config.BULK_POLL_INTERVAL_S,
+    )
+    parser.add_argument(
+        "--local",
+        action="store_true",
+        help="Lokalny zamiennik endpointu batchy (żądania wykonywane zwykłym messages.create).",
+    )
+    parser.add_argument(
+        "--min-images",
+        type=int,
+        default=config.MIN_IMAGES_TO_FETCH,
+        help="Min. liczba zdjęć do wyszukania (domyślnie %s)" % config.MIN_IMAGES_TO_FETCH,
+    )
+    parser.add_argument("--no-db", action="store_true", help="Nie zapisuj do bazy (Vercel Postgres).")
+    parser.add_argument(
+        "--fused-filter",
+        action="store_true",
+        default=None,
+        help="AI matching i ocena jakości w jednym wywołaniu Claude na batch.",
+    )
+    parser.add_argument(
+        "--generation-mode",
+        choices=GENERATION_MODES,
+        default=None,
+        help="two_step: analiza + osobna weryfikacja; single: jedno wywołanie (domyślnie %s)"
+        % config.GENERATION_MODE,
+    )
+    parser.add_argument(
+        "--refresh-lookup",
+        action="store_true",
+        help="Odpytaj EAN-DB / Open Food Facts na nowo (pomiń cache lookupu EAN i nadpisz wpis).",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Pomiń cache odpowiedzi Claude.",
+    )
+    args = parser.parse_args()
+
+    if args.no_cache:
+        config.CLAUDE_CACHE_ENABLED = False
+    if args.refresh_lookup:
+        config.EAN_CACHE_REFRESH = True
+    if not config.ANTHROPIC_API_KEY:
+        logger.error("Ustaw ANTHROPIC_API_KEY w .env")
+        sys.exit(1)
+    if not args.eans_file and not args.state.exists():
+        logger.error("Podaj plik z EAN-ami albo istniejący plik stanu (--state)")
+        sys.exit(1)
+
+    backend = (
+        LocalBatchBackend(args.state.parent / "local_batches") if args.local else AnthropicBatchBackend()
+    )
+    runner = BulkRunner(
+        args.state,
+        backend,
+        fused_filter=args.fused_filter,
+        generation_mode=args.generation_mode,
+        save_to_db=not args.no_db,
+        min_images=args.min_images,
+    )
+    if args.eans_file:
+        lines = Path(args.eans_file).read_text(encoding="utf-8").splitlines()
+        runner.add_eans(line.strip() for line in lines if line.strip() and not line.startswith("#"))
+
+    results = runner.run(poll_interval_s=args.poll)
+    failed = [r for r in results if r.get("error")]
+    usd = sum(r.get("claude_usage", {}).get("usd", 0) for r in results)
+    print("EAN-ów: %s, z błędem: %s, koszt Claude: ~%.4f USD" % (len(results), len(failed), usd))
+    for r in failed:
+        print("  %s: %s" % (r.get("ean"), r["error"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -21,25 +21,127 @@ MIN_IMAGES_TO_FETCH = 10
 MAX_IMAGES_TO_ANALYZE = 15
 CLAUDE_MODEL = "claude-sonnet-4-20250514"
 
+# Pobieranie zdjęć: globalny limit równoległości, limit na host, deadline całego etapu (s)
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "16"))
+DOWNLOAD_PER_HOST_LIMIT = int(os.getenv("DOWNLOAD_PER_HOST_LIMIT", "4"))
+DOWNLOAD_DEADLINE_S = float(os.getenv("DOWNLOAD_DEADLINE_S", "45"))
+
+# Wspólny cache pobranych zdjęć (adresowany treścią, LRU); IMAGE_CACHE_MAX_MB=0 wyłącza
+IMAGE_CACHE_DIR = Path(os.getenv("IMAGE_CACHE_DIR", str(DATA_DIR / "cache" / "images")))
+IMAGE_CACHE_MAX_MB = int(os.getenv("IMAGE_CACHE_MAX_MB", "2048"))
+
+# Preprocessing zdjęć po pobraniu: jedno dekodowanie na zdjęcie w puli procesów (warianty dla Claude
+# i bazy, dHash); IMAGE_PREPROCESS_WORKERS=0 → liczba rdzeni; IMAGE_PREPROCESS_PROCESSES=0 → w wątkach
+# (serverless: bez puli procesów – spawn importowałby ponownie moduł główny runtime’u)
+IMAGE_PREPROCESS_ENABLED = os.getenv("IMAGE_PREPROCESS_ENABLED", "1") != "0"
+IMAGE_PREPROCESS_WORKERS = int(os.getenv("IMAGE_PREPROCESS_WORKERS", "0"))
+IMAGE_PREPROCESS_PROCESSES = os.getenv("IMAGE_PREPROCESS_PROCESSES", "1") != "0"
+
+# Lokalna deduplikacja (perceptual hash) przed AI matchingiem; max odległość Hamminga dHash (64 bity)
+IMAGE_DEDUP_ENABLED = os.getenv("IMAGE_DEDUP_ENABLED", "1") != "0"
+IMAGE_DEDUP_MAX_DISTANCE = int(os.getenv("IMAGE_DEDUP_MAX_DISTANCE", "6"))
+
+# Równoległe batche Claude (matching, quality) – max liczba jednoczesnych wywołań
+CLAUDE_CONCURRENCY = int(os.getenv("CLAUDE_CONCURRENCY", "4"))
+# /api/batch_generate: ile produktów przetwarzanych naraz (wywołania Claude i tak dzielą CLAUDE_CONCURRENCY)
+BATCH_GENERATE_CONCURRENCY = int(os.getenv("BATCH_GENERATE_CONCURRENCY", "6"))
+# limit czasu jednego żądania /api/batch_generate (zapas do maxDuration 300 s w vercel.json)
+BATCH_GENERATE_DEADLINE_S = float(os.getenv("BATCH_GENERATE_DEADLINE_S", "270"))
+
 # AI matching produktów – minimalna pewność, że to ten sam produkt (0–1)
 PRODUCT_MATCH_MIN_CONFIDENCE = 0.75
 
+# Tryb strumieniowy: batch matchingu / jakości wysyłany, gdy uzbiera się pełny batch pobranych
+# zdjęć albo po STREAM_LINGER_S s od pierwszego zdjęcia w buforze (bez czekania na koniec pobierania)
+STREAMING_STAGES = os.getenv("STREAMING_STAGES", "0") == "1"
+STREAM_LINGER_S = float(os.getenv("STREAM_LINGER_S", "1.5"))
+
+# Tryb połączony: matching + ocena jakości w jednym wywołaniu Claude na batch (połowa uploadu obrazów)
+FUSED_FILTERING = os.getenv("FUSED_FILTERING", "0") == "1"
+
+# Generowanie opisu: "two_step" (analiza + weryfikacja) lub "single" (jedno wywołanie Claude)
+GENERATION_MODE = os.getenv("GENERATION_MODE", "two_step").strip()
+
 # Odrzucanie: min. score unikalności zdjęcia (0–1), poniżej = odrzuć
 IMAGE_UNIQUENESS_MIN_SCORE = 0.4
 
 # Źródła: odrzucaj strony o wiarygodności poniżej (0–1)
 SOURCE_TRUST_MIN_SCORE = 0.3
 
+# Trwały cache (SQLite) – odpowiedzi Claude; CLAUDE_CACHE_ENABLED=0 lub --no-cache = pomiń cache
+CACHE_DB_PATH = Path(os.getenv("CACHE_DB_PATH", str(DATA_DIR / "cache" / "cache.sqlite")))
+CLAUDE_CACHE_ENABLED = os.getenv("CLAUDE_CACHE_ENABLED", "1") != "0"
+CLAUDE_CACHE_TTL_S = int(os.getenv("CLAUDE_CACHE_TTL_S", str(30 * 24 * 3600)))
+CLAUDE_CACHE_MAX_ENTRIES = int(os.getenv("CLAUDE_CACHE_MAX_ENTRIES", "20000"))
+
+# Cache lookupu EAN (EAN-DB / Open Food Facts) w tym samym pliku SQLite; osobne TTL dla trafień i braków.
+# EAN_CACHE_REFRESH=1 lub --refresh-lookup = odpytaj źródła na nowo i nadpisz wpis
+EAN_CACHE_ENABLED = os.getenv("EAN_CACHE_ENABLED", "1") != "0"
+EAN_CACHE_REFRESH = os.getenv("EAN_CACHE_REFRESH", "0") == "1"
+EAN_CACHE_HIT_TTL_S = int(os.getenv("EAN_CACHE_HIT_TTL_S", str(30 * 24 * 3600)))
+EAN_CACHE_MISS_TTL_S = int(os.getenv("EAN_CACHE_MISS_TTL_S", str(24 * 3600)))
+EAN_CACHE_MAX_ENTRIES = int(os.getenv("EAN_CACHE_MAX_ENTRIES", "100000"))
+
+# Wyszukiwanie: dostawcy (SerpAPI obrazy / organic, DuckDuckGo) odpytywani równolegle; limit czasu na dostawcę
+SEARCH_PROVIDER_TIMEOUT_S = float(os.getenv("SEARCH_PROVIDER_TIMEOUT_S", "15"))
+
+# Cache wyników wyszukiwania (SerpAPI / DuckDuckGo, per zapytanie i strona) – oszczędza limit SerpAPI
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "1") != "0"
+SEARCH_CACHE_TTL_S = int(os.getenv("SEARCH_CACHE_TTL_S", str(3 * 24 * 3600)))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "20000"))
+# /api/search_more: max stron na dostawcę w jednym wywołaniu (gdy strony zawierają same znane URL-e)
+SEARCH_MORE_MAX_PAGES = int(os.getenv("SEARCH_MORE_MAX_PAGES", "3"))
+
 # Język wyników (opis, weryfikacja)
 OUTPUT_LANG = "pl"
 
 # Cennik Claude (szacowanie kosztów) – USD za 1M tokenów (Sonnet 4: input $3, output $15)
 CLAUDE_PRICE_INPUT_PER_MTOK = float(os.getenv("CLAUDE_PRICE_INPUT_PER_MTOK", "3.0"))
 CLAUDE_PRICE_OUTPUT_PER_MTOK = float(os.getenv("CLAUDE_PRICE_OUTPUT_PER_MTOK", "15.0"))
+# Prompt caching: zapis do cache = 1,25× cena wejścia, odczyt = 0,1×
+CLAUDE_PRICE_CACHE_WRITE_MULT = float(os.getenv("CLAUDE_PRICE_CACHE_WRITE_MULT", "1.25"))
+CLAUDE_PRICE_CACHE_READ_MULT = float(os.getenv("CLAUDE_PRICE_CACHE_READ_MULT", "0.1"))
+
+# Prompt caching Anthropic (system prompty + wspólny prefiks zdjęć analiza → weryfikacja)
+PROMPT_CACHING_ENABLED = os.getenv("PROMPT_CACHING_ENABLED", "1") != "0"
+
+# Tryb katalogu (main.py --eans-file): liczba EAN-ów przetwarzanych równolegle
+CATALOG_WORKERS = int(os.getenv("CATALOG_WORKERS", "4"))
+
+# Tryb wsadowy (bulk.py, Message Batches API): cena = 0,5× cennika; limity jednego batcha; odstęp odpytywania
+CLAUDE_BATCH_PRICE_MULT = float(os.getenv("CLAUDE_BATCH_PRICE_MULT", "0.5"))
+BULK_MAX_BATCH_REQUESTS = int(os.getenv("BULK_MAX_BATCH_REQUESTS", "10000"))
+BULK_MAX_BATCH_MB = float(os.getenv("BULK_MAX_BATCH_MB", "200"))
+BULK_POLL_INTERVAL_S = float(os.getenv("BULK_POLL_INTERVAL_S", "60"))
+# etapy bez Claude (lookup, wyszukiwanie, pobieranie) dla tylu EAN-ów naraz
+BULK_PREPARE_CONCURRENCY = int(os.getenv("BULK_PREPARE_CONCURRENCY", "4"))
+# zdjęcia przygotowane do wysyłki (pomniejszone, base64) trzymane w pamięci dla tylu EAN-ów w toku
+BULK_PAYLOAD_CACHE_EANS = int(os.getenv("BULK_PAYLOAD_CACHE_EANS", "500"))
 
 # Baza danych (Vercel Postgres / Neon – POSTGRES_URL lub DATABASE_URL)
 POSTGRES_URL = os.getenv("POSTGRES_URL", os.getenv("DATABASE_URL", "")).strip()
+# Pula połączeń (psycopg_pool): rozmiar, zamykanie bezczynnych, max czekania na wolne połączenie,
+# sprawdzenie połączenia przed wydaniem (Neon zrywa bezczynne)
+DB_POOL_ENABLED = os.getenv("DB_POOL_ENABLED", "1") != "0"
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "5"))
+DB_POOL_MAX_IDLE_S = float(os.getenv("DB_POOL_MAX_IDLE_S", "300"))
+DB_POOL_TIMEOUT_S = float(os.getenv("DB_POOL_TIMEOUT_S", "30"))
+DB_POOL_CHECK = os.getenv("DB_POOL_CHECK", "1") != "0"
 
 # Zapis zdjęć do bazy: tylko wykorzystane (po matching + quality), po pomniejszeniu
 IMAGE_STORE_MAX_PX = int(os.getenv("IMAGE_STORE_MAX_PX", "800"))  # max bok w px
 IMAGE_STORE_QUALITY = int(os.getenv("IMAGE_STORE_QUALITY", "85"))  # JPEG quality 1–100
+# format zapisu: jpeg | webp | avif (brak kodeka w Pillow → JPEG); jakość osobno dla każdego formatu
+IMAGE_STORE_FORMAT = os.getenv("IMAGE_STORE_FORMAT", "jpeg").strip().lower()
+IMAGE_STORE_WEBP_QUALITY = int(os.getenv("IMAGE_STORE_WEBP_QUALITY", "80"))  # 1–100
+IMAGE_STORE_AVIF_QUALITY = int(os.getenv("IMAGE_STORE_AVIF_QUALITY", "60"))  # 1–100
+
+# Ochrona przed „bombami dekompresyjnymi”: obrazy o większej liczbie pikseli nie są dekodowane
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", "64000000"))
+
+# Obrazy wysyłane do Claude: pomniejszenie przed base64 (Claude i tak skaluje powyżej ~1568 px / ~1,15 MP)
+CLAUDE_IMAGE_MAX_PX = int(os.getenv("CLAUDE_IMAGE_MAX_PX", "1568"))  # max dłuższy bok w px
+CLAUDE_IMAGE_MAX_MEGAPIXELS = float(os.getenv("CLAUDE_IMAGE_MAX_MEGAPIXELS", "1.15"))
+CLAUDE_IMAGE_MAX_BYTES = int(os.getenv("CLAUDE_IMAGE_MAX_BYTES", "1500000"))  # budżet na 1 obraz (przed base64)
+CLAUDE_IMAGE_QUALITY = int(os.getenv("CLAUDE_IMAGE_QUALITY", "85"))  # JPEG quality 1–100
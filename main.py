@@ -5,6 +5,7 @@ PhotoGenSeo – pipeline: EAN → zdjęcia (SerpAPI/DuckDuckGo) → AI matching
 Użycie:
   python main.py <EAN>
   python main.py 5901234123457
+  python main.py --eans-file katalog.txt --workers 8   # wiele EAN-ów (plik lub "-" = stdin)
 """
 import argparse
 import logging
@@ -15,7 +16,8 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).resolve().parent))
 
 import config
-from src.pipeline import run_pipeline
+from src.catalog_batch import read_eans, run_catalog
+from src.pipeline import GENERATION_MODES, run_pipeline
 
 logging.basicConfig(
     level=logging.INFO,
@@ -29,7 +31,24 @@ def main() -> None:
     parser = argparse.ArgumentParser(
         description="PhotoGenSeo: EAN → zdjęcia → opis SEO (SerpAPI, Claude, weryfikacja)"
     )
-    parser.add_argument("ean", help="Kod EAN produktu")
+    parser.add_argument("ean", nargs="?", default=None, help="Kod EAN produktu")
+    parser.add_argument(
+        "--eans-file",
+        default=None,
+        help="Tryb katalogu: plik z EAN-ami (jeden w linii; \"-\" = stdin) zamiast pojedynczego EAN.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=config.CATALOG_WORKERS,
+        help="Tryb katalogu: liczba EAN-ów przetwarzanych równolegle (domyślnie %s)" % config.CATALOG_WORKERS,
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=Path,
+        default=None,
+        help="Tryb katalogu: plik statusów EAN-ów do wznowienia (domyślnie data/output/<plik>.checkpoint.jsonl)",
+    )
     parser.add_argument(
         "--min-images",
         type=int,
@@ -51,11 +70,56 @@ def main() -> None:
         action="store_true",
         help="Nie zapisuj do bazy (Vercel Postgres).",
     )
+    parser.add_argument(
+        "--fused-filter",
+        action="store_true",
+        default=None,
+        help="AI matching i ocena jakości w jednym wywołaniu Claude na batch (mniej tokenów i round-tripów).",
+    )
+    parser.add_argument(
+        "--generation-mode",
+        choices=GENERATION_MODES,
+        default=None,
+        help="two_step: analiza + osobna weryfikacja; single: opis i weryfikacja w jednym wywołaniu "
+        "(domyślnie %s)" % config.GENERATION_MODE,
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        default=None,
+        help="Tryb strumieniowy: AI matching i ocena jakości startują, gdy tylko pobierze się batch zdjęć.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Wznów przerwany run: pomiń etapy, których wejścia się nie zmieniły (checkpoint w data/output/{EAN}/stages.json).",
+    )
+    parser.add_argument(
+        "--refresh-lookup",
+        action="store_true",
+        help="Odpytaj EAN-DB / Open Food Facts na nowo (pomiń cache lookupu EAN i nadpisz wpis).",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Pomiń cache odpowiedzi Claude (wymuś nowe wywołania; wynik nie jest zapisywany do cache).",
+    )
     args = parser.parse_args()
 
+    if args.no_cache:
+        config.CLAUDE_CACHE_ENABLED = False
+    if args.refresh_lookup:
+        config.EAN_CACHE_REFRESH = True
+
     if not args.estimate_only and not config.ANTHROPIC_API_KEY:
         logger.error("Ustaw ANTHROPIC_API_KEY w .env (nie potrzebny przy --estimate-only)")
         sys.exit(1)
+    if bool(args.ean) == bool(args.eans_file):
+        parser.error("podaj EAN albo --eans-file")
+
+    if args.eans_file:
+        run_catalog_cli(args)
+        return
 
     result = run_pipeline(
         args.ean,
@@ -63,6 +127,10 @@ def main() -> None:
         output_subdir=args.output_subdir,
         estimate_only=args.estimate_only,
         save_to_db=not args.no_db,
+        fused_filter=args.fused_filter,
+        generation_mode=args.generation_mode,
+        resume=args.resume,
+        streaming=args.streaming,
     )
     if result.get("error"):
         logger.error("Pipeline error: %s", result["error"])
@@ -83,5 +151,46 @@ def main() -> None:
         print("Zdjęć zapisanych do bazy (pomniejszone):", result["images_saved_to_db"])
 
 
+def run_catalog_cli(args: argparse.Namespace) -> None:
+    """Tryb katalogu: run_pipeline dla każdego EAN-u z pliku; błędy zbierane i raportowane na końcu."""
+    if args.output_subdir:
+        logger.error("--output-subdir nie działa z --eans-file (każdy EAN ma własny katalog)")
+        sys.exit(1)
+    if args.eans_file == "-":
+        eans = read_eans(sys.stdin)
+        checkpoint = args.checkpoint or config.OUTPUT_DIR / "stdin.checkpoint.jsonl"
+    else:
+        eans_path = Path(args.eans_file)
+        eans = read_eans(eans_path.read_text(encoding="utf-8").splitlines())
+        checkpoint = args.checkpoint or config.OUTPUT_DIR / f"{eans_path.stem}.checkpoint.jsonl"
+
+    summary = run_catalog(
+        eans,
+        checkpoint,
+        workers=args.workers,
+        min_images=args.min_images,
+        estimate_only=args.estimate_only,
+        save_to_db=not args.no_db,
+        fused_filter=args.fused_filter,
+        generation_mode=args.generation_mode,
+        resume=args.resume,
+        streaming=args.streaming,
+    )
+    print(
+        "EAN-ów: %s (pominięte z checkpointu: %s), gotowe: %s, z błędem: %s"
+        % (summary.total, summary.skipped, summary.done, len(summary.failed))
+    )
+    print(
+        "Czas: %.0fs, %.1f EAN/min, koszt Claude: ~%.4f USD"
+        % (summary.elapsed_s, summary.eans_per_min(), summary.usd)
+    )
+    print("Checkpoint:", checkpoint)
+    if summary.failed:
+        print("Błędy:")
+        for ean, error in summary.failed:
+            print("  %s: %s" % (ean, error))
+        sys.exit(2)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,612 @@
+"""
+Tryb wsadowy (nocne uzupełnianie katalogu): wywołania Claude wielu EAN-ów wysyłane jako
+Message Batches – cena ok. 0,5× cennika, przepustowość nie jest ograniczona CLAUDE_CONCURRENCY.
+
+Każdy EAN przechodzi te same etapy co run_pipeline: prepare_run (bez Claude) → matching → jakość
+(albo screening) → analiza → weryfikacja (albo describe) → finish_runs. Żądania bieżącego etapu
+wszystkich EAN-ów trafiają do wspólnych batchy; gdy wyniki etapu danego EAN-u są kompletne,
+EAN przechodzi do następnego etapu (kolejne żądania idą w następnym batchu).
+
+Stan (etapy, żądania, identyfikatory batchy, odpowiedzi) w pliku JSON, zapisywanym po każdej
+zmianie – w tym zaraz po wysłaniu batcha – więc przerwany poller wznawia pracę od miejsca przerwania.
+Odpowiedzi czytane z i zapisywane do trwałego cache odpowiedzi (src.response_cache).
+Zdjęcia przygotowane do wysyłki (pomniejszone, base64) trzymane w rejestrze EAN-u (image_payload_scope)
+między etapami – dla najwyżej BULK_PAYLOAD_CACHE_EANS EAN-ów w toku; po wznowieniu tworzone od nowa.
+
+Backendy: AnthropicBatchBackend (client.messages.batches) oraz LocalBatchBackend – lokalny
+zamiennik endpointu (batche w plikach JSON, odpowiedzi z dowolnej funkcji) do testów i uruchomień bez API.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Iterable, Protocol
+
+import config
+from src.claude_client import (
+    ClaudeUsage,
+    ImagePayloadRegistry,
+    build_message_params,
+    get_client,
+    image_payload_scope,
+    lookup_cached_response,
+    message_cache_key,
+    run_with_claude,
+    store_cached_response,
+)
+from src import image_analyzer, image_screening, product_matching, quality_filter
+from src.description_verification import (
+    GENERATE_VERIFY_MAX_TOKENS,
+    VERIFY_MAX_TOKENS,
+    apply_generate_verify_response,
+    apply_verify_response,
+    generate_verify_prompts,
+    is_valid_verify_response,
+    verify_prompts,
+)
+from src.pipeline import (
+    PreparedRun,
+    finish_runs,
+    prepare_run_async,
+    record_matching,
+    record_quality,
+    resolve_generation_mode,
+)
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 1
+DONE = "done"
+
+_USAGE_FIELDS = (
+    "input_tokens",
+    "output_tokens",
+    "cache_creation_input_tokens",
+    "cache_read_input_tokens",
+)
+
+
+def _usage_dict(usage: Any | None) -> dict[str, int] | None:
+    if usage is None:
+        return None
+    return {f: getattr(usage, f, 0) or 0 for f in _USAGE_FIELDS}
+
+
+def _message_result(msg: Any) -> dict[str, Any]:
+    """Wynik żądania w formacie pliku stanu: text, usage, error."""
+    return {
+        "text": msg.content[0].text if msg.content else "",
+        "usage": _usage_dict(getattr(msg, "usage", None)),
+        "error": None,
+    }
+
+
+class BatchBackend(Protocol):
+    """Endpoint batchy: wysłanie listy żądań {custom_id, params}, odpytanie, odczyt wyników."""
+
+    def submit(self, requests: list[dict[str, Any]]) -> str: ...
+
+    def is_done(self, batch_id: str) -> bool: ...
+
+    def results(self, batch_id: str) -> dict[str, dict[str, Any]]: ...
+
+
+class AnthropicBatchBackend:
+    """Message Batches API (client.messages.batches)."""
+
+    def __init__(self, client: Any | None = None) -> None:
+        self.client = client or get_client()
+
+    def submit(self, requests: list[dict[str, Any]]) -> str:
+        batch = self.client.messages.batches.create(requests=requests)
+        return batch.id
+
+    def is_done(self, batch_id: str) -> bool:
+        batch = self.client.messages.batches.retrieve(batch_id)
+        return batch.processing_status == "ended"
+
+    def results(self, batch_id: str) -> dict[str, dict[str, Any]]:
+        out: dict[str, dict[str, Any]] = {}
+        for entry in self.client.messages.batches.results(batch_id):
+            res = entry.result
+            if res.type == "succeeded":
+                out[entry.custom_id] = _message_result(res.message)
+            else:
+                # errored / canceled / expired – etap użyje fallbacku jak przy błędzie API
+                error = getattr(res, "error", None)
+                out[entry.custom_id] = {"text": None, "usage": None, "error": str(error or res.type)}
+        return out
+
+
+def _default_responder(params: dict[str, Any]) -> dict[str, Any]:
+    return _message_result(get_client().messages.create(**params))
+
+
+class LocalBatchBackend:
+    """
+    Lokalny zamiennik endpointu batchy: batch zapisywany jako plik JSON w root,
+    przetwarzany (responder dla każdego żądania) przy pierwszym is_done po pending_polls odpytaniach.
+    responder(params) → {"text", "usage", "error"}; domyślnie zwykłe messages.create.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        responder: Callable[[dict[str, Any]], dict[str, Any]] | None = None,
+        pending_polls: int = 0,
+    ) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.responder = responder or _default_responder
+        self.pending_polls = pending_polls
+
+    def _path(self, batch_id: str, kind: str) -> Path:
+        return self.root / f"{batch_id}.{kind}.json"
+
+    def submit(self, requests: list[dict[str, Any]]) -> str:
+        batch_id = f"localbatch_{uuid.uuid4().hex[:16]}"
+        _write_json(self._path(batch_id, "requests"), {"requests": requests, "polls": 0})
+        return batch_id
+
+    def is_done(self, batch_id: str) -> bool:
+        if self._path(batch_id, "results").exists():
+            return True
+        path = self._path(batch_id, "requests")
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if data["polls"] < self.pending_polls:
+            data["polls"] += 1
+            _write_json(path, data)
+            return False
+        results: dict[str, dict[str, Any]] = {}
+        for req in data["requests"]:
+            try:
+                results[req["custom_id"]] = self.responder(req["params"])
+            except Exception as e:
+                results[req["custom_id"]] = {"text": None, "usage": None, "error": str(e)}
+        _write_json(self._path(batch_id, "results"), results)
+        path.unlink(missing_ok=True)
+        return True
+
+    def results(self, batch_id: str) -> dict[str, dict[str, Any]]:
+        return json.loads(self._path(batch_id, "results").read_text(encoding="utf-8"))
+
+
+def _write_json(path: Path, data: Any) -> None:
+    """Zapis atomowy (plik tymczasowy + rename) – przerwanie nie zostawia uszkodzonego stanu."""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def stage_sequence(fused_filter: bool, generation_mode: str) -> tuple[str, ...]:
+    filters = ("screening",) if fused_filter else ("matching", "quality")
+    describe = ("describe",) if generation_mode == "single" else ("analyze", "verify")
+    return filters + describe + (DONE,)
+
+
+def _batches(paths: list[Path], size: int) -> list[list[Path]]:
+    return [paths[start : start + size] for start in range(0, len(paths), size)]
+
+
+def _stage_calls(item: dict[str, Any], stage: str) -> list[tuple[str, str, list[Path], int, bool]]:
+    """Wywołania etapu dla EAN-u: (system, user, zdjęcia, max_tokens, share_image_prefix)."""
+    prep = item["prep"]
+    name, ean = prep["product_name"], prep["product_ean"]
+    paths = [Path(p) for p in prep["paths"]]
+    keep = [Path(p) for p in item.get("keep", [])][: config.MAX_IMAGES_TO_ANALYZE]
+    if stage == "matching":
+        user = product_matching.matching_user_text(name, ean)
+        return [
+            (product_matching.SYSTEM_MATCHING, user, b, product_matching.MAX_TOKENS, False)
+            for b in _batches(paths, product_matching.BATCH_SIZE)
+        ]
+    if stage == "quality":
+        user = quality_filter.quality_user_text(name, prep["source_domains"])
+        matched = [Path(p) for p in item["matched"]]
+        return [
+            (quality_filter.SYSTEM_QUALITY, user, b, quality_filter.MAX_TOKENS, False)
+            for b in _batches(matched, quality_filter.BATCH_SIZE)
+        ]
+    if stage == "screening":
+        user = image_screening.screening_user_text(name, ean, prep["source_domains"])
+        return [
+            (image_screening.SYSTEM_SCREENING, user, b, image_screening.MAX_TOKENS, False)
+            for b in _batches(paths, image_screening.BATCH_SIZE)
+        ]
+    if stage == "analyze":
+        return [(
+            image_analyzer.SYSTEM_ANALYZE, image_analyzer.USER_ANALYZE, keep,
+            image_analyzer.MAX_TOKENS, True,
+        )]
+    if stage == "verify":
+        system, user = verify_prompts(name, item.get("base_description", ""), config.OUTPUT_LANG)
+        return [(system, user, keep, VERIFY_MAX_TOKENS, True)]
+    if stage == "describe":
+        system, user = generate_verify_prompts(name, config.OUTPUT_LANG)
+        return [(system, user, keep, GENERATE_VERIFY_MAX_TOKENS, False)]
+    raise ValueError(f"Unknown bulk stage: {stage}")
+
+
+def _apply_stage(item: dict[str, Any], stage: str, responses: list[dict[str, Any]]) -> None:
+    """Wyniki etapu (w kolejności wywołań) → stan EAN-u, jak w run_pipeline."""
+    prep = item["prep"]
+    result = prep["result"]
+    paths = [Path(p) for p in prep["paths"]]
+    texts = [r.get("text") for r in responses]
+    calls = _stage_calls(item, stage)
+    warnings: list[str] = []
+
+    if stage in ("matching", "quality"):
+        apply = (
+            product_matching.apply_matching_response if stage == "matching"
+            else quality_filter.apply_quality_response
+        )
+        accepted: list[Path] = []
+        rejected: list[Path] = []
+        for (_, _, batch, _, _), text in zip(calls, texts):
+            acc, rej, _ = apply(batch, text)
+            accepted.extend(acc)
+            rejected.extend(rej)
+        if stage == "matching":
+            item["matched"] = [str(p) for p in record_matching(result, paths, accepted, rejected)]
+        else:
+            matched = [Path(p) for p in item["matched"]]
+            item["keep"] = [str(p) for p in record_quality(result, matched, accepted, rejected)]
+    elif stage == "screening":
+        verdicts: list[tuple[bool, bool]] = []
+        for (_, _, batch, _, _), text in zip(calls, texts):
+            verdicts.extend(image_screening.apply_screening_response(batch, text)[0])
+        matched, rejected_match, keep, rejected_quality = image_screening.split_screening_verdicts(
+            paths, verdicts
+        )
+        matched = record_matching(result, paths, matched, rejected_match)
+        item["matched"] = [str(p) for p in matched]
+        item["keep"] = [str(p) for p in record_quality(result, matched, keep, rejected_quality)]
+    elif stage == "analyze":
+        item["base_description"] = texts[0] or ""
+        result["base_description"] = item["base_description"]
+    elif stage == "verify":
+        result["verified"] = apply_verify_response(
+            texts[0], item.get("base_description", ""), error=responses[0].get("error"),
+            warnings=warnings,
+        )
+    elif stage == "describe":
+        base_desc, verified = apply_generate_verify_response(
+            texts[0], error=responses[0].get("error"), warnings=warnings
+        )
+        item["base_description"] = base_desc
+        result["base_description"] = base_desc
+        result["verified"] = verified
+    if warnings:
+        result.setdefault("warnings", []).extend(warnings)
+
+
+# etapy z walidacją odpowiedzi przed zapisem do / odczytem z cache odpowiedzi (jak cacheable w claude_client)
+_CACHEABLE = {"verify": is_valid_verify_response, "describe": is_valid_verify_response}
+
+
+def _cacheable(stage: str, text: str) -> bool:
+    check = _CACHEABLE.get(stage)
+    return check is None or check(text)
+
+
+def _custom_id(idx: int, stage: str, n: int) -> str:
+    # Message Batches: ^[a-zA-Z0-9_-]{1,64}$
+    return f"e{idx}-{stage}-{n}"
+
+
+def _item_index(custom_id: str) -> int:
+    return int(custom_id.split("-", 1)[0][1:])
+
+
+class BulkRunner:
+    """
+    Sterownik trybu wsadowego. Stan w state_path (JSON); opcje zapisane przy pierwszym uruchomieniu
+    obowiązują przy wznowieniu.
+
+        runner = BulkRunner(state_path, AnthropicBatchBackend())
+        runner.add_eans(eans)
+        runner.run()
+    """
+
+    def __init__(
+        self,
+        state_path: Path,
+        backend: BatchBackend,
+        *,
+        fused_filter: bool | None = None,
+        generation_mode: str | None = None,
+        save_to_db: bool = True,
+        min_images: int | None = None,
+    ) -> None:
+        self.state_path = Path(state_path)
+        self.backend = backend
+        if self.state_path.exists():
+            self.state = json.loads(self.state_path.read_text(encoding="utf-8"))
+            logger.info(
+                "Bulk: resuming %s (%s EANs, %s active batches)",
+                self.state_path, len(self.state["items"]), len(self.state["batches"]),
+            )
+        else:
+            self.state = {
+                "version": STATE_VERSION,
+                "options": {
+                    "fused_filter": config.FUSED_FILTERING if fused_filter is None else fused_filter,
+                    "generation_mode": resolve_generation_mode(generation_mode),
+                    "save_to_db": save_to_db,
+                    "min_images": min_images,
+                },
+                "items": [],
+                "batches": {},
+            }
+        opts = self.state["options"]
+        self.stages = stage_sequence(opts["fused_filter"], opts["generation_mode"])
+        # żądania zbudowane, jeszcze nie wysłane: (custom_id, params, rozmiar JSON w bajtach)
+        self._outbox: list[tuple[str, dict[str, Any], int]] = []
+        self._outbox_bytes = 0
+        # EAN-y zakończone w bieżącym kroku – zapis do bazy jednym wywołaniem (finish_runs)
+        self._finished: list[tuple[dict[str, Any], PreparedRun, list[Path]]] = []
+        # EAN → zdjęcia przygotowane do wysyłki (wspólne dla wszystkich etapów EAN-u)
+        self._payloads: OrderedDict[str, ImagePayloadRegistry] = OrderedDict()
+
+    # --- stan ---
+
+    def save(self) -> None:
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        _write_json(self.state_path, self.state)
+
+    @property
+    def items(self) -> list[dict[str, Any]]:
+        return self.state["items"]
+
+    def add_eans(self, eans: Iterable[str]) -> None:
+        """
+        Etapy bez Claude (lookup, wyszukiwanie, pobieranie, deduplikacja) dla nowych EAN-ów –
+        BULK_PREPARE_CONCURRENCY naraz; EAN-y dopisywane do stanu w kolejności wejścia.
+        """
+        known = {item["ean"] for item in self.items}
+        new: list[str] = []
+        for ean in eans:
+            ean = str(ean).strip()
+            if ean and ean not in known:
+                known.add(ean)
+                new.append(ean)
+        if new:
+            run_with_claude(self._prepare_all(new))
+
+    async def _prepare_all(self, eans: list[str]) -> None:
+        opts = self.state["options"]
+        limit = asyncio.Semaphore(max(1, config.BULK_PREPARE_CONCURRENCY))
+
+        async def prepare(i: int, ean: str) -> tuple[int, PreparedRun]:
+            async with limit:
+                # warianty dla Claude z preprocessingu trafiają od razu do rejestru EAN-u
+                with image_payload_scope(self._payload_registry(ean)):
+                    try:
+                        prep = await prepare_run_async(
+                            ean,
+                            min_images=opts["min_images"],
+                            save_to_db=opts["save_to_db"],
+                            fused_filter=opts["fused_filter"],
+                            generation_mode=opts["generation_mode"],
+                        )
+                        await prep.wait_for_run_id()
+                    except Exception as e:
+                        logger.warning("Bulk: prepare failed for EAN %s: %s", ean, e)
+                        prep = PreparedRun(result={"error": str(e), "ean": ean}, finished=True)
+            return i, prep
+
+        ready: dict[int, PreparedRun] = {}
+        added = 0
+        for next_done in asyncio.as_completed([prepare(i, ean) for i, ean in enumerate(eans)]):
+            i, prep = await next_done
+            ready[i] = prep
+            # stan zapisywany po każdym EAN-ie, który domyka ciągły prefiks wejścia
+            while added in ready:
+                prep = ready.pop(added)
+                if prep.finished:
+                    self._payloads.pop(eans[added], None)
+                self.items.append({
+                    "ean": eans[added],
+                    "stage": DONE if prep.finished else None,
+                    "prep": prep.to_dict(),
+                    "requests": {},
+                    "usage": {},
+                })
+                self.save()
+                added += 1
+
+    def _payload_registry(self, ean: str) -> ImagePayloadRegistry:
+        """Rejestr zdjęć EAN-u; najdawniej używane rejestry ponad BULK_PAYLOAD_CACHE_EANS są zwalniane."""
+        registry = self._payloads.get(ean)
+        if registry is None:
+            registry = self._payloads[ean] = ImagePayloadRegistry()
+        self._payloads.move_to_end(ean)
+        while len(self._payloads) > max(1, config.BULK_PAYLOAD_CACHE_EANS):
+            _, evicted = self._payloads.popitem(last=False)
+            evicted.clear()
+        return registry
+
+    def pending_count(self) -> int:
+        return sum(1 for item in self.items if item["stage"] != DONE)
+
+    # --- przebieg ---
+
+    def run(self, poll_interval_s: float | None = None) -> list[dict[str, Any]]:
+        """Powtarza step() do zakończenia wszystkich EAN-ów; zwraca wyniki (jak run_pipeline)."""
+        poll = config.BULK_POLL_INTERVAL_S if poll_interval_s is None else poll_interval_s
+        while not self.step():
+            logger.info(
+                "Bulk: %s EANs in progress, %s active batches; next poll in %ss",
+                self.pending_count(), len(self.state["batches"]), poll,
+            )
+            time.sleep(poll)
+        return [item["prep"]["result"] for item in self.items]
+
+    def step(self) -> bool:
+        """Odbiór zakończonych batchy → kolejne etapy → wysyłka nowych żądań. True gdy wszystko gotowe."""
+        self._collect_results()
+        self._queue_unsent()
+        for idx, item in enumerate(self.items):
+            if item["stage"] != DONE:
+                self._advance(idx, item)
+        self._finish_all()
+        self._flush()
+        self.save()
+        return self.pending_count() == 0
+
+    def _collect_results(self) -> None:
+        for batch_id in list(self.state["batches"]):
+            try:
+                if not self.backend.is_done(batch_id):
+                    continue
+                results = self.backend.results(batch_id)
+            except Exception as e:
+                logger.warning("Bulk: cannot poll batch %s: %s", batch_id, e)
+                continue
+            custom_ids = self.state["batches"].pop(batch_id)
+            for cid in custom_ids:
+                res = results.get(cid) or {"text": None, "usage": None, "error": "missing in batch results"}
+                item = self.items[_item_index(cid)]
+                req = item["requests"].get(cid)
+                if req is None:
+                    continue
+                req["response"] = res
+                self._record_usage(item, res.get("usage"))
+                if res.get("text") and req.get("cache_key") and _cacheable(item["stage"], res["text"]):
+                    store_cached_response(req["cache_key"], res["text"])
+            logger.info("Bulk: batch %s finished (%s requests)", batch_id, len(custom_ids))
+            self.save()
+
+    def _queue_unsent(self) -> None:
+        """Po wznowieniu: żądania zapisane w stanie, ale niewysłane (przerwanie przed submit)."""
+        queued = {cid for cid, _, _ in self._outbox}
+        for idx, item in enumerate(self.items):
+            if item["stage"] in (None, DONE):
+                continue
+            calls = None
+            for cid, req in item["requests"].items():
+                if req["batch_id"] is None and req["response"] is None and cid not in queued:
+                    calls = calls or _stage_calls(item, item["stage"])
+                    params, _ = self._params(item, calls[req["n"]])
+                    self._enqueue(cid, params)
+
+    def _advance(self, idx: int, item: dict[str, Any]) -> None:
+        """Przesuwa EAN przez etapy, dopóki wyniki bieżącego etapu są kompletne (np. z cache)."""
+        while True:
+            stage = item["stage"]
+            if stage is not None:
+                reqs = sorted(item["requests"].values(), key=lambda r: r["n"])
+                if any(r["response"] is None for r in reqs):
+                    return
+                _apply_stage(item, stage, [r["response"] for r in reqs])
+            next_stage = self.stages[0] if stage is None else self.stages[self.stages.index(stage) + 1]
+            if next_stage == DONE:
+                # DONE dopiero po zapisie wyniku (_finish_all): stan zapisany wcześniej (np. w _flush)
+                # zostawia EAN na ostatnim etapie z odpowiedziami – wznowienie ponowi zakończenie
+                self._finish(item)
+                return
+            item["stage"] = next_stage
+            item["requests"] = {}
+            for n, call in enumerate(_stage_calls(item, next_stage)):
+                cid = _custom_id(idx, next_stage, n)
+                params, cache_key = self._params(item, call)
+                cached = lookup_cached_response(cache_key) if cache_key else None
+                if cached is not None and not _cacheable(next_stage, cached):
+                    cached = None
+                item["requests"][cid] = {
+                    "n": n,
+                    "batch_id": None,
+                    "cache_key": cache_key,
+                    "response": None if cached is None else {"text": cached, "usage": None, "error": None},
+                }
+                if cached is not None:
+                    item["usage"]["cache_hits"] = item["usage"].get("cache_hits", 0) + 1
+                else:
+                    self._enqueue(cid, params)
+
+    def _params(
+        self,
+        item: dict[str, Any],
+        call: tuple[str, str, list[Path], int, bool],
+    ) -> tuple[dict[str, Any], str]:
+        system, user, paths, max_tokens, share_prefix = call
+        # każde zdjęcie EAN-u czytane i kodowane raz dla wszystkich jego etapów
+        with image_payload_scope(self._payload_registry(item["ean"])):
+            params, image_keys = build_message_params(
+                system, user, paths, max_tokens, share_image_prefix=share_prefix
+            )
+        return params, message_cache_key(system, user, max_tokens, image_keys)
+
+    def _enqueue(self, cid: str, params: dict[str, Any]) -> None:
+        size = len(json.dumps(params))
+        limit_bytes = config.BULK_MAX_BATCH_MB * 1024 * 1024
+        if self._outbox and (
+            len(self._outbox) >= config.BULK_MAX_BATCH_REQUESTS
+            or self._outbox_bytes + size > limit_bytes
+        ):
+            self._flush()
+        self._outbox.append((cid, params, size))
+        self._outbox_bytes += size
+
+    def _flush(self) -> None:
+        if not self._outbox:
+            return
+        requests = [{"custom_id": cid, "params": params} for cid, params, _ in self._outbox]
+        batch_id = self.backend.submit(requests)
+        custom_ids = [cid for cid, _, _ in self._outbox]
+        self.state["batches"][batch_id] = custom_ids
+        for cid in custom_ids:
+            self.items[_item_index(cid)]["requests"][cid]["batch_id"] = batch_id
+        # identyfikator batcha trwale zapisany zanim wyślemy kolejny
+        self.save()
+        logger.info(
+            "Bulk: submitted batch %s (%s requests, %.1f MB)",
+            batch_id, len(custom_ids), self._outbox_bytes / 1024 / 1024,
+        )
+        self._outbox = []
+        self._outbox_bytes = 0
+
+    def _record_usage(self, item: dict[str, Any], usage: dict[str, int] | None) -> None:
+        counters = item["usage"]
+        counters["requests"] = counters.get("requests", 0) + 1
+        for f in _USAGE_FIELDS:
+            counters[f] = counters.get(f, 0) + ((usage or {}).get(f, 0) or 0)
+
+    def _finish(self, item: dict[str, Any]) -> None:
+        prep = PreparedRun.from_dict(item["prep"])
+        counters = item["usage"]
+        usage = ClaudeUsage(
+            requests=counters.get("requests", 0),
+            cache_hits=counters.get("cache_hits", 0),
+            input_tokens=counters.get("input_tokens", 0),
+            output_tokens=counters.get("output_tokens", 0),
+            cache_write_input_tokens=counters.get("cache_creation_input_tokens", 0),
+            cache_read_input_tokens=counters.get("cache_read_input_tokens", 0),
+            price_multiplier=config.CLAUDE_BATCH_PRICE_MULT,
+        )
+        prep.result["claude_usage"] = usage.to_dict()
+        prep.result["bulk"] = True
+        keep = [Path(p) for p in item.get("keep", [])]
+        self._finished.append((item, prep, keep))
+
+    def _finish_all(self) -> None:
+        """Zapis wyników EAN-ów zakończonych w tym kroku (jeden upsert runów + COPY zdjęć)."""
+        if not self._finished:
+            return
+        finished, self._finished = self._finished, []
+        finish_runs([(prep, keep) for _, prep, keep in finished], save_to_db=self.state["options"]["save_to_db"])
+        for item, prep, _ in finished:
+            registry = self._payloads.pop(item["ean"], None)
+            if registry is not None:
+                registry.clear()
+            item["prep"] = prep.to_dict()
+            item["stage"] = DONE
+            item["requests"] = {}
+            logger.info("Bulk: EAN %s done", item["ean"])
@@ -0,0 +1,124 @@
+"""
+Trwały cache klucz → wartość (JSON) w SQLite, z TTL i limitem liczby wpisów (LRU).
+
+Jeden plik bazy (config.CACHE_DB_PATH) współdzielony przez różne przestrzenie nazw
+(np. odpowiedzi Claude). Każda operacja otwiera własne połączenie – bezpieczne dla wątków
+i wielu procesów (WAL).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteCache:
+    """Cache w jednej przestrzeni nazw: get/set z TTL, eviction najdawniej używanych powyżej max_entries."""
+
+    def __init__(self, namespace: str, max_entries: int, path: Path | None = None) -> None:
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.path = Path(path or config.CACHE_DB_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(namespace, accessed_at)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:  # commit / rollback
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Any | None:
+        """Wartość dla klucza albo None (brak / wygasły wpis)."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            if row is not None and row[1] is not None and row[1] < now:
+                conn.execute(
+                    "DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key)
+                )
+                row = None
+            if row is not None:
+                conn.execute(
+                    "UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                    (now, self.namespace, key),
+                )
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return json.loads(row[0]) if row is not None else None
+
+    def set(self, key: str, value: Any, ttl_s: float | None = None) -> None:
+        """Zapisuje wartość (JSON); ttl_s=None – bez wygasania. Usuwa nadmiarowe wpisy (LRU)."""
+        now = time.time()
+        expires = now + ttl_s if ttl_s else None
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO cache (namespace, key, value, created_at, expires_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (self.namespace, key, json.dumps(value, ensure_ascii=False), now, expires, now),
+            )
+            (count,) = conn.execute(
+                "SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)
+            ).fetchone()
+            if count > self.max_entries:
+                conn.execute(
+                    """
+                    DELETE FROM cache WHERE rowid IN (
+                        SELECT rowid FROM cache WHERE namespace = ?
+                        ORDER BY (expires_at IS NOT NULL AND expires_at < ?) DESC, accessed_at ASC
+                        LIMIT ?
+                    )
+                    """,
+                    (self.namespace, now, count - self.max_entries),
+                )
+
+    def delete(self, key: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key)
+            )
+
+    def stats(self) -> dict[str, Any]:
+        with self._connect() as conn:
+            (count,) = conn.execute(
+                "SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)
+            ).fetchone()
+        return {"entries": count, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,154 @@
+"""
+Przetwarzanie katalogu: run_pipeline_async dla wielu EAN-ów w jednej pętli zdarzeń
+(workers EAN-ów naraz) – jeden klient Claude i wspólny limit CLAUDE_CONCURRENCY dla całego katalogu.
+
+Status każdego EAN-u dopisywany do pliku checkpoint (JSON Lines, jedna linia na zakończony EAN,
+zapis od razu po zakończeniu, z trybem runu: "full" albo "estimate") – przerwany run wznowiony
+z tym samym plikiem pomija EAN-y ze statusem "done" (EAN-y z błędem są ponawiane). Sam kosztorys
+(estimate_only) nie zalicza EAN-u pełnemu przebiegowi. Błąd jednego EAN-u nie przerywa przebiegu.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterable
+
+from src.claude_client import run_with_claude
+from src.pipeline import run_pipeline_async
+
+logger = logging.getLogger(__name__)
+
+
+def read_eans(lines: Iterable[str]) -> list[str]:
+    """EAN-y z linii pliku (puste i zaczynające się od # pomijane), bez powtórzeń, w kolejności."""
+    seen: set[str] = set()
+    eans: list[str] = []
+    for line in lines:
+        ean = line.strip()
+        if not ean or ean.startswith("#") or ean in seen:
+            continue
+        seen.add(ean)
+        eans.append(ean)
+    return eans
+
+
+def load_checkpoint(path: Path) -> dict[str, dict[str, Any]]:
+    """EAN → ostatni zapisany status (uszkodzona ostatnia linia po przerwaniu jest pomijana)."""
+    status: dict[str, dict[str, Any]] = {}
+    if not path.exists():
+        return status
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            status[entry["ean"]] = entry
+    return status
+
+
+def run_mode(estimate_only: bool = False) -> str:
+    """Tryb runu zapisywany w checkpoint: "estimate" (sam kosztorys) albo "full"."""
+    return "estimate" if estimate_only else "full"
+
+
+def is_done(entry: dict[str, Any] | None, mode: str) -> bool:
+    """
+    Czy EAN z checkpointu można pominąć w runie w trybie mode: pełny przebieg zalicza oba tryby,
+    kosztorys – tylko kolejny kosztorys. Wpisy bez trybu (starsze checkpointy) – jak pełny przebieg.
+    """
+    if not entry or entry.get("status") != "done":
+        return False
+    return entry.get("mode", "full") in ("full", mode)
+
+
+@dataclass
+class CatalogSummary:
+    total: int = 0
+    skipped: int = 0
+    done: int = 0
+    failed: list[tuple[str, str]] = field(default_factory=list)
+    usd: float = 0.0
+    elapsed_s: float = 0.0
+
+    def eans_per_min(self) -> float:
+        processed = self.done + len(self.failed)
+        return processed / self.elapsed_s * 60 if self.elapsed_s > 0 else 0.0
+
+
+def run_catalog(
+    eans: list[str],
+    checkpoint_path: Path,
+    *,
+    workers: int = 4,
+    **pipeline_kwargs: Any,
+) -> CatalogSummary:
+    """Jak run_catalog_async, poza pętlą zdarzeń (run_with_claude)."""
+    return run_with_claude(run_catalog_async(eans, checkpoint_path, workers=workers, **pipeline_kwargs))
+
+
+async def run_catalog_async(
+    eans: list[str],
+    checkpoint_path: Path,
+    *,
+    workers: int = 4,
+    **pipeline_kwargs: Any,
+) -> CatalogSummary:
+    """
+    run_pipeline_async(ean, **pipeline_kwargs) dla każdego EAN-u (najwyżej workers naraz, jedna pętla).
+    Postęp (EAN/min, wydane USD) logowany po każdym EAN-ie; zwraca podsumowanie z listą błędów.
+    """
+    checkpoint_path = Path(checkpoint_path)
+    checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+    mode = run_mode(pipeline_kwargs.get("estimate_only", False))
+    previous = load_checkpoint(checkpoint_path)
+    todo = [e for e in eans if not is_done(previous.get(e), mode)]
+    summary = CatalogSummary(total=len(eans), skipped=len(eans) - len(todo))
+    if summary.skipped:
+        logger.info("Checkpoint %s: %s EANs already done, %s to go", checkpoint_path, summary.skipped, len(todo))
+
+    limit = asyncio.Semaphore(max(1, workers))
+    started = time.monotonic()
+
+    async def process(ean: str) -> dict[str, Any]:
+        async with limit:
+            t0 = time.monotonic()
+            try:
+                result = await run_pipeline_async(ean, **pipeline_kwargs)
+                error = result.get("error")
+            except Exception as e:
+                logger.exception("EAN %s failed", ean)
+                result, error = {}, f"{type(e).__name__}: {e}"
+            return {
+                "ean": ean,
+                "status": "error" if error else "done",
+                "mode": mode,
+                "error": error,
+                "usd": (result.get("claude_usage") or {}).get("usd", 0.0),
+                "output_dir": result.get("output_dir"),
+                "duration_s": round(time.monotonic() - t0, 2),
+                "finished_at": time.time(),
+            }
+
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        for next_done in asyncio.as_completed([process(ean) for ean in todo]):
+            entry = await next_done
+            checkpoint.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            checkpoint.flush()
+            if entry["status"] == "done":
+                summary.done += 1
+            else:
+                summary.failed.append((entry["ean"], entry["error"]))
+            summary.usd += entry["usd"] or 0.0
+            summary.elapsed_s = time.monotonic() - started
+            logger.info(
+                "[%s/%s] EAN %s %s (%.1fs) – %.1f EAN/min, %.4f USD spent",
+                summary.done + len(summary.failed), len(todo), entry["ean"],
+                entry["status"], entry["duration_s"], summary.eans_per_min(), summary.usd,
+            )
+    summary.elapsed_s = time.monotonic() - started
+    return summary
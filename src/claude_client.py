@@ -1,19 +1,39 @@
 """
 Wspólny klient Anthropic (Claude) do wizji i tekstu.
-Pomocnicze: ładowanie obrazów do base64, budowa wiadomości z załącznikami.
+Pomocnicze: przygotowanie obrazów (pomniejszenie + base64), budowa wiadomości z załącznikami.
+W obrębie image_payload_scope() każdy obraz jest czytany i kodowany tylko raz na run.
+Odpowiedzi zapisywane w trwałym cache (src.response_cache); zużycie tokenów zliczane w usage_scope().
+Prompt caching (Anthropic): system prompt oznaczony jako cacheowalny; przy share_image_prefix
+zdjęcia idą na początek wiadomości (wspólny system + te same obrazy = wspólny prefiks), więc
+kolejne wywołanie z tymi samymi zdjęciami (analiza → weryfikacja) czyta prefiks z cache.
+Wywołania na asyncio (AsyncAnthropic): message_with_images_async, map_concurrent_async; wersje
+synchroniczne to nakładki run_with_claude (poza pętlą zdarzeń).
 """
 from __future__ import annotations
 
+import asyncio
 import base64
+import hashlib
 import logging
+import threading
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Any
+from typing import Any, Awaitable, Callable, Iterable, Iterator, TypeVar
 
 import anthropic
 import config
+from src.response_cache import get_response_cache, response_cache_key
+from src.image_downloader import SNIFF_BYTES, sniff_image_type
+from src.image_store import prepare_image_for_vision
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+R = TypeVar("R")
+
 
 def load_image_as_base64(path: Path) -> tuple[str, str] | None:
     """Zwraca (media_type, base64_string) lub None."""
@@ -30,22 +50,243 @@ def load_image_as_base64(path: Path) -> tuple[str, str] | None:
         media_type = "image/gif"
     try:
         data = path.read_bytes()
+        # rzeczywisty format z nagłówka pliku ma pierwszeństwo przed rozszerzeniem
+        media_type = sniff_image_type(data[:SNIFF_BYTES]) or media_type
         return media_type, base64.standard_b64encode(data).decode("ascii")
     except Exception as e:
         logger.debug("Cannot read image %s: %s", path, e)
         return None
 
 
-def build_image_content_block(path: Path) -> dict[str, Any] | None:
-    """Blok content dla API: source type image."""
-    out = load_image_as_base64(path)
-    if not out:
+@dataclass
+class ImagePayload:
+    """Obraz przygotowany do wysyłki: base64 po pomniejszeniu + faktycznie wysłane wymiary."""
+    media_type: str
+    data: str  # base64
+    width: int
+    height: int
+    size_bytes: int  # przed base64
+    sha256: str  # hash oryginalnego pliku
+
+    def content_block(self) -> dict[str, Any]:
+        return {
+            "type": "image",
+            "source": {"type": "base64", "media_type": self.media_type, "data": self.data},
+        }
+
+
+def _payload_from_bytes(raw: bytes, digest: str | None = None) -> ImagePayload:
+    data, media_type, width, height = prepare_image_for_vision(raw)
+    return ImagePayload(
+        media_type=media_type,
+        data=base64.standard_b64encode(data).decode("ascii"),
+        width=width,
+        height=height,
+        size_bytes=len(data),
+        sha256=digest or hashlib.sha256(raw).hexdigest(),
+    )
+
+
+def prepare_image_payload(path: Path) -> ImagePayload | None:
+    """Pomniejsza obraz do limitów CLAUDE_IMAGE_* i koduje base64. None przy błędzie."""
+    try:
+        return _payload_from_bytes(Path(path).read_bytes())
+    except Exception as e:
+        logger.debug("Cannot prepare image %s: %s", path, e)
         return None
-    media_type, data = out
-    return {
-        "type": "image",
-        "source": {"type": "base64", "media_type": media_type, "data": data},
-    }
+
+
+class ImagePayloadRegistry:
+    """
+    Obrazy przygotowane do wysyłki w obrębie jednego runu.
+
+    Klucz: sha256 zawartości pliku (ten sam obraz pod dwiema ścieżkami kodowany raz);
+    ścieżka → hash zapamiętany, więc plik czytany jest z dysku tylko przy pierwszym użyciu.
+    """
+
+    def __init__(self) -> None:
+        self._by_path: dict[str, str] = {}
+        self._by_hash: dict[str, ImagePayload] = {}
+        self._lock = threading.Lock()
+        self.prepared = 0
+        self.reused = 0
+
+    def get(self, path: Path) -> ImagePayload | None:
+        key = str(Path(path).resolve())
+        with self._lock:
+            digest = self._by_path.get(key)
+            if digest is not None and digest in self._by_hash:
+                self.reused += 1
+                return self._by_hash[digest]
+        try:
+            raw = Path(path).read_bytes()
+        except Exception as e:
+            logger.debug("Cannot read image %s: %s", path, e)
+            return None
+        digest = hashlib.sha256(raw).hexdigest()
+        with self._lock:
+            self._by_path[key] = digest
+            if digest in self._by_hash:
+                self.reused += 1
+                return self._by_hash[digest]
+        try:
+            payload = _payload_from_bytes(raw, digest)
+        except Exception as e:
+            logger.debug("Cannot prepare image %s: %s", path, e)
+            return None
+        with self._lock:
+            self._by_hash.setdefault(digest, payload)
+            self.prepared += 1
+        return payload
+
+    def put(self, path: Path, payload: ImagePayload) -> None:
+        """Obraz przygotowany poza rejestrem (etap preprocessingu) – kolejne get() bez czytania pliku."""
+        with self._lock:
+            self._by_path[str(Path(path).resolve())] = payload.sha256
+            if payload.sha256 not in self._by_hash:
+                self._by_hash[payload.sha256] = payload
+                self.prepared += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._by_path.clear()
+            self._by_hash.clear()
+
+
+_payloads: ContextVar[ImagePayloadRegistry | None] = ContextVar("image_payloads", default=None)
+
+
+@contextmanager
+def image_payload_scope(registry: ImagePayloadRegistry | None = None) -> Iterator[ImagePayloadRegistry]:
+    """
+    Zakres jednego runu: obrazy przygotowane raz są współdzielone przez wszystkie wywołania
+    message_with_images (matching, quality, analiza, weryfikacja). Pamięć zwalniana na wyjściu.
+    registry: rejestr żyjący dłużej niż blok (np. EAN w trybie wsadowym, src.bulk) – bez czyszczenia.
+    """
+    own = registry is None
+    if registry is None:
+        registry = ImagePayloadRegistry()
+    token = _payloads.set(registry)
+    try:
+        yield registry
+    finally:
+        _payloads.reset(token)
+        if own:
+            logger.debug("Image payloads: prepared %s, reused %s", registry.prepared, registry.reused)
+            registry.clear()
+
+
+def register_image_payload(
+    path: Path,
+    sha256: str,
+    data: bytes,
+    media_type: str,
+    width: int,
+    height: int,
+) -> None:
+    """
+    Wariant dla Claude policzony wcześniej (src.image_preprocess) – do rejestru bieżącego runu,
+    jeśli aktywny. sha256: hash oryginalnego pliku (klucz rejestru i cache odpowiedzi).
+    """
+    registry = _payloads.get()
+    if registry is None:
+        return
+    registry.put(path, ImagePayload(
+        media_type=media_type,
+        data=base64.standard_b64encode(data).decode("ascii"),
+        width=width,
+        height=height,
+        size_bytes=len(data),
+        sha256=sha256,
+    ))
+
+
+def get_image_payload(path: Path) -> ImagePayload | None:
+    """Obraz z rejestru bieżącego runu (jeśli aktywny) albo przygotowany jednorazowo."""
+    registry = _payloads.get()
+    if registry is not None:
+        return registry.get(path)
+    return prepare_image_payload(path)
+
+
+def build_image_content_block(path: Path) -> dict[str, Any] | None:
+    """Blok content dla API: source type image (obraz pomniejszony do limitów CLAUDE_IMAGE_*)."""
+    payload = get_image_payload(path)
+    return payload.content_block() if payload else None
+
+
+@dataclass
+class ClaudeUsage:
+    """
+    Zużycie w obrębie jednego runu: liczba wywołań, trafienia cache odpowiedzi, tokeny, koszt.
+    cache_write/read_input_tokens – tokeny zapisane / odczytane z prompt cache Anthropic.
+    price_multiplier – mnożnik cennika (Message Batches: config.CLAUDE_BATCH_PRICE_MULT).
+    """
+    requests: int = 0
+    cache_hits: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_write_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
+    price_multiplier: float = 1.0
+
+    def __post_init__(self) -> None:
+        self._lock = threading.Lock()
+
+    def record(self, usage: Any | None = None, cache_hit: bool = False) -> None:
+        with self._lock:
+            if cache_hit:
+                self.cache_hits += 1
+                return
+            self.requests += 1
+            if usage is not None:
+                self.input_tokens += getattr(usage, "input_tokens", 0) or 0
+                self.output_tokens += getattr(usage, "output_tokens", 0) or 0
+                self.cache_write_input_tokens += getattr(usage, "cache_creation_input_tokens", 0) or 0
+                self.cache_read_input_tokens += getattr(usage, "cache_read_input_tokens", 0) or 0
+
+    def usd(self) -> float:
+        price_in = config.CLAUDE_PRICE_INPUT_PER_MTOK
+        return round(
+            (
+                self.input_tokens / 1_000_000 * price_in
+                + self.cache_write_input_tokens / 1_000_000 * price_in * config.CLAUDE_PRICE_CACHE_WRITE_MULT
+                + self.cache_read_input_tokens / 1_000_000 * price_in * config.CLAUDE_PRICE_CACHE_READ_MULT
+                + self.output_tokens / 1_000_000 * config.CLAUDE_PRICE_OUTPUT_PER_MTOK
+            ) * self.price_multiplier,
+            4,
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "cache_hits": self.cache_hits,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cache_write_input_tokens": self.cache_write_input_tokens,
+            "cache_read_input_tokens": self.cache_read_input_tokens,
+            "usd": self.usd(),
+        }
+
+
+_usage: ContextVar[ClaudeUsage | None] = ContextVar("claude_usage", default=None)
+
+
+@contextmanager
+def usage_scope() -> Iterator[ClaudeUsage]:
+    """Zlicza wywołania Claude (i trafienia cache odpowiedzi) wykonane w obrębie bloku."""
+    usage = ClaudeUsage()
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+
+
+def _record_usage(usage: Any | None = None, cache_hit: bool = False) -> None:
+    current = _usage.get()
+    if current is not None:
+        current.record(usage, cache_hit=cache_hit)
 
 
 def get_client() -> anthropic.Anthropic:
@@ -54,26 +295,246 @@ def get_client() -> anthropic.Anthropic:
     return anthropic.Anthropic(api_key=config.ANTHROPIC_API_KEY)
 
 
-def message_with_images(
+# AsyncAnthropic (pula połączeń httpx) jest związany z pętlą zdarzeń – jeden klient na pętlę,
+# zamykany przed końcem pętli (run_with_claude / close_async_client)
+_async_clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, anthropic.AsyncAnthropic] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_async_client() -> anthropic.AsyncAnthropic:
+    if not config.ANTHROPIC_API_KEY:
+        raise ValueError("ANTHROPIC_API_KEY is not set")
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = anthropic.AsyncAnthropic(api_key=config.ANTHROPIC_API_KEY)
+    return client
+
+
+async def close_async_client() -> None:
+    """Zamyka klienta AsyncAnthropic bieżącej pętli (pula połączeń httpx), jeśli powstał."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+def run_with_claude(coro: Awaitable[R]) -> R:
+    """
+    asyncio.run(coro), a na końcu (także po błędzie) zamknięcie klienta AsyncAnthropic tej pętli –
+    kolejne asyncio.run (np. run_pipeline dla każdego EAN-u z katalogu) nie zostawiają otwartych pul.
+    """
+    async def main() -> R:
+        try:
+            return await coro
+        finally:
+            await close_async_client()
+
+    return asyncio.run(main())
+
+
+# Wspólny limit jednoczesnych wywołań Claude w pętli – wiele runów naraz (np. /api/batch_generate)
+# nie przekracza config.CLAUDE_CONCURRENCY w sumie
+_async_limits: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _async_limit() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    limit = _async_limits.get(loop)
+    if limit is None:
+        limit = _async_limits[loop] = asyncio.Semaphore(max(1, config.CLAUDE_CONCURRENCY))
+    return limit
+
+
+async def map_concurrent_async(
+    fn: Callable[[T], Awaitable[R]],
+    items: Iterable[T],
+    max_concurrency: int | None = None,
+) -> list[R]:
+    """
+    fn dla każdego elementu: najwyżej max_concurrency (domyślnie config.CLAUDE_CONCURRENCY)
+    naraz, wyniki w kolejności items.
+    """
+    sem = asyncio.Semaphore(max(1, max_concurrency or config.CLAUDE_CONCURRENCY))
+
+    async def run(item: T) -> R:
+        async with sem:
+            return await fn(item)
+
+    return list(await asyncio.gather(*(run(item) for item in items)))
+
+
+# Wspólny system prompt dla wywołań z share_image_prefix – instrukcje etapu idą po zdjęciach
+SHARED_IMAGE_SYSTEM = """Jesteś asystentem pracującym na zdjęciach produktów.
+Zdjęcia są załączone na początku wiadomości użytkownika, w kolejności numeracji (pierwsze = 1).
+Instrukcje zadania i wymagany format odpowiedzi znajdują się w wiadomości użytkownika, po zdjęciach – stosuj się do nich dokładnie."""
+
+_CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def build_message_params(
     system: str,
     user_text: str,
     image_paths: list[Path],
     max_tokens: int = 4096,
+    share_image_prefix: bool = False,
+) -> tuple[dict[str, Any], list[str]]:
+    """
+    Parametry dla messages.create (model, max_tokens, system, messages) oraz klucze załączonych
+    obrazów ("sha256:WxH", do cache odpowiedzi i logów).
+
+    Przy config.PROMPT_CACHING_ENABLED system prompt jest oznaczony cache_control.
+    share_image_prefix: układ [SHARED_IMAGE_SYSTEM] + [obrazy (cache_control na ostatnim), system + tekst]
+    – kolejne wywołanie z tymi samymi obrazami korzysta z zapisanego prefiksu.
+    """
+    image_blocks: list[dict[str, Any]] = []
+    image_keys: list[str] = []
+    for p in image_paths:
+        payload = get_image_payload(p)
+        if payload:
+            image_blocks.append(payload.content_block())
+            image_keys.append(f"{payload.sha256}:{payload.width}x{payload.height}")
+
+    caching = config.PROMPT_CACHING_ENABLED
+    if share_image_prefix and caching and image_blocks:
+        image_blocks[-1] = {**image_blocks[-1], "cache_control": _CACHE_CONTROL}
+        system_blocks = [{"type": "text", "text": SHARED_IMAGE_SYSTEM, "cache_control": _CACHE_CONTROL}]
+        content = image_blocks + [{"type": "text", "text": f"{system}\n\n{user_text}"}]
+    else:
+        system_blocks = [{"type": "text", "text": system}]
+        if caching:
+            system_blocks[0]["cache_control"] = _CACHE_CONTROL
+        content = [{"type": "text", "text": user_text}] + image_blocks
+    params = {
+        "model": config.CLAUDE_MODEL,
+        "max_tokens": max_tokens,
+        "system": system_blocks,
+        "messages": [{"role": "user", "content": content}],
+    }
+    return params, image_keys
+
+
+def message_cache_key(system: str, user_text: str, max_tokens: int, image_keys: list[str]) -> str:
+    """Klucz trwałego cache odpowiedzi dla żądania z build_message_params."""
+    return response_cache_key(config.CLAUDE_MODEL, system, user_text, max_tokens, image_keys)
+
+
+def lookup_cached_response(cache_key: str) -> str | None:
+    """Tekst odpowiedzi z trwałego cache albo None (brak wpisu / cache wyłączony)."""
+    cache = get_response_cache()
+    if cache is None:
+        return None
+    try:
+        cached = cache.get(cache_key)
+    except Exception as e:
+        logger.debug("Response cache read failed: %s", e)
+        return None
+    return cached["text"] if cached is not None else None
+
+
+def store_cached_response(cache_key: str, text: str) -> None:
+    cache = get_response_cache()
+    if cache is None:
+        return
+    try:
+        cache.set(cache_key, {"text": text}, ttl_s=config.CLAUDE_CACHE_TTL_S)
+    except Exception as e:
+        logger.debug("Response cache write failed: %s", e)
+
+
+@dataclass
+class _PreparedRequest:
+    params: dict[str, Any]
+    image_keys: list[str]
+    cache_key: str | None = None
+    cached: str | None = None
+    cacheable: Callable[[str], bool] | None = None
+
+
+def _prepare_request(
+    system: str,
+    user_text: str,
+    image_paths: list[Path],
+    max_tokens: int,
+    use_cache: bool,
+    share_image_prefix: bool,
+    cacheable: Callable[[str], bool] | None = None,
+) -> _PreparedRequest:
+    """Parametry żądania + odczyt trwałego cache odpowiedzi."""
+    params, image_keys = build_message_params(
+        system, user_text, image_paths, max_tokens, share_image_prefix=share_image_prefix
+    )
+    req = _PreparedRequest(params, image_keys, cacheable=cacheable)
+    if use_cache and get_response_cache() is not None:
+        req.cache_key = message_cache_key(system, user_text, max_tokens, image_keys)
+        req.cached = lookup_cached_response(req.cache_key)
+        if req.cached is not None and cacheable is not None and not cacheable(req.cached):
+            req.cached = None  # wpis sprzed walidacji – pytamy ponownie
+        if req.cached is not None:
+            logger.info("Claude response cache hit (%s images)", len(image_keys))
+            _record_usage(cache_hit=True)
+            return req
+    logger.info(
+        "Claude request: %s images (%s)",
+        len(image_keys), ", ".join(k.split(":")[1] for k in image_keys) or "-",
+    )
+    return req
+
+
+def _response_text(req: _PreparedRequest, msg: Any) -> str:
+    """Zużycie tokenów, tekst odpowiedzi, zapis do cache odpowiedzi."""
+    usage = getattr(msg, "usage", None)
+    _record_usage(usage)
+    if usage is not None and getattr(usage, "cache_read_input_tokens", 0):
+        logger.info("Prompt cache read: %s tokens", usage.cache_read_input_tokens)
+    text = msg.content[0].text if msg.content else ""
+    if req.cache_key and text and (req.cacheable is None or req.cacheable(text)):
+        store_cached_response(req.cache_key, text)
+    return text
+
+
+async def message_with_images_async(
+    system: str,
+    user_text: str,
+    image_paths: list[Path],
+    max_tokens: int = 4096,
+    use_cache: bool = True,
+    share_image_prefix: bool = False,
+    cacheable: Callable[[str], bool] | None = None,
 ) -> str:
     """
-    Wysyła do Claude wiadomość z tekstem i załączonymi obrazami.
+    Wysyła do Claude (AsyncAnthropic) wiadomość z tekstem i załączonymi obrazami.
     Zwraca treść odpowiedzi (text).
+    use_cache: False – pomiń trwały cache odpowiedzi (bez odczytu i zapisu).
+    share_image_prefix: obrazy jako wspólny, cacheowalny prefiks (patrz build_message_params).
+    cacheable: warunek zapisu do cache odpowiedzi (np. poprawny JSON); odpowiedź go niespełniająca
+    nie jest zapisywana ani zwracana z cache.
+    Przygotowanie obrazów (Pillow) i cache odpowiedzi (SQLite) w wątku – pętla zdarzeń nie jest
+    blokowana. Wywołania API w jednej pętli dzielą limit config.CLAUDE_CONCURRENCY (trafienia cache bez limitu).
     """
-    content: list[dict[str, Any]] = [{"type": "text", "text": user_text}]
-    for p in image_paths:
-        block = build_image_content_block(p)
-        if block:
-            content.append(block)
-    client = get_client()
-    msg = client.messages.create(
-        model=config.CLAUDE_MODEL,
-        max_tokens=max_tokens,
-        system=system,
-        messages=[{"role": "user", "content": content}],
+    req = await asyncio.to_thread(
+        _prepare_request, system, user_text, image_paths, max_tokens, use_cache, share_image_prefix,
+        cacheable,
     )
-    return msg.content[0].text if msg.content else ""
+    if req.cached is not None:
+        return req.cached
+    async with _async_limit():
+        msg = await get_async_client().messages.create(**req.params)
+    return await asyncio.to_thread(_response_text, req, msg)
+
+
+def message_with_images(
+    system: str,
+    user_text: str,
+    image_paths: list[Path],
+    max_tokens: int = 4096,
+    use_cache: bool = True,
+    share_image_prefix: bool = False,
+    cacheable: Callable[[str], bool] | None = None,
+) -> str:
+    """Jak message_with_images_async, poza pętlą zdarzeń (run_with_claude)."""
+    return run_with_claude(message_with_images_async(
+        system, user_text, image_paths, max_tokens, use_cache, share_image_prefix, cacheable
+    ))
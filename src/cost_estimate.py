@@ -1,8 +1,9 @@
 """
 Analiza kosztów przed generowaniem opisu (wywołania Claude API).
 
-Szacuje koszt na podstawie liczby zdjęć: matching (batche), quality filter (batche),
-analiza opisu (1 wywołanie), weryfikacja opisu (1 wywołanie).
+Szacuje koszt na podstawie liczby zdjęć: matching (batche), quality filter (batche)
+– albo w trybie połączonym jedno wywołanie na batch (screening) – analiza opisu (1 wywołanie),
+weryfikacja opisu (1 wywołanie) – albo w trybie "single" opis + weryfikacja w jednym wywołaniu.
 Cennik: konfigurowalny w config (Sonnet 4: input $3/MTok, output $15/MTok).
 Obrazy liczone jako ~1600 tokenów wejścia każdy (wg dokumentacji Anthropic).
 """
@@ -22,6 +23,10 @@ TOKENS_SYSTEM_QUALITY = 500
 TOKENS_USER_QUALITY = 150
 TOKENS_OUTPUT_QUALITY_PER_IMAGE = 80
 
+TOKENS_SYSTEM_SCREENING = 750
+TOKENS_USER_SCREENING = 180
+TOKENS_OUTPUT_SCREENING_PER_IMAGE = 120
+
 TOKENS_SYSTEM_ANALYZE = 350
 TOKENS_USER_ANALYZE = 50
 TOKENS_OUTPUT_ANALYZE = 1500
@@ -30,6 +35,10 @@ TOKENS_SYSTEM_VERIFY = 550
 TOKENS_USER_VERIFY = 200
 TOKENS_OUTPUT_VERIFY = 800
 
+TOKENS_SYSTEM_GENERATE_VERIFY = 750
+TOKENS_USER_GENERATE_VERIFY = 120
+TOKENS_OUTPUT_GENERATE_VERIFY = 2300
+
 TOKENS_PER_IMAGE_INPUT = 1600  # orientacyjnie dla obrazu w API
 
 
@@ -37,88 +46,117 @@ def _batch_count(n: int, batch_size: int) -> int:
     return max(1, math.ceil(n / batch_size))
 
 
-def estimate_generation_cost(num_images: int) -> dict[str, Any]:
+def _usd(input_tokens: int, output_tokens: int) -> tuple[float, float]:
+    return (
+        round(input_tokens / 1_000_000 * config.CLAUDE_PRICE_INPUT_PER_MTOK, 4),
+        round(output_tokens / 1_000_000 * config.CLAUDE_PRICE_OUTPUT_PER_MTOK, 4),
+    )
+
+
+def _stage(input_tokens: int, output_tokens: int, batches: int | None = None) -> dict[str, Any]:
+    usd_input, usd_output = _usd(input_tokens, output_tokens)
+    out: dict[str, Any] = {} if batches is None else {"batches": batches}
+    out.update({
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "usd_input": usd_input,
+        "usd_output": usd_output,
+    })
+    return out
+
+
+def estimate_generation_cost(
+    num_images: int,
+    fused_filter: bool = False,
+    generation_mode: str = "two_step",
+) -> dict[str, Any]:
     """
     Szacuje koszt (USD) generacji opisu dla danej liczby zdjęć (po pobraniu, przed matchingiem).
 
     Zakłada: wszystkie zdjęcia przejdą matching i quality (górna granica kosztu),
     potem analiza i weryfikacja na min(num_images, MAX_IMAGES_TO_ANALYZE).
+    fused_filter: matching + quality w jednym wywołaniu na batch (src.image_screening).
+    generation_mode: "single" – opis bazowy + weryfikacja w jednym wywołaniu.
     """
     batch_size = 10
     n = min(num_images, config.MAX_IMAGES_TO_ANALYZE * 2)  # cap dla realizmu
     n_analyze = min(n, config.MAX_IMAGES_TO_ANALYZE)
-
-    # Matching: batche po 10 zdjęć
-    batches_match = _batch_count(n, batch_size)
-    input_match = batches_match * (
-        TOKENS_SYSTEM_MATCHING + TOKENS_USER_MATCHING
-        + batch_size * TOKENS_PER_IMAGE_INPUT
+    breakdown: dict[str, Any] = {}
+
+    if fused_filter:
+        # Screening: batche po 10, każdy obraz wysyłany raz
+        batches_screen = _batch_count(n, batch_size)
+        input_filter = batches_screen * (
+            TOKENS_SYSTEM_SCREENING + TOKENS_USER_SCREENING
+            + batch_size * TOKENS_PER_IMAGE_INPUT
+        )
+        output_filter = batches_screen * batch_size * TOKENS_OUTPUT_SCREENING_PER_IMAGE
+        breakdown["screening"] = _stage(input_filter, output_filter, batches_screen)
+    else:
+        # Matching: batche po 10 zdjęć
+        batches_match = _batch_count(n, batch_size)
+        input_match = batches_match * (
+            TOKENS_SYSTEM_MATCHING + TOKENS_USER_MATCHING
+            + batch_size * TOKENS_PER_IMAGE_INPUT
+        )
+        output_match = batches_match * batch_size * TOKENS_OUTPUT_MATCHING_PER_IMAGE
+
+        # Quality: batche po 10
+        batches_quality = _batch_count(n, batch_size)
+        input_quality = batches_quality * (
+            TOKENS_SYSTEM_QUALITY + TOKENS_USER_QUALITY
+            + batch_size * TOKENS_PER_IMAGE_INPUT
+        )
+        output_quality = batches_quality * batch_size * TOKENS_OUTPUT_QUALITY_PER_IMAGE
+        breakdown["matching"] = _stage(input_match, output_match, batches_match)
+        breakdown["quality_filter"] = _stage(input_quality, output_quality, batches_quality)
+        input_filter = input_match + input_quality
+        output_filter = output_match + output_quality
+
+    if generation_mode == "single":
+        # Opis + weryfikacja: 1 wywołanie, do n_analyze zdjęć
+        input_describe = (
+            TOKENS_SYSTEM_GENERATE_VERIFY + TOKENS_USER_GENERATE_VERIFY
+            + n_analyze * TOKENS_PER_IMAGE_INPUT
+        )
+        output_describe = TOKENS_OUTPUT_GENERATE_VERIFY
+        breakdown["generate_and_verify"] = _stage(input_describe, output_describe)
+    else:
+        # Analiza opisu: 1 wywołanie, do n_analyze zdjęć
+        input_analyze = (
+            TOKENS_SYSTEM_ANALYZE + TOKENS_USER_ANALYZE
+            + n_analyze * TOKENS_PER_IMAGE_INPUT
+        )
+        output_analyze = TOKENS_OUTPUT_ANALYZE
+
+        # Weryfikacja: 1 wywołanie
+        input_verify = (
+            TOKENS_SYSTEM_VERIFY + TOKENS_USER_VERIFY
+            + n_analyze * TOKENS_PER_IMAGE_INPUT
+        )
+        output_verify = TOKENS_OUTPUT_VERIFY
+
+        breakdown["analyze_description"] = _stage(input_analyze, output_analyze)
+        breakdown["verify_description"] = _stage(input_verify, output_verify)
+        input_describe = input_analyze + input_verify
+        output_describe = output_analyze + output_verify
+
+    total_input = input_filter + input_describe
+    total_output = output_filter + output_describe
+
+    total_usd = round(
+        total_input / 1_000_000 * config.CLAUDE_PRICE_INPUT_PER_MTOK
+        + total_output / 1_000_000 * config.CLAUDE_PRICE_OUTPUT_PER_MTOK,
+        4,
     )
-    output_match = batches_match * batch_size * TOKENS_OUTPUT_MATCHING_PER_IMAGE
-
-    # Quality: batche po 10
-    batches_quality = _batch_count(n, batch_size)
-    input_quality = batches_quality * (
-        TOKENS_SYSTEM_QUALITY + TOKENS_USER_QUALITY
-        + batch_size * TOKENS_PER_IMAGE_INPUT
-    )
-    output_quality = batches_quality * batch_size * TOKENS_OUTPUT_QUALITY_PER_IMAGE
-
-    # Analiza opisu: 1 wywołanie, do n_analyze zdjęć
-    input_analyze = (
-        TOKENS_SYSTEM_ANALYZE + TOKENS_USER_ANALYZE
-        + n_analyze * TOKENS_PER_IMAGE_INPUT
-    )
-    output_analyze = TOKENS_OUTPUT_ANALYZE
-
-    # Weryfikacja: 1 wywołanie
-    input_verify = (
-        TOKENS_SYSTEM_VERIFY + TOKENS_USER_VERIFY
-        + n_analyze * TOKENS_PER_IMAGE_INPUT
-    )
-    output_verify = TOKENS_OUTPUT_VERIFY
-
-    total_input = input_match + input_quality + input_analyze + input_verify
-    total_output = output_match + output_quality + output_analyze + output_verify
-
-    input_per_mtok = total_input / 1_000_000
-    output_per_mtok = total_output / 1_000_000
-    cost_input = input_per_mtok * config.CLAUDE_PRICE_INPUT_PER_MTOK
-    cost_output = output_per_mtok * config.CLAUDE_PRICE_OUTPUT_PER_MTOK
-    total_usd = round(cost_input + cost_output, 4)
 
     return {
         "num_images_assumed": num_images,
         "num_images_capped": n,
         "num_images_for_analyze_verify": n_analyze,
-        "breakdown": {
-            "matching": {
-                "batches": batches_match,
-                "input_tokens": input_match,
-                "output_tokens": output_match,
-                "usd_input": round(input_match / 1_000_000 * config.CLAUDE_PRICE_INPUT_PER_MTOK, 4),
-                "usd_output": round(output_match / 1_000_000 * config.CLAUDE_PRICE_OUTPUT_PER_MTOK, 4),
-            },
-            "quality_filter": {
-                "batches": batches_quality,
-                "input_tokens": input_quality,
-                "output_tokens": output_quality,
-                "usd_input": round(input_quality / 1_000_000 * config.CLAUDE_PRICE_INPUT_PER_MTOK, 4),
-                "usd_output": round(output_quality / 1_000_000 * config.CLAUDE_PRICE_OUTPUT_PER_MTOK, 4),
-            },
-            "analyze_description": {
-                "input_tokens": input_analyze,
-                "output_tokens": output_analyze,
-                "usd_input": round(input_analyze / 1_000_000 * config.CLAUDE_PRICE_INPUT_PER_MTOK, 4),
-                "usd_output": round(output_analyze / 1_000_000 * config.CLAUDE_PRICE_OUTPUT_PER_MTOK, 4),
-            },
-            "verify_description": {
-                "input_tokens": input_verify,
-                "output_tokens": output_verify,
-                "usd_input": round(input_verify / 1_000_000 * config.CLAUDE_PRICE_INPUT_PER_MTOK, 4),
-                "usd_output": round(output_verify / 1_000_000 * config.CLAUDE_PRICE_OUTPUT_PER_MTOK, 4),
-            },
-        },
+        "filter_mode": "fused" if fused_filter else "two_step",
+        "generation_mode": generation_mode,
+        "breakdown": breakdown,
         "total_input_tokens": total_input,
         "total_output_tokens": total_output,
         "estimated_usd": total_usd,
@@ -3,14 +3,23 @@ Baza danych na Vercel (Postgres / Neon).
 
 Tabele:
 - pipeline_runs: każdy uruchomiony pipeline (EAN, szacunek kosztów, wynik JSON, created_at).
-- product_images: pomniejszone zdjęcia tylko tych wykorzystanych (run_id, ean, image_data, content_type, wymiary, source_url, position).
+- image_blobs: treść pomniejszonych zdjęć adresowana hashem (sha256) – te same bajty zapisane raz,
+  niezależnie od liczby runów i EAN-ów.
+- product_images: wykorzystane zdjęcia runu (run_id, ean, blob_hash → image_blobs, content_type, wymiary,
+  source_url, position). Starsze wiersze mogą mieć treść w image_data (blob_hash NULL);
+  widok product_images_with_data zwraca treść niezależnie od wariantu.
 """
 from __future__ import annotations
 
+import asyncio
+import atexit
+import hashlib
 import json
 import logging
+import threading
 import uuid
 from contextlib import contextmanager
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any, Generator
 
@@ -18,6 +27,10 @@ import config
 
 logger = logging.getLogger(__name__)
 
+# Pula połączeń na proces (psycopg_pool) – bez nowego TCP+TLS+auth do Neon przy każdym zapisie
+_pool = None
+_pool_lock = threading.Lock()
+
 
 def _get_conn():
     if not config.POSTGRES_URL:
@@ -26,8 +39,53 @@ def _get_conn():
     return psycopg.connect(config.POSTGRES_URL)
 
 
+def get_pool():
+    """
+    Wspólna pula połączeń (DB_POOL_MIN_SIZE–DB_POOL_MAX_SIZE); tworzona przy pierwszym użyciu.
+    Połączenie sprawdzane przed wydaniem (DB_POOL_CHECK) – zerwane przez Neon po bezczynności
+    jest zastępowane nowym. None, gdy pula wyłączona (DB_POOL_ENABLED=0).
+    """
+    global _pool
+    if not config.DB_POOL_ENABLED:
+        return None
+    if _pool is None:
+        if not config.POSTGRES_URL:
+            raise ValueError("POSTGRES_URL (lub DATABASE_URL) nie jest ustawiony")
+        with _pool_lock:
+            if _pool is None:
+                from psycopg_pool import ConnectionPool
+
+                _pool = ConnectionPool(
+                    config.POSTGRES_URL,
+                    min_size=max(0, config.DB_POOL_MIN_SIZE),
+                    max_size=max(1, config.DB_POOL_MIN_SIZE, config.DB_POOL_MAX_SIZE),
+                    max_idle=config.DB_POOL_MAX_IDLE_S,
+                    timeout=config.DB_POOL_TIMEOUT_S,
+                    check=ConnectionPool.check_connection if config.DB_POOL_CHECK else None,
+                    name="photogen",
+                    open=True,
+                )
+                atexit.register(close_pool)
+    return _pool
+
+
+def close_pool() -> None:
+    """Zamyka pulę (atexit; też przed fork/zmianą POSTGRES_URL)."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+
+
 @contextmanager
 def get_connection() -> Generator[Any, None, None]:
+    """Połączenie z puli (commit na końcu bloku, rollback przy wyjątku); bez puli – nowe połączenie."""
+    pool = get_pool()
+    if pool is not None:
+        with pool.connection() as conn:
+            yield conn
+        return
     conn = _get_conn()
     try:
         yield conn
@@ -54,12 +112,24 @@ def init_tables() -> None:
                     created_at TIMESTAMPTZ DEFAULT NOW()
                 );
             """)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS image_blobs (
+                    hash VARCHAR(64) PRIMARY KEY,
+                    image_data BYTEA NOT NULL,
+                    content_type VARCHAR(64) NOT NULL DEFAULT 'image/jpeg',
+                    width INT,
+                    height INT,
+                    size_bytes INT NOT NULL,
+                    created_at TIMESTAMPTZ DEFAULT NOW()
+                );
+            """)
             cur.execute("""
                 CREATE TABLE IF NOT EXISTS product_images (
                     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
                     run_id UUID NOT NULL REFERENCES pipeline_runs(id) ON DELETE CASCADE,
                     ean VARCHAR(32) NOT NULL,
-                    image_data BYTEA NOT NULL,
+                    image_data BYTEA,
+                    blob_hash VARCHAR(64) REFERENCES image_blobs(hash),
                     content_type VARCHAR(64) NOT NULL DEFAULT 'image/jpeg',
                     width INT,
                     height INT,
@@ -68,11 +138,24 @@ def init_tables() -> None:
                     created_at TIMESTAMPTZ DEFAULT NOW()
                 );
             """)
+            # migracja starszych tabel: treść zdjęcia w image_blobs, product_images tylko referencja
+            cur.execute("""
+                ALTER TABLE product_images ADD COLUMN IF NOT EXISTS blob_hash VARCHAR(64) REFERENCES image_blobs(hash);
+                ALTER TABLE product_images ALTER COLUMN image_data DROP NOT NULL;
+            """)
+            cur.execute("""
+                CREATE OR REPLACE VIEW product_images_with_data AS
+                SELECT pi.id, pi.run_id, pi.ean, COALESCE(b.image_data, pi.image_data) AS image_data,
+                       pi.content_type, pi.width, pi.height, pi.source_url, pi.position, pi.blob_hash, pi.created_at
+                FROM product_images pi
+                LEFT JOIN image_blobs b ON b.hash = pi.blob_hash;
+            """)
             cur.execute("""
                 CREATE INDEX IF NOT EXISTS idx_pipeline_runs_ean ON pipeline_runs(ean);
                 CREATE INDEX IF NOT EXISTS idx_pipeline_runs_created ON pipeline_runs(created_at DESC);
                 CREATE INDEX IF NOT EXISTS idx_product_images_run_id ON product_images(run_id);
                 CREATE INDEX IF NOT EXISTS idx_product_images_ean ON product_images(ean);
+                CREATE INDEX IF NOT EXISTS idx_product_images_blob_hash ON product_images(blob_hash);
             """)
     logger.info("DB tables initialized")
 
@@ -121,36 +204,190 @@ def save_run(
             return rid
 
 
+# COPY product_images ... (FORMAT BINARY): kolumny i typy Postgresa w kolejności wierszy
+_IMAGE_COLUMNS = ("run_id", "ean", "blob_hash", "content_type", "width", "height", "source_url", "position")
+_IMAGE_TYPES = ("uuid", "varchar", "varchar", "varchar", "int4", "int4", "varchar", "int4")
+_SOURCE_URL_MAX = 2048
+
+
+@dataclass
+class _ImageBlob:
+    hash: str
+    data: bytes
+    content_type: str
+    width: int
+    height: int
+
+
+def _image_rows(
+    run_id: str,
+    ean: str,
+    image_paths: list[Path],
+    source_urls: list[str | None] | None = None,
+    blobs: dict[str, _ImageBlob] | None = None,
+    storage: dict[str, tuple[bytes, str, int, int]] | None = None,
+) -> list[tuple[Any, ...]]:
+    """
+    Wiersze product_images (po pomniejszeniu); zdjęcia, których nie da się odczytać, są pomijane.
+    Treść trafia do blobs (hash → blob) – jeden wpis na identyczne bajty.
+    storage: warianty do bazy policzone wcześniej (ścieżka bezwzględna → wynik jak resize_image_for_storage).
+    """
+    from src.image_store import resize_image_for_storage
+
+    source_urls = source_urls or []
+    blobs = blobs if blobs is not None else {}
+    storage = storage or {}
+    rows: list[tuple[Any, ...]] = []
+    for i, path in enumerate(image_paths):
+        try:
+            variant = storage.get(str(Path(path).resolve()))
+            data, content_type, width, height = variant or resize_image_for_storage(path)
+        except Exception as e:
+            logger.warning("Skip saving image %s: %s", path, e)
+            continue
+        digest = hashlib.sha256(data).hexdigest()
+        blobs.setdefault(digest, _ImageBlob(digest, data, content_type, width, height))
+        url = source_urls[i] if i < len(source_urls) else None
+        # za długi URL przerwałby COPY całego runu
+        rows.append((uuid.UUID(str(run_id)), ean, digest, content_type, width, height,
+                     url[:_SOURCE_URL_MAX] if url else None, i))
+    return rows
+
+
+def _store_blobs(cur: Any, blobs: dict[str, _ImageBlob]) -> int:
+    """
+    Wysyła tylko bloby, których jeszcze nie ma w bazie (sprawdzenie wszystkich hashy jednym zapytaniem).
+    ON CONFLICT – równoległy run mógł zapisać ten sam blob w międzyczasie. Zwraca liczbę wysłanych.
+    """
+    if not blobs:
+        return 0
+    cur.execute("SELECT hash FROM image_blobs WHERE hash = ANY(%s);", (list(blobs),))
+    existing = {row[0] for row in cur.fetchall()}
+    missing = [b for h, b in blobs.items() if h not in existing]
+    if missing:
+        cur.executemany(
+            """
+            INSERT INTO image_blobs (hash, image_data, content_type, width, height, size_bytes)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON CONFLICT (hash) DO NOTHING;
+            """,
+            [(b.hash, b.data, b.content_type, b.width, b.height, len(b.data)) for b in missing],
+        )
+    logger.debug("Image blobs: %s new, %s already stored", len(missing), len(existing))
+    return len(missing)
+
+
+def _copy_images(cur: Any, rows: list[tuple[Any, ...]]) -> None:
+    """Wszystkie wiersze jednym COPY FROM STDIN (binarnie) – jeden round trip zamiast INSERT na zdjęcie."""
+    if not rows:
+        return
+    with cur.copy(f"COPY product_images ({', '.join(_IMAGE_COLUMNS)}) FROM STDIN (FORMAT BINARY)") as copy:
+        copy.set_types(_IMAGE_TYPES)
+        for row in rows:
+            copy.write_row(row)
+
+
 def save_used_images(
     run_id: str,
     ean: str,
     image_paths: list[Path],
     source_urls: list[str | None] | None = None,
+    storage: dict[str, tuple[bytes, str, int, int]] | None = None,
 ) -> int:
     """
     Pomniejsza i zapisuje do product_images tylko przekazane zdjęcia (wykorzystane w pipeline).
     image_paths: lista ścieżek do plików (po matching + quality filter).
     source_urls: opcjonalna lista URL-i w tej samej kolejności.
+    storage: warianty do bazy z etapu preprocessingu (bez ponownego dekodowania).
+    Treść zdjęć już obecnych w image_blobs (np. z poprzedniego runu tego EAN-u) nie jest wysyłana ponownie.
     Zwraca liczbę zapisanych zdjęć.
     """
-    from src.image_store import resize_image_for_storage
+    blobs: dict[str, _ImageBlob] = {}
+    rows = _image_rows(run_id, ean, image_paths, source_urls, blobs, storage)
+    if rows:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                _store_blobs(cur, blobs)
+                _copy_images(cur, rows)
+    return len(rows)
+
+
+@dataclass
+class RunRecord:
+    """Run do zapisu w save_runs: pola jak w save_run + wykorzystane zdjęcia."""
+
+    ean: str
+    product_name: str | None = None
+    cost_estimate: dict[str, Any] | None = None
+    result: dict[str, Any] | None = None
+    run_id: str | None = None
+    image_paths: list[Path] = field(default_factory=list)
+    source_urls: list[str | None] = field(default_factory=list)
+    storage: dict[str, tuple[bytes, str, int, int]] = field(default_factory=dict)
+
+
+def save_runs(records: list[RunRecord]) -> list[tuple[str, int]]:
+    """
+    Zapis wielu runów w jednej transakcji: upsert pipeline_runs (executemany w trybie pipeline)
+    i zdjęcia wszystkich runów jednym COPY (brakujące bloby – jak w save_used_images).
+    Istniejące pola runu nie są nadpisywane wartościami None.
+    Zwraca (run_id, liczba zapisanych zdjęć) w kolejności records.
+    """
+    params: list[tuple[Any, ...]] = []
+    rows: list[tuple[Any, ...]] = []
+    blobs: dict[str, _ImageBlob] = {}
+    out: list[tuple[str, int]] = []
+    for rec in records:
+        run_id = rec.run_id or str(uuid.uuid4())
+        cost = rec.cost_estimate or None
+        params.append((
+            run_id,
+            rec.ean,
+            rec.product_name,
+            cost.get("estimated_usd") if cost else None,
+            json.dumps(cost) if cost else None,
+            json.dumps(rec.result, ensure_ascii=False) if rec.result else None,
+        ))
+        image_rows = _image_rows(run_id, rec.ean, rec.image_paths, rec.source_urls, blobs, rec.storage)
+        rows.extend(image_rows)
+        out.append((run_id, len(image_rows)))
+    if not params:
+        return out
 
-    source_urls = source_urls or []
-    saved = 0
     with get_connection() as conn:
         with conn.cursor() as cur:
-            for i, path in enumerate(image_paths):
-                try:
-                    data, content_type, width, height = resize_image_for_storage(path)
-                    url = source_urls[i] if i < len(source_urls) else None
-                    cur.execute(
-                        """
-                        INSERT INTO product_images (run_id, ean, image_data, content_type, width, height, source_url, position)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s);
-                        """,
-                        (run_id, ean, data, content_type, width, height, url, i),
-                    )
-                    saved += 1
-                except Exception as e:
-                    logger.warning("Skip saving image %s: %s", path, e)
-    return saved
+            cur.executemany(
+                """
+                INSERT INTO pipeline_runs (id, ean, product_name, cost_estimate_usd, cost_estimate_json, result_json)
+                VALUES (%s, %s, %s, %s, %s::jsonb, %s::jsonb)
+                ON CONFLICT (id) DO UPDATE
+                SET product_name = COALESCE(EXCLUDED.product_name, pipeline_runs.product_name),
+                    cost_estimate_usd = COALESCE(EXCLUDED.cost_estimate_usd, pipeline_runs.cost_estimate_usd),
+                    cost_estimate_json = COALESCE(EXCLUDED.cost_estimate_json, pipeline_runs.cost_estimate_json),
+                    result_json = COALESCE(EXCLUDED.result_json, pipeline_runs.result_json);
+                """,
+                params,
+            )
+            _store_blobs(cur, blobs)
+            _copy_images(cur, rows)
+    return out
+
+
+# Warianty async (pipeline na asyncio): ta sama pula procesu, zapytania w wątku.
+# Pula async (AsyncConnectionPool) byłaby związana z pętlą, a każdy run / żądanie ma własne asyncio.run.
+
+
+async def save_run_async(
+    ean: str,
+    product_name: str | None = None,
+    cost_estimate: dict[str, Any] | None = None,
+    result: dict[str, Any] | None = None,
+    run_id: str | None = None,
+) -> str:
+    """Jak save_run, bez blokowania pętli zdarzeń."""
+    return await asyncio.to_thread(save_run, ean, product_name, cost_estimate, result, run_id)
+
+
+async def save_runs_async(records: list[RunRecord]) -> list[tuple[str, int]]:
+    """Jak save_runs, bez blokowania pętli zdarzeń."""
+    return await asyncio.to_thread(save_runs, records)
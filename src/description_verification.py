@@ -1,6 +1,9 @@
 """
 Weryfikacja opisu produktu oraz ekstrakcja wiarygodnych danych: EAN, wymiary (gdy widoczne na zdjęciach).
 Claude analizuje zdjęcia i zwraca zweryfikowany opis + pola strukturalne.
+
+Tryb jednego wywołania (generate_verified_description): opis bazowy, opis zweryfikowany
+i pola strukturalne w jednej odpowiedzi – bez osobnego wywołania analyze_images_for_description.
 """
 from __future__ import annotations
 
@@ -11,10 +14,14 @@ from pathlib import Path
 from typing import Any
 
 import config
-from src.claude_client import message_with_images
+from src.claude_client import message_with_images_async, run_with_claude
 
 logger = logging.getLogger(__name__)
 
+# ostrzeżenie runu, gdy odpowiedź Claude nie jest poprawnym JSON-em (etap nie jest zapisywany w checkpoincie);
+# `verified` zachowuje wtedy zwykły schemat (opis bez zmian), bez klucza "error"
+INVALID_RESPONSE_ERROR = "invalid JSON in response"
+
 SYSTEM_VERIFY = """Jesteś asystentem weryfikującym opisy produktów na podstawie zdjęć.
 Twoje zadania:
 1) Zweryfikować podany opis produktu – czy zgadza się z tym, co widać na zdjęciach (np. kolor, kształt, opakowanie, zawartość).
@@ -50,6 +57,43 @@ Przeanalizuj załączone zdjęcia i:
 Odpowiedz tylko JSON."""
 
 
+SYSTEM_GENERATE_VERIFY = """Jesteś asystentem tworzącym i weryfikującym opisy produktów na podstawie zdjęć.
+Twoje zadania (w jednej odpowiedzi):
+1) Napisz opis bazowy: JEDEN spójny, szczegółowy opis produktu (podstawa pod późniejszy opis SEO) –
+   wygląd, opakowanie, etykieta, zastosowanie, tekst z opakowania (skład, instrukcje). Trzecia osoba, neutralnie,
+   2–4 akapity. Nie wymyślaj faktów – tylko to, co wynika ze zdjęć.
+2) Zweryfikuj ten opis krytycznie z tym, co widać na zdjęciach (kolor, kształt, opakowanie, zawartość)
+   i podaj wersję poprawioną oraz listę poprawek.
+3) Z zdjęć wyciągnij WIARYGODNE dane, które są WIDOCZNE:
+   - EAN / kod kreskowy – tylko jeśli wyraźnie czytelny na zdjęciu (podaj dokładnie)
+   - Wymiary – tylko jeśli widoczne na opakowaniu/etykiecie (np. "120x80x40 mm", "500 ml")
+   - Inne dane z etykiety (skład, waga) – tylko jeśli czytelne
+4) Nie wymyślaj danych – jeśli czegoś nie widać, wpisz null.
+5) Język wyników: {lang}.
+
+Odpowiedz WYŁĄCZNIE poprawnym JSON (bez markdown):
+{{
+  "description_base": "opis bazowy z punktu 1 (pełny tekst)",
+  "description_verified": "zweryfikowany, poprawiony opis produktu (pełny tekst)",
+  "description_confidence": 0.9,
+  "ean_from_images": "kod EAN jeśli czytelny na zdjęciu, else null",
+  "dimensions_from_images": "wymiary jeśli widoczne, else null",
+  "volume_or_weight_from_images": "np. 500ml / 250g jeśli widoczne, else null",
+  "other_visible_data": {{ "klucz": "wartość z etykiety/opakowania" }},
+  "corrections_made": ["lista poprawek wprowadzonych do opisu bazowego"]
+}}"""
+
+USER_GENERATE_VERIFY_TEMPLATE = """Produkt (nazwa): {product_name}
+
+Na podstawie załączonych zdjęć:
+1) Napisz opis bazowy produktu.
+2) Zweryfikuj/popraw go względem zdjęć.
+3) Wypisz EAN, wymiary, objętość/wagę TYLKO jeśli wyraźnie widać na zdjęciach.
+4) Język wyników: {lang}.
+
+Odpowiedz tylko JSON."""
+
+
 def _parse_verify_response(text: str) -> dict[str, Any] | None:
     raw = text.strip()
     if raw.startswith("```"):
@@ -61,16 +105,49 @@ def _parse_verify_response(text: str) -> dict[str, Any] | None:
         return None
 
 
-def verify_description_and_extract_data(
-    image_paths: list[Path],
+def is_valid_verify_response(text: str) -> bool:
+    """Czy odpowiedź weryfikacji da się sparsować (tylko takie trafiają do cache odpowiedzi)."""
+    return bool(_parse_verify_response(text))
+
+
+def _unverified(original_description: str, error: str | None = None) -> dict[str, Any]:
+    """Wynik, gdy weryfikacja się nie udała: opis bez zmian, brak danych z zdjęć."""
+    out: dict[str, Any] = {
+        "description_verified": original_description,
+        "description_confidence": 0.0,
+        "ean_from_images": None,
+        "dimensions_from_images": None,
+        "volume_or_weight_from_images": None,
+        "other_visible_data": {},
+        "corrections_made": [],
+    }
+    if error is not None:
+        out["error"] = error
+    return out
+
+
+def _verified_fields(parsed: dict[str, Any], original_description: str) -> dict[str, Any]:
+    return {
+        "description_verified": parsed.get("description_verified") or original_description,
+        "description_confidence": float(parsed.get("description_confidence", 0)),
+        "ean_from_images": parsed.get("ean_from_images"),
+        "dimensions_from_images": parsed.get("dimensions_from_images"),
+        "volume_or_weight_from_images": parsed.get("volume_or_weight_from_images"),
+        "other_visible_data": parsed.get("other_visible_data") or {},
+        "corrections_made": parsed.get("corrections_made") or [],
+    }
+
+
+VERIFY_MAX_TOKENS = 4096
+GENERATE_VERIFY_MAX_TOKENS = 6144
+
+
+def verify_prompts(
     product_name: str,
     original_description: str,
     lang: str | None = None,
-) -> dict[str, Any]:
-    """
-    Na podstawie zdjęć weryfikuje opis i wyciąga EAN, wymiary itd. gdy widoczne.
-    Zwraca słownik z: description_verified, ean_from_images, dimensions_from_images, itd.
-    """
+) -> tuple[str, str]:
+    """(system, user) dla weryfikacji opisu."""
     lang = lang or config.OUTPUT_LANG
     system = SYSTEM_VERIFY.format(lang=lang)
     user = USER_VERIFY_TEMPLATE.format(
@@ -78,40 +155,128 @@ def verify_description_and_extract_data(
         original_description=original_description or "(brak opisu)",
         lang=lang,
     )
+    return system, user
+
+
+def apply_verify_response(
+    response: str | None,
+    original_description: str,
+    error: str | None = None,
+    warnings: list[str] | None = None,
+) -> dict[str, Any]:
+    """
+    Wynik weryfikacji z odpowiedzi Claude (None = błąd wywołania, opis bez zmian).
+    Niepoprawny JSON: opis bez zmian, a do warnings trafia "verify: invalid JSON in response".
+    """
+    if response is None:
+        return _unverified(original_description, error=error)
+    parsed = _parse_verify_response(response)
+    if not parsed:
+        logger.warning("Description verification: response is not valid JSON")
+        if warnings is not None:
+            warnings.append(f"verify: {INVALID_RESPONSE_ERROR}")
+        return _unverified(original_description)
+    return _verified_fields(parsed, original_description)
+
+
+def generate_verify_prompts(product_name: str, lang: str | None = None) -> tuple[str, str]:
+    """(system, user) dla trybu opis + weryfikacja w jednym wywołaniu."""
+    lang = lang or config.OUTPUT_LANG
+    system = SYSTEM_GENERATE_VERIFY.format(lang=lang)
+    user = USER_GENERATE_VERIFY_TEMPLATE.format(product_name=product_name, lang=lang)
+    return system, user
+
+
+def apply_generate_verify_response(
+    response: str | None,
+    error: str | None = None,
+    warnings: list[str] | None = None,
+) -> tuple[str, dict[str, Any]]:
+    """
+    (opis bazowy, wynik weryfikacji) z odpowiedzi Claude (None = błąd wywołania).
+    Niepoprawny JSON: pusty opis, a do warnings trafia "describe: invalid JSON in response".
+    """
+    if response is None:
+        return "", _unverified("", error=error)
+    parsed = _parse_verify_response(response)
+    if not parsed:
+        logger.warning("Description generation+verification: response is not valid JSON")
+        if warnings is not None:
+            warnings.append(f"describe: {INVALID_RESPONSE_ERROR}")
+        return "", _unverified("")
+    base_desc = parsed.get("description_base") or parsed.get("description_verified") or ""
+    return base_desc, _verified_fields(parsed, base_desc)
+
+
+async def verify_description_and_extract_data_async(
+    image_paths: list[Path],
+    product_name: str,
+    original_description: str,
+    lang: str | None = None,
+    warnings: list[str] | None = None,
+) -> dict[str, Any]:
+    """
+    Na podstawie zdjęć weryfikuje opis i wyciąga EAN, wymiary itd. gdy widoczne.
+    Zwraca słownik z: description_verified, ean_from_images, dimensions_from_images, itd.
+    warnings: lista ostrzeżeń runu (niepoprawna odpowiedź – patrz apply_verify_response).
+    """
+    system, user = verify_prompts(product_name, original_description, lang)
     # nie wysyłaj zbyt wielu zdjęć naraz
     batch = image_paths[: config.MAX_IMAGES_TO_ANALYZE]
     try:
-        response = message_with_images(system, user, batch, max_tokens=4096)
+        response = await message_with_images_async(
+            system, user, batch, max_tokens=VERIFY_MAX_TOKENS, share_image_prefix=True,
+            cacheable=is_valid_verify_response,
+        )
     except Exception as e:
         logger.warning("Description verification API error: %s", e)
-        return {
-            "description_verified": original_description,
-            "description_confidence": 0.0,
-            "ean_from_images": None,
-            "dimensions_from_images": None,
-            "volume_or_weight_from_images": None,
-            "other_visible_data": {},
-            "corrections_made": [],
-            "error": str(e),
-        }
+        return apply_verify_response(None, original_description, error=str(e))
+    return apply_verify_response(response, original_description, warnings=warnings)
 
-    parsed = _parse_verify_response(response)
-    if not parsed:
-        return {
-            "description_verified": original_description,
-            "description_confidence": 0.0,
-            "ean_from_images": None,
-            "dimensions_from_images": None,
-            "volume_or_weight_from_images": None,
-            "other_visible_data": {},
-            "corrections_made": [],
-        }
-    return {
-        "description_verified": parsed.get("description_verified") or original_description,
-        "description_confidence": float(parsed.get("description_confidence", 0)),
-        "ean_from_images": parsed.get("ean_from_images"),
-        "dimensions_from_images": parsed.get("dimensions_from_images"),
-        "volume_or_weight_from_images": parsed.get("volume_or_weight_from_images"),
-        "other_visible_data": parsed.get("other_visible_data") or {},
-        "corrections_made": parsed.get("corrections_made") or [],
-    }
+
+async def generate_verified_description_async(
+    image_paths: list[Path],
+    product_name: str,
+    lang: str | None = None,
+    warnings: list[str] | None = None,
+) -> tuple[str, dict[str, Any]]:
+    """
+    Jedno wywołanie Claude: opis bazowy + weryfikacja + EAN, wymiary itd.
+    Zwraca (opis bazowy, słownik jak verify_description_and_extract_data_async).
+    warnings: jak w verify_description_and_extract_data_async.
+    """
+    if not image_paths:
+        return "", _unverified("")
+    system, user = generate_verify_prompts(product_name, lang)
+    batch = image_paths[: config.MAX_IMAGES_TO_ANALYZE]
+    try:
+        response = await message_with_images_async(
+            system, user, batch, max_tokens=GENERATE_VERIFY_MAX_TOKENS, cacheable=is_valid_verify_response
+        )
+    except Exception as e:
+        logger.warning("Description generation+verification API error: %s", e)
+        return apply_generate_verify_response(None, error=str(e))
+    return apply_generate_verify_response(response, warnings=warnings)
+
+
+def verify_description_and_extract_data(
+    image_paths: list[Path],
+    product_name: str,
+    original_description: str,
+    lang: str | None = None,
+    warnings: list[str] | None = None,
+) -> dict[str, Any]:
+    """Jak verify_description_and_extract_data_async, poza pętlą zdarzeń (run_with_claude)."""
+    return run_with_claude(
+        verify_description_and_extract_data_async(image_paths, product_name, original_description, lang, warnings)
+    )
+
+
+def generate_verified_description(
+    image_paths: list[Path],
+    product_name: str,
+    lang: str | None = None,
+    warnings: list[str] | None = None,
+) -> tuple[str, dict[str, Any]]:
+    """Jak generate_verified_description_async, poza pętlą zdarzeń (run_with_claude)."""
+    return run_with_claude(generate_verified_description_async(image_paths, product_name, lang, warnings))
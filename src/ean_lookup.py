@@ -1,14 +1,22 @@
 """
 Identyfikacja produktu po kodzie EAN: Open Food Facts (darmowe) + opcjonalnie EAN-DB (JWT).
+
+Oba źródła odpytywane równolegle przez wspólnego klienta HTTP (pula połączeń). Wynik trafia
+do trwałego cache (SQLite, src.cache_store) – osobne TTL dla trafień (EAN_CACHE_HIT_TTL_S)
+i braków (EAN_CACHE_MISS_TTL_S); brak zapisywany tylko, gdy żadne źródło nie zwróciło błędu.
+refresh=True (CLI: --refresh-lookup) pomija odczyt z cache i nadpisuje wpis.
 """
 from __future__ import annotations
 
 import logging
-from dataclasses import dataclass
-from typing import Any
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, replace
+from typing import Any, Callable
 
 import httpx
 import config
+from src.cache_store import SqliteCache
 
 logger = logging.getLogger(__name__)
 
@@ -30,20 +38,62 @@ def _normalize_ean(barcode: str) -> str:
     return "".join(c for c in str(barcode).strip() if c.isdigit())
 
 
+CACHE_NAMESPACE = "ean_lookup"
+
+_client: httpx.Client | None = None
+_cache: SqliteCache | None = None
+_lock = threading.Lock()
+_cache_failed = False
+
+
+def get_client() -> httpx.Client:
+    """Wspólny klient HTTP lookupów (pula połączeń, bezpieczny dla wątków)."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = httpx.Client(
+                    timeout=10.0,
+                    limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                )
+    return _client
+
+
+def get_lookup_cache() -> SqliteCache | None:
+    """Cache wyników lookupu; None gdy wyłączony (config.EAN_CACHE_ENABLED) lub niedostępny."""
+    global _cache, _cache_failed
+    if not config.EAN_CACHE_ENABLED or _cache_failed:
+        return None
+    if _cache is None:
+        with _lock:
+            if _cache is None and not _cache_failed:
+                try:
+                    _cache = SqliteCache(CACHE_NAMESPACE, max_entries=config.EAN_CACHE_MAX_ENTRIES)
+                except Exception as e:
+                    logger.warning("EAN lookup cache disabled (%s): %s", config.CACHE_DB_PATH, e)
+                    _cache_failed = True
+    return _cache
+
+
 def lookup_openfoodfacts(ean: str) -> ProductInfo | None:
     """Open Food Facts – darmowe, bez klucza (gł. żywność)."""
-    ean = _normalize_ean(ean)
-    if not ean or len(ean) < 8:
-        return None
-    url = OPEN_FOOD_FACTS_URL.format(barcode=ean)
     try:
-        with httpx.Client(timeout=10.0) as client:
-            r = client.get(url)
-            r.raise_for_status()
-            data = r.json()
+        return _fetch_openfoodfacts(ean)
     except Exception as e:
         logger.debug("Open Food Facts lookup failed: %s", e)
         return None
+
+
+def _fetch_openfoodfacts(ean: str) -> ProductInfo | None:
+    """Jak lookup_openfoodfacts; błąd sieci / HTTP zgłaszany wyjątkiem (None = brak produktu)."""
+    ean = _normalize_ean(ean)
+    if not ean or len(ean) < 8:
+        return None
+    r = get_client().get(OPEN_FOOD_FACTS_URL.format(barcode=ean))
+    if r.status_code == 404:
+        return None
+    r.raise_for_status()
+    data = r.json()
     if data.get("status") != 1 or not data.get("product"):
         return None
     p = data["product"]
@@ -64,26 +114,31 @@ def lookup_openfoodfacts(ean: str) -> ProductInfo | None:
 
 def lookup_ean_db(ean: str) -> ProductInfo | None:
     """EAN-DB – wymaga EAN_DB_JWT (Bearer)."""
+    try:
+        return _fetch_ean_db(ean)
+    except Exception as e:
+        logger.debug("EAN-DB lookup failed: %s", e)
+        return None
+
+
+def _fetch_ean_db(ean: str) -> ProductInfo | None:
+    """Jak lookup_ean_db; błąd sieci / HTTP zgłaszany wyjątkiem (None = brak produktu)."""
     if not config.EAN_DB_JWT:
         return None
     ean = _normalize_ean(ean)
     if not ean:
         return None
-    url = EAN_DB_URL.format(barcode=ean)
-    try:
-        with httpx.Client(timeout=10.0) as client:
-            r = client.get(
-                url,
-                headers={
-                    "Authorization": f"Bearer {config.EAN_DB_JWT}",
-                    "Accept": "application/json",
-                },
-            )
-            r.raise_for_status()
-            data = r.json()
-    except Exception as e:
-        logger.debug("EAN-DB lookup failed: %s", e)
+    r = get_client().get(
+        EAN_DB_URL.format(barcode=ean),
+        headers={
+            "Authorization": f"Bearer {config.EAN_DB_JWT}",
+            "Accept": "application/json",
+        },
+    )
+    if r.status_code == 404:
         return None
+    r.raise_for_status()
+    data = r.json()
     prod = data.get("product")
     if not prod:
         return None
@@ -110,16 +165,62 @@ def lookup_ean_db(ean: str) -> ProductInfo | None:
     )
 
 
-def lookup_product(ean: str) -> ProductInfo | None:
+def lookup_product(ean: str, refresh: bool = False) -> ProductInfo | None:
     """
-    Identyfikacja produktu po EAN. Kolejność: EAN-DB (jeśli JWT) → Open Food Facts.
+    Identyfikacja produktu po EAN. EAN-DB (jeśli JWT) i Open Food Facts równolegle; pierwszeństwo
+    ma EAN-DB, brakujące pola (marka, kategorie, zdjęcie) uzupełniane z OFF.
+    Wynik z cache, o ile nie refresh (lub config.EAN_CACHE_REFRESH); wpisy z cache mają raw=None.
     """
     ean = _normalize_ean(ean)
     if not ean:
         return None
-    info = lookup_ean_db(ean) if config.EAN_DB_JWT else None
-    if not info:
-        info = lookup_openfoodfacts(ean)
-    if not info:
-        return ProductInfo(name=f"Produkt EAN {ean}", ean=ean, raw=None)
-    return info
+    cache = get_lookup_cache()
+    if cache is not None and not (refresh or config.EAN_CACHE_REFRESH):
+        entry = cache.get(ean)
+        if entry is not None:
+            logger.debug("EAN lookup cache hit: %s", ean)
+            return ProductInfo(**entry["product"]) if entry.get("product") else _placeholder(ean)
+
+    fetchers: list[Callable[[str], ProductInfo | None]] = [_fetch_openfoodfacts]
+    if config.EAN_DB_JWT:
+        fetchers.insert(0, _fetch_ean_db)
+    found: list[ProductInfo] = []
+    failed = False
+    with ThreadPoolExecutor(max_workers=len(fetchers)) as pool:
+        for future in [pool.submit(f, ean) for f in fetchers]:
+            try:
+                info = future.result()
+            except Exception as e:
+                logger.debug("EAN lookup source failed: %s", e)
+                failed = True
+                continue
+            if info is not None:
+                found.append(info)
+
+    info = _merge(found)
+    if cache is not None:
+        if info is not None:
+            cache.set(ean, {"product": asdict(replace(info, raw=None))}, ttl_s=config.EAN_CACHE_HIT_TTL_S)
+        elif not failed:
+            # negatywny cache – tylko gdy wszystkie źródła odpowiedziały „brak produktu”
+            cache.set(ean, {"product": None}, ttl_s=config.EAN_CACHE_MISS_TTL_S)
+    return info or _placeholder(ean)
+
+
+def _merge(found: list[ProductInfo]) -> ProductInfo | None:
+    """Pierwszy wynik (wg priorytetu źródeł) z brakującymi polami uzupełnionymi z kolejnych."""
+    if not found:
+        return None
+    best = found[0]
+    for other in found[1:]:
+        best = replace(
+            best,
+            brand=best.brand or other.brand,
+            categories=best.categories or other.categories,
+            image_url=best.image_url or other.image_url,
+        )
+    return best
+
+
+def _placeholder(ean: str) -> ProductInfo:
+    return ProductInfo(name=f"Produkt EAN {ean}", ean=ean, raw=None)
@@ -7,7 +7,7 @@ import logging
 from pathlib import Path
 
 import config
-from src.claude_client import message_with_images
+from src.claude_client import message_with_images_async, run_with_claude
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +21,10 @@ Długość: 2–4 akapity."""
 USER_ANALYZE = """Wygeneruj opis produktu na podstawie załączonych zdjęć. Język: polski. Opis ma być podstawą pod przyszły opis SEO."""
 
 
-def analyze_images_for_description(image_paths: list[Path]) -> str:
+MAX_TOKENS = 2048
+
+
+async def analyze_images_for_description_async(image_paths: list[Path]) -> str:
     """
     Claude analizuje zdjęcia i zwraca jeden opis bazowy (tekst).
     """
@@ -29,7 +32,15 @@ def analyze_images_for_description(image_paths: list[Path]) -> str:
         return ""
     batch = image_paths[: config.MAX_IMAGES_TO_ANALYZE]
     try:
-        return message_with_images(SYSTEM_ANALYZE, USER_ANALYZE, batch, max_tokens=2048)
+        # wspólny prefiks zdjęć – weryfikacja (te same zdjęcia) czyta go z prompt cache
+        return await message_with_images_async(
+            SYSTEM_ANALYZE, USER_ANALYZE, batch, max_tokens=MAX_TOKENS, share_image_prefix=True
+        )
     except Exception as e:
         logger.warning("Image analysis API error: %s", e)
         return ""
+
+
+def analyze_images_for_description(image_paths: list[Path]) -> str:
+    """Jak analyze_images_for_description_async, poza pętlą zdarzeń (run_with_claude)."""
+    return run_with_claude(analyze_images_for_description_async(image_paths))
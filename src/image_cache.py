@@ -0,0 +1,183 @@
+"""
+Współdzielony cache pobranych zdjęć (między runami, EAN-ami i katalogami tymczasowymi API).
+
+Pliki adresowane treścią: blobs/{sha[:2]}/{sha}{ext}. Indeks (index.json) mapuje URL → sha
+oraz sha → rozmiar / ostatnie użycie, więc wyszukiwanie nie skanuje katalogów.
+Limit rozmiaru (IMAGE_CACHE_MAX_MB) egzekwowany przez usuwanie najdawniej używanych plików (LRU).
+Do katalogu docelowego plik trafia jako hardlink (fallback: kopia).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+import config
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+
+
+def _file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _link_or_copy(src: Path, dest: Path) -> None:
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(src, dest)
+    except FileExistsError:
+        pass
+    except OSError:
+        shutil.copyfile(src, dest)
+
+
+class ImageCache:
+    """Cache zdjęć na dysku: klucz URL → sha256 treści; bloby z limitem rozmiaru (LRU)."""
+
+    def __init__(self, root: Path, max_bytes: int) -> None:
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._urls, self._blobs = self._read_index()
+        self.hits = 0
+        self.misses = 0
+
+    # --- indeks ---
+
+    def _read_index(self) -> tuple[dict[str, str], dict[str, dict[str, Any]]]:
+        path = self.root / INDEX_FILE
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            return dict(data.get("urls") or {}), dict(data.get("blobs") or {})
+        except FileNotFoundError:
+            return {}, {}
+        except Exception as e:
+            logger.warning("Image cache index unreadable (%s), starting empty", e)
+            return {}, {}
+
+    def flush(self) -> None:
+        """Zapisuje indeks (atomowo). Wpisy innych procesów zapisane w międzyczasie są zachowane."""
+        with self._lock:
+            if not self._dirty:
+                return
+            disk_urls, disk_blobs = self._read_index()
+            for sha, meta in disk_blobs.items():
+                if sha not in self._blobs and self._blob_path(sha, meta["ext"]).exists():
+                    self._blobs[sha] = meta
+            for url, sha in disk_urls.items():
+                if url not in self._urls and sha in self._blobs:
+                    self._urls[url] = sha
+            self._evict_locked()
+            tmp = self.root / f"{INDEX_FILE}.{os.getpid()}.tmp"
+            tmp.write_text(
+                json.dumps({"urls": self._urls, "blobs": self._blobs}),
+                encoding="utf-8",
+            )
+            os.replace(tmp, self.root / INDEX_FILE)
+            self._dirty = False
+
+    # --- bloby ---
+
+    def _blob_path(self, sha: str, ext: str) -> Path:
+        return self.root / "blobs" / sha[:2] / f"{sha}{ext}"
+
+    def _evict_locked(self) -> None:
+        total = sum(m["size"] for m in self._blobs.values())
+        if total <= self.max_bytes:
+            return
+        evicted: set[str] = set()
+        for sha, meta in sorted(self._blobs.items(), key=lambda kv: kv[1].get("atime", 0)):
+            if total <= self.max_bytes:
+                break
+            self._blob_path(sha, meta["ext"]).unlink(missing_ok=True)
+            total -= meta["size"]
+            evicted.add(sha)
+        for sha in evicted:
+            del self._blobs[sha]
+        self._urls = {u: s for u, s in self._urls.items() if s not in evicted}
+        self._dirty = True
+        logger.debug("Image cache: evicted %s files (LRU), %.1f MB left", len(evicted), total / 1e6)
+
+    def lookup(self, url: str) -> Path | None:
+        """Ścieżka bloba dla URL-a (jeśli w cache) – aktualizuje czas ostatniego użycia."""
+        with self._lock:
+            sha = self._urls.get(url)
+            meta = self._blobs.get(sha) if sha else None
+            if meta is None:
+                self.misses += 1
+                return None
+            path = self._blob_path(sha, meta["ext"])
+            if not path.exists():
+                del self._blobs[sha]
+                self._urls.pop(url, None)
+                self._dirty = True
+                self.misses += 1
+                return None
+            meta["atime"] = time.time()
+            self._dirty = True
+            self.hits += 1
+            return path
+
+    def put(self, url: str, src: Path, sha: str | None = None) -> Path:
+        """
+        Dodaje pobrany plik do cache (bez duplikatów treści). Zwraca ścieżkę bloba.
+        sha: sha256 treści, jeśli już policzony (np. w trakcie pobierania).
+        """
+        src = Path(src)
+        sha = sha or _file_sha256(src)
+        ext = src.suffix.lower()
+        blob = self._blob_path(sha, ext)
+        with self._lock:
+            if sha not in self._blobs or not blob.exists():
+                _link_or_copy(src, blob)
+                self._blobs[sha] = {"ext": ext, "size": blob.stat().st_size, "atime": time.time()}
+            else:
+                self._blobs[sha]["atime"] = time.time()
+            self._urls[url] = sha
+            self._dirty = True
+            self._evict_locked()
+        return blob
+
+    def materialize(self, blob: Path, dest_dir: Path, stem: str) -> Path:
+        """Udostępnia blob w dest_dir jako {stem}{ext} (hardlink lub kopia)."""
+        dest = Path(dest_dir) / f"{stem}{blob.suffix}"
+        if not dest.exists():
+            _link_or_copy(blob, dest)
+        return dest
+
+
+_cache: ImageCache | None = None
+_cache_lock = threading.Lock()
+_cache_disabled = False
+
+
+def get_image_cache() -> ImageCache | None:
+    """Wspólna instancja cache dla procesu; None gdy wyłączony (IMAGE_CACHE_MAX_MB=0) lub katalog niedostępny."""
+    global _cache, _cache_disabled
+    if _cache is not None or _cache_disabled:
+        return _cache
+    with _cache_lock:
+        if _cache is None and not _cache_disabled:
+            if config.IMAGE_CACHE_MAX_MB <= 0:
+                _cache_disabled = True
+                return None
+            try:
+                _cache = ImageCache(config.IMAGE_CACHE_DIR, config.IMAGE_CACHE_MAX_MB * 1024 * 1024)
+            except OSError as e:
+                logger.warning("Image cache disabled (%s): %s", config.IMAGE_CACHE_DIR, e)
+                _cache_disabled = True
+    return _cache
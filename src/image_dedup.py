@@ -0,0 +1,196 @@
+"""
+Lokalna deduplikacja zdjęć przed AI matchingiem (bez wywołań Claude).
+
+dHash (Pillow): obraz w skali szarości 9x8, bit = czy piksel jest jaśniejszy od prawego sąsiada.
+Zdjęcia o odległości Hamminga <= IMAGE_DEDUP_MAX_DISTANCE tworzą grupę (ta sama fotografia
+przeskalowana / przekompresowana); z grupy zostaje zdjęcie o największej rozdzielczości.
+"""
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+from typing import Any
+
+from PIL import Image
+
+import config
+from src.image_store import check_image_size
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8
+
+
+def dhash(img: Image.Image, hash_size: int = HASH_SIZE) -> int:
+    """Perceptual difference hash (hash_size * hash_size bitów)."""
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    px = small.load()
+    bits = 0
+    for y in range(hash_size):
+        for x in range(hash_size):
+            bits = (bits << 1) | (1 if px[x, y] > px[x + 1, y] else 0)
+    return bits
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def image_dhash(img: Image.Image) -> int:
+    """
+    dHash świeżo otwartego (jeszcze niezdekodowanego) obrazu – wspólny dla image_signature
+    i preprocessingu (src.image_preprocess), więc ten sam plik ma ten sam hash w obu ścieżkach.
+    JPEG dekodowany w zmniejszonej skali (draft); zmienia img (rozmiar po draft).
+    """
+    img.draft("L", (64, 64))
+    return dhash(img)
+
+
+def image_signature(path: Path) -> tuple[int, int, int] | None:
+    """(dhash, szerokość, wysokość) lub None gdy obrazu nie da się otworzyć."""
+    try:
+        with Image.open(path) as img:
+            check_image_size(img)
+            w, h = img.size
+            return image_dhash(img), w, h
+    except Exception as e:
+        logger.debug("Cannot hash image %s: %s", path, e)
+        return None
+
+
+def group_near_duplicates(hashes: list[int], max_distance: int) -> list[list[int]]:
+    """Grupy indeksów (union-find) dla hashy o odległości Hamminga <= max_distance."""
+    parent = list(range(len(hashes)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i in range(len(hashes)):
+        for j in range(i + 1, len(hashes)):
+            if hamming(hashes[i], hashes[j]) <= max_distance:
+                parent[find(j)] = find(i)
+    groups: dict[int, list[int]] = {}
+    for i in range(len(hashes)):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+
+def _rank(path: Path, signature: tuple[int, int, int], order: int) -> tuple[int, int, int]:
+    """Ranking w grupie prawie-duplikatów: liczba pikseli, rozmiar pliku, wcześniejsze na liście."""
+    _, w, h = signature
+    try:
+        size = path.stat().st_size
+    except OSError:
+        size = 0
+    return (w * h, size, -order)
+
+
+def dedupe_images(
+    image_paths: list[Path],
+    max_distance: int | None = None,
+    signatures: dict[str, tuple[int, int, int]] | None = None,
+) -> tuple[list[Path], list[Path], dict[str, Any]]:
+    """
+    Usuwa prawie-duplikaty (perceptual hash). Z każdej grupy zostaje zdjęcie o największej
+    liczbie pikseli (remis: większy plik, potem wcześniejsze na liście).
+    signatures: policzone wcześniej (etap preprocessingu) – ścieżka bezwzględna → (dhash, szer., wys.);
+    pozostałe zdjęcia dekodowane tutaj.
+    Zwraca: (zostawione w kolejności wejściowej, odrzucone duplikaty, szczegóły grup).
+    Zdjęć, których nie da się zdekodować, nie odrzuca (decyzję zostawia matchingowi).
+    """
+    max_distance = config.IMAGE_DEDUP_MAX_DISTANCE if max_distance is None else max_distance
+    paths = [Path(p) for p in image_paths]
+    known = signatures or {}
+    signatures = [known.get(str(p.resolve())) or image_signature(p) for p in paths]
+    hashed = [i for i, sig in enumerate(signatures) if sig is not None]
+    groups = group_near_duplicates([signatures[i][0] for i in hashed], max_distance)
+
+    dropped: set[int] = set()
+    dup_groups: list[dict[str, Any]] = []
+    for group in groups:
+        if len(group) < 2:
+            continue
+        members = [hashed[g] for g in group]
+        best = max(members, key=lambda i: _rank(paths[i], signatures[i], i))
+        dropped.update(i for i in members if i != best)
+        dup_groups.append({
+            "kept": paths[best].name,
+            "dropped": [paths[i].name for i in sorted(members) if i != best],
+        })
+
+    keep = [p for i, p in enumerate(paths) if i not in dropped]
+    removed = [p for i, p in enumerate(paths) if i in dropped]
+    if removed:
+        logger.info("Dedup: %s near-duplicates removed (%s groups)", len(removed), len(dup_groups))
+    return keep, removed, {"groups": dup_groups, "max_distance": max_distance}
+
+
+class NearDuplicateIndex:
+    """
+    Deduplikacja przyrostowa (tryb strumieniowy pipeline’u): zdjęcia dodawane w miarę pobierania,
+    grupy łączone przechodnio (union-find, jak group_near_duplicates). Z grupy zostaje – jak
+    w dedupe_images – zdjęcie o najwyższym _rank; większa kopia pobrana później zastępuje przyjętą
+    wcześniej. Po dodaniu wszystkich zdjęć dropped() == duplikaty odrzucone przez dedupe_images.
+    """
+
+    def __init__(self, max_distance: int | None = None) -> None:
+        self.max_distance = config.IMAGE_DEDUP_MAX_DISTANCE if max_distance is None else max_distance
+        self._paths: list[Path] = []
+        self._hashes: list[int] = []
+        self._ranks: list[tuple[int, int, int]] = []
+        self._parent: list[int] = []
+        self._best: dict[int, int] = {}  # korzeń grupy → indeks najlepszego zdjęcia
+        self._index: dict[Path, int] = {}
+
+    def _find(self, i: int) -> int:
+        while self._parent[i] != i:
+            self._parent[i] = self._parent[self._parent[i]]
+            i = self._parent[i]
+        return i
+
+    def _union(self, i: int, j: int) -> None:
+        ri, rj = self._find(i), self._find(j)
+        if ri == rj:
+            return
+        self._parent[rj] = ri
+        self._best[ri] = max(self._best[ri], self._best.pop(rj), key=self._ranks.__getitem__)
+
+    def add(
+        self,
+        path: Path,
+        signature: tuple[int, int, int] | None = None,
+        order: int | None = None,
+    ) -> bool:
+        """
+        True = zdjęcie jest najlepsze w swojej grupie (na razie – może je zastąpić późniejsza kopia);
+        False = prawie-duplikat lepszego zdjęcia.
+        signature: (dhash, szer., wys.) z etapu preprocessingu – bez ponownego dekodowania.
+        order: pozycja zdjęcia na liście wynikowej (remis jak w dedupe_images); domyślnie kolejność add.
+        """
+        path = Path(path)
+        sig = signature or image_signature(path)
+        if sig is None:
+            return True
+        i = len(self._paths)
+        self._paths.append(path)
+        self._hashes.append(sig[0])
+        self._ranks.append(_rank(path, sig, i if order is None else order))
+        self._parent.append(i)
+        self._best[i] = i
+        self._index[path] = i
+        for j in range(i):
+            if hamming(sig[0], self._hashes[j]) <= self.max_distance:
+                self._union(i, j)
+        return self.is_kept(path)
+
+    def is_kept(self, path: Path) -> bool:
+        """Czy zdjęcie jest obecnie najlepsze w swojej grupie (zdjęcia spoza indeksu – zawsze)."""
+        i = self._index.get(Path(path))
+        return i is None or self._best[self._find(i)] == i
+
+    def dropped(self) -> set[Path]:
+        """Zdjęcia odrzucone jako prawie-duplikaty (także przyjęte wcześniej i później zastąpione)."""
+        return {p for p in self._paths if not self.is_kept(p)}
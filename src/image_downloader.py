@@ -1,21 +1,33 @@
 """
 Pobieranie zdjęć z URL-i do katalogu lokalnego.
 Deduplikacja po URL; zapis z bezpieczną nazwą pliku.
+Pobieranie równoległe na asyncio (download_images_async, wspólny klient HTTP/2 z keep-alive),
+z limitem na host i deadline'em całego etapu; operacje na plikach w wątkach, poza pętlą zdarzeń.
+Wywołania synchroniczne (download_image, download_sources*) to cienkie nakładki na asyncio.run.
+Pobrane pliki trafiają do wspólnego cache (src.image_cache) – ten sam URL nie jest pobierany
+ponownie w kolejnych runach.
 """
 from __future__ import annotations
 
+import asyncio
 import hashlib
 import logging
 import re
+import time
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, TypeVar
+from urllib.parse import urlparse
 
 import httpx
 
 import config
+from src.image_cache import ImageCache, get_image_cache
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 # dozwolone rozszerzenia / content-type
 ALLOWED_CONTENT_TYPES = {
     "image/jpeg", "image/jpg", "image/png", "image/webp", "image/gif",
@@ -23,63 +35,318 @@ ALLOWED_CONTENT_TYPES = {
 TIMEOUT = 15.0
 MAX_SIZE_MB = 10
 
+try:
+    import h2  # noqa: F401 – HTTP/2 w httpx wymaga pakietu h2
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
 
-def _safe_filename(url: str, index: int) -> str:
-    ext = ".jpg"
-    try:
-        path = url.split("?")[0]
-        if path.lower().endswith(".png"):
-            ext = ".png"
-        elif path.lower().endswith(".webp"):
-            ext = ".webp"
-        elif path.lower().endswith(".gif"):
-            ext = ".gif"
-    except Exception:
-        pass
+
+class DownloadError(Exception):
+    """Pobranie obrazu nie powiodło się (powód w komunikacie)."""
+
+
+@dataclass
+class DownloadResult:
+    """Wynik pobrania jednego URL-a; lista wyników ma kolejność wejściowych URL-i."""
+    url: str
+    index: int
+    path: Path | None = None
+    latency_ms: float | None = None
+    error: str | None = None
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "url": self.url,
+            "ok": self.path is not None,
+            "latency_ms": self.latency_ms,
+            "error": self.error,
+        }
+
+
+# sygnatury formatów obsługiwanych przez Claude Vision (pierwsze bajty pliku)
+_EXT_BY_MEDIA_TYPE = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+}
+SNIFF_BYTES = 16
+CHUNK_SIZE = 64 * 1024
+
+
+def sniff_image_type(head: bytes) -> str | None:
+    """Rozpoznaje format obrazu po pierwszych bajtach. Zwraca media type lub None."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def _file_stem(url: str, index: int) -> str:
     h = hashlib.sha256(url.encode()).hexdigest()[:12]
     safe = re.sub(r"[^\w\-]", "_", h)
-    return f"{index:03d}_{safe}{ext}"
+    return f"{index:03d}_{safe}"
+
+
+def _existing_download(dest_dir: Path, stem: str) -> Path | None:
+    for ext in _EXT_BY_MEDIA_TYPE.values():
+        p = dest_dir / f"{stem}{ext}"
+        if p.exists():
+            return p
+    return None
+
+
+async def _in_thread(fn: Callable[..., T], *args: Any) -> T:
+    """
+    fn(*args) w wątku (zapis na dysk, cache), bez blokowania pętli. Anulowanie czeka na koniec fn –
+    po zakończeniu anulowanego pobrania nic już nie trafia do dest_dir ani do cache.
+    """
+    fut = asyncio.ensure_future(asyncio.to_thread(fn, *args))
+    try:
+        return await asyncio.shield(fut)
+    except asyncio.CancelledError:
+        await asyncio.wait([fut])
+        raise
+
+
+class _BodySink:
+    """
+    Zapis treści odpowiedzi kawałkami do pliku .part: sprawdzenie formatu po pierwszych bajtach,
+    limit bajtów w trakcie czytania, sha256 liczony w locie.
+    """
+
+    def __init__(self, f: Any, content_type: str, max_bytes: int) -> None:
+        self.f = f
+        self.content_type = content_type
+        self.max_bytes = max_bytes
+        self.media_type: str | None = None
+        self.head = b""
+        self.size = 0
+        self.digest = hashlib.sha256()
+
+    def write(self, chunk: bytes) -> None:
+        if self.media_type is None:
+            self.head += chunk
+            if len(self.head) < SNIFF_BYTES:
+                return
+            self.media_type = sniff_image_type(self.head)
+            if self.media_type is None:
+                raise DownloadError(f"unsupported image format (content-type {self.content_type})")
+            chunk, self.head = self.head, b""
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise DownloadError(f"too large: >{self.max_bytes} bytes")
+        self.digest.update(chunk)
+        self.f.write(chunk)
+
+    def close(self) -> str:
+        """Dopisuje resztę nagłówka (krótka odpowiedź); zwraca media type pobranego obrazu."""
+        if self.media_type is None:
+            # krótka odpowiedź (< SNIFF_BYTES) – sprawdź to, co przyszło
+            self.media_type = sniff_image_type(self.head)
+            if self.media_type is None:
+                raise DownloadError(f"unsupported image format (content-type {self.content_type})")
+            self.digest.update(self.head)
+            self.f.write(self.head)
+        return self.media_type
+
 
+def _check_headers(r: httpx.Response, max_bytes: int) -> str:
+    """Odrzuca wcześnie po Content-Type i Content-Length; zwraca content-type."""
+    r.raise_for_status()
+    ct = (r.headers.get("content-type") or "").split(";")[0].strip().lower()
+    if ct not in ALLOWED_CONTENT_TYPES and not ct.startswith("image/"):
+        raise DownloadError(f"non-image content-type: {ct or '(brak)'}")
+    declared = r.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        raise DownloadError(f"too large: {declared} bytes (Content-Length)")
+    return ct
 
-def download_image(
+
+def _cached_or_existing(url: str, dest_dir: Path, stem: str, cache: ImageCache | None) -> Path | None:
+    existing = _existing_download(dest_dir, stem)
+    if existing is not None:
+        return existing
+    if cache is not None:
+        blob = cache.lookup(url)
+        if blob is not None:
+            return cache.materialize(blob, dest_dir, stem)
+    return None
+
+
+def _store(
+    url: str,
+    part: Path,
+    dest_dir: Path,
+    stem: str,
+    sink: _BodySink,
+    cache: ImageCache | None,
+) -> Path:
+    path = dest_dir / f"{stem}{_EXT_BY_MEDIA_TYPE[sink.media_type]}"
+    part.replace(path)
+    if cache is not None:
+        try:
+            cache.put(url, path, sha=sink.digest.hexdigest())
+        except OSError as e:
+            logger.debug("Image cache put failed %s: %s", url[:60], e)
+    return path
+
+
+def _download_error(e: httpx.HTTPError) -> DownloadError:
+    if isinstance(e, httpx.HTTPStatusError):
+        return DownloadError(f"HTTP {e.response.status_code}")
+    if isinstance(e, httpx.TimeoutException):
+        return DownloadError("timeout")
+    return DownloadError(f"{type(e).__name__}: {e}")
+
+
+async def _fetch_image_async(
     url: str,
     dest_dir: Path,
-    index: int = 0,
-    client: Optional[httpx.Client] = None,
-) -> Path | None:
+    index: int,
+    client: httpx.AsyncClient,
+    cache: ImageCache | None = None,
+) -> Path:
+    """
+    Pobiera jeden obraz strumieniowo; przy błędzie rzuca DownloadError z powodem.
+
+    Odrzuca wcześnie: po Content-Type i Content-Length (przed pobraniem treści),
+    po sygnaturze pierwszych bajtów (format nieobsługiwany) i po przekroczeniu limitu
+    bajtów w trakcie czytania. Treść trafia na dysk kawałkami (plik .part → rename),
+    rozszerzenie pliku wynika z rzeczywistego formatu, nie z URL-a.
+    cache: wspólny cache zdjęć – trafienie po URL-u pomija pobieranie.
+    """
+    stem = _file_stem(url, index)
+    found = await _in_thread(_cached_or_existing, url, dest_dir, stem, cache)
+    if found is not None:
+        return found
+    max_bytes = int(MAX_SIZE_MB * 1024 * 1024)
+    part = dest_dir / f"{stem}.part"
+    try:
+        async with client.stream("GET", url) as r:
+            ct = _check_headers(r, max_bytes)
+            f = await _in_thread(open, part, "wb")
+            try:
+                sink = _BodySink(f, ct, max_bytes)
+                async for chunk in r.aiter_bytes(CHUNK_SIZE):
+                    await _in_thread(sink.write, chunk)
+                await _in_thread(sink.close)
+            finally:
+                await _in_thread(f.close)
+        return await _in_thread(_store, url, part, dest_dir, stem, sink, cache)
+    except httpx.HTTPError as e:
+        raise _download_error(e) from e
+    finally:
+        part.unlink(missing_ok=True)
+
+
+def _new_async_client(max_connections: int | None = None) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+    )
+    return httpx.AsyncClient(
+        timeout=TIMEOUT,
+        follow_redirects=True,
+        http2=_HTTP2,
+        limits=limits,
+    )
+
+
+async def download_images_async(
+    image_urls: list[str],
+    dest_dir: Path,
+    *,
+    start_index: int = 0,
+    concurrency: int | None = None,
+    per_host: int | None = None,
+    deadline_s: float | None = None,
+    client: httpx.AsyncClient | None = None,
+    on_result: Callable[[DownloadResult], None] | None = None,
+) -> list[DownloadResult]:
     """
-    Pobiera jeden obraz pod dest_dir. Zwraca ścieżkę pliku lub None przy błędzie.
+    Pobiera URL-e równolegle do dest_dir (httpx.AsyncClient).
+
+    concurrency: globalny limit równoczesnych pobrań (domyślnie config.DOWNLOAD_CONCURRENCY).
+    per_host: limit równoczesnych połączeń do jednego hosta (domyślnie config.DOWNLOAD_PER_HOST_LIMIT).
+    deadline_s: limit czasu wywołania; niedokończone pobrania są przerywane (config.DOWNLOAD_DEADLINE_S).
+    start_index: numeracja plików od tej wartości (kolejne partie URL-i tego samego runu,
+    np. pobieranie wyników wyszukiwania, gdy tylko napłyną).
+    client: wspólny klient (wiele partii / runów w jednej pętli); domyślnie własny na wywołanie.
+    on_result: wywoływane dla każdego zakończonego pobrania (w kolejności ukończenia) –
+    np. przekazanie zdjęcia do kolejnego etapu przed końcem całej partii.
+    Zwraca listę DownloadResult w kolejności image_urls (ścieżka albo powód błędu + czas pobrania).
     """
     dest_dir = Path(dest_dir)
     dest_dir.mkdir(parents=True, exist_ok=True)
-    path = dest_dir / _safe_filename(url, index)
+    results = [DownloadResult(url=u, index=start_index + i) for i, u in enumerate(image_urls)]
+    if not results:
+        return results
 
-    if path.exists():
-        return path
+    concurrency = max(1, concurrency or config.DOWNLOAD_CONCURRENCY)
+    per_host = max(1, per_host or config.DOWNLOAD_PER_HOST_LIMIT)
+    deadline_s = deadline_s if deadline_s is not None else config.DOWNLOAD_DEADLINE_S
+    started = time.monotonic()
+    limit = asyncio.Semaphore(concurrency)
+    host_limits: dict[str, asyncio.Semaphore] = {}
 
-    own_client = client is None
-    if own_client:
-        client = httpx.Client(timeout=TIMEOUT, follow_redirects=True)
+    async def work(res: DownloadResult) -> None:
+        host = (urlparse(res.url).netloc or "").lower()
+        host_sem = host_limits.setdefault(host, asyncio.Semaphore(per_host))
+        async with limit, host_sem:
+            t0 = time.monotonic()
+            try:
+                res.path = await _fetch_image_async(res.url, dest_dir, res.index, http, cache)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                res.error = str(e) or type(e).__name__
+            res.latency_ms = round((time.monotonic() - t0) * 1000, 1)
+        if on_result is not None:
+            on_result(res)
 
+    cache = await asyncio.to_thread(get_image_cache)
+    http = client or _new_async_client(concurrency)
+    tasks = [asyncio.create_task(work(r)) for r in results]
     try:
-        r = client.get(url)
-        r.raise_for_status()
-        ct = (r.headers.get("content-type") or "").split(";")[0].strip().lower()
-        if ct not in ALLOWED_CONTENT_TYPES and not ct.startswith("image/"):
-            logger.debug("Skip non-image content-type: %s", ct)
-            return None
-        size = len(r.content)
-        if size > MAX_SIZE_MB * 1024 * 1024:
-            logger.debug("Skip too large image: %s bytes", size)
-            return None
-        path.write_bytes(r.content)
-        return path
-    except Exception as e:
-        logger.debug("Download failed %s: %s", url[:60], e)
-        return None
+        _, pending = await asyncio.wait(tasks, timeout=max(0.0, deadline_s))
+        for t in pending:
+            t.cancel()  # przerywa pobrania, które przekroczyły deadline
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
     finally:
-        if own_client and client:
-            client.close()
+        if client is None:
+            await http.aclose()
+        if cache is not None:
+            await asyncio.to_thread(cache.flush)
+
+    for r in results:
+        if r.path is None and r.error is None:
+            r.error = "deadline exceeded"
+    ok = sum(1 for r in results if r.path is not None)
+    logger.info(
+        "Downloaded %s/%s images in %.1fs (async, concurrency=%s, per_host=%s, cache hits=%s)",
+        ok, len(results), time.monotonic() - started, concurrency, per_host,
+        cache.hits if cache is not None else 0,
+    )
+    for r in results:
+        if r.error:
+            logger.debug("Download failed %s: %s", r.url[:60], r.error)
+    return results
+
+
+def download_image(url: str, dest_dir: Path, index: int = 0) -> Path | None:
+    """
+    Pobiera jeden obraz pod dest_dir (asyncio.run – poza pętlą zdarzeń).
+    Zwraca ścieżkę pliku lub None przy błędzie.
+    """
+    return asyncio.run(download_images_async([url], dest_dir, start_index=index))[0].path
 
 
 def download_sources(
@@ -88,7 +355,7 @@ def download_sources(
 ) -> list[Path]:
     """
     Pobiera listę URL-i do katalogu DATA/images/{subdir}.
-    Zwraca listę ścieżek do pomyślnie zapisanych plików.
+    Zwraca listę ścieżek do pomyślnie zapisanych plików (w kolejności image_urls).
     """
     base = config.IMAGES_DIR / Path(subdir)
     return download_sources_to_dir(image_urls, base)
@@ -96,14 +363,7 @@ def download_sources(
 
 def download_sources_to_dir(image_urls: list[str], dest_dir: Path) -> list[Path]:
     """
-    Pobiera listę URL-i do podanego katalogu (np. /tmp dla serverless).
+    Pobiera listę URL-i do podanego katalogu (np. /tmp dla serverless); asyncio.run – poza pętlą zdarzeń.
+    Zwraca ścieżki pomyślnie pobranych plików w kolejności image_urls.
     """
-    dest_dir = Path(dest_dir)
-    dest_dir.mkdir(parents=True, exist_ok=True)
-    paths: list[Path] = []
-    with httpx.Client(timeout=TIMEOUT, follow_redirects=True) as client:
-        for i, url in enumerate(image_urls):
-            p = download_image(url, dest_dir, index=i, client=client)
-            if p is not None:
-                paths.append(p)
-    return paths
+    return [r.path for r in asyncio.run(download_images_async(image_urls, dest_dir)) if r.path is not None]
@@ -0,0 +1,177 @@
+"""
+Etap preprocessingu pobranych zdjęć: każdy plik dekodowany raz (Pillow), w puli procesów.
+
+Z jednego dekodowania powstają: wariant dla Claude (jak prepare_image_for_vision), JPEG do bazy
+(jak resize_image_for_storage), wymiary i podstawowe statystyki jasności; dHash (deduplikacja) –
+jak w image_signature (JPEG w skali 1/8), więc sygnatury z obu ścieżek są porównywalne.
+Wyniki trafiają do kolejnych etapów: rejestru obrazów runu (claude_client), deduplikacji
+i zapisu do bazy – praca CPU rozkłada się na rdzenie zamiast iść szeregowo w wątku pipeline’u.
+
+Pula procesów (IMAGE_PREPROCESS_WORKERS) tworzona przy pierwszym użyciu; gdy jest wyłączona
+(IMAGE_PREPROCESS_PROCESSES=0) albo nie da się jej uruchomić (np. brak /dev/shm), preprocessing
+idzie w wątkach. Pula używa metody spawn – skrypty wywołujące pipeline potrzebują
+`if __name__ == "__main__":` (jak main.py i bulk.py).
+"""
+from __future__ import annotations
+
+import asyncio
+import atexit
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from PIL import Image, ImageStat
+
+import config
+from src.image_dedup import image_dhash
+from src.image_store import check_image_size, decode_rgb, storage_variant, vision_variant
+
+logger = logging.getLogger(__name__)
+
+# ustawienia przekazywane do procesów potomnych (config w procesie głównym mógł być zmieniony)
+_SETTINGS = (
+    "IMAGE_STORE_MAX_PX",
+    "IMAGE_STORE_QUALITY",
+    "IMAGE_STORE_FORMAT",
+    "IMAGE_STORE_WEBP_QUALITY",
+    "IMAGE_STORE_AVIF_QUALITY",
+    "IMAGE_MAX_PIXELS",
+    "CLAUDE_IMAGE_MAX_PX",
+    "CLAUDE_IMAGE_MAX_BYTES",
+    "CLAUDE_IMAGE_QUALITY",
+    "CLAUDE_IMAGE_MAX_MEGAPIXELS",
+)
+
+_pool: ProcessPoolExecutor | None = None
+_pool_failed = False
+_lock = threading.Lock()
+
+
+@dataclass
+class PreprocessedImage:
+    """Wynik jednego dekodowania zdjęcia – wszystko, czego potrzebują kolejne etapy."""
+
+    path: str
+    sha256: str  # hash oryginalnego pliku (jak klucz ImagePayloadRegistry)
+    format: str | None
+    width: int
+    height: int
+    size_bytes: int
+    dhash: int
+    vision: tuple[bytes, str, int, int]  # (bytes, media_type, width, height)
+    storage: tuple[bytes, str, int, int]  # (bytes, content_type, width, height)
+    stats: dict[str, float] = field(default_factory=dict)  # jasność: mean, stddev (0–255)
+
+    @property
+    def signature(self) -> tuple[int, int, int]:
+        """(dhash, szerokość, wysokość) – jak sygnatura w src.image_dedup."""
+        return self.dhash, self.width, self.height
+
+
+def image_key(path: Path | str) -> str:
+    """Klucz zdjęcia w mapach wyników (ścieżka bezwzględna, jak path_to_url w pipeline)."""
+    return str(Path(path).resolve())
+
+
+def preprocess_image(path: Path | str) -> PreprocessedImage:
+    """Dekoduje plik raz i liczy wszystkie warianty (w bieżącym procesie)."""
+    path = Path(path)
+    raw = path.read_bytes()
+    img = Image.open(io.BytesIO(raw))  # tylko nagłówek: format i wymiary oryginału
+    check_image_size(img)
+    fmt, width, height = img.format, img.width, img.height
+    # to samo dekodowanie (draft) co resize_image_for_storage – identyczny wariant do bazy
+    rgb = decode_rgb(raw)
+    vision = vision_variant(img, raw, rgb=rgb, name=path.name)
+    stat = ImageStat.Stat(rgb.convert("L"))
+    return PreprocessedImage(
+        path=str(path),
+        sha256=hashlib.sha256(raw).hexdigest(),
+        format=fmt,
+        width=width,
+        height=height,
+        size_bytes=len(raw),
+        # jak image_signature (JPEG: osobne dekodowanie w skali 1/8) – ten sam hash w obu ścieżkach
+        dhash=image_dhash(img),
+        vision=vision,
+        storage=storage_variant(rgb),
+        stats={"mean": round(stat.mean[0], 1), "stddev": round(stat.stddev[0], 1)},
+    )
+
+
+def _preprocess_worker(path: str, settings: dict[str, object]) -> PreprocessedImage | None:
+    """Zadanie w procesie potomnym; None gdy obrazu nie da się zdekodować."""
+    for name, value in settings.items():
+        setattr(config, name, value)
+    try:
+        return preprocess_image(path)
+    except Exception as e:
+        logger.debug("Cannot preprocess image %s: %s", path, e)
+        return None
+
+
+def _settings() -> dict[str, object]:
+    return {name: getattr(config, name) for name in _SETTINGS}
+
+
+def get_preprocess_pool() -> ProcessPoolExecutor | None:
+    """Wspólna pula procesów (leniwie); None gdy nie da się jej uruchomić."""
+    global _pool, _pool_failed
+    if not config.IMAGE_PREPROCESS_PROCESSES:
+        return None
+    if _pool is None and not _pool_failed:
+        with _lock:
+            if _pool is None and not _pool_failed:
+                workers = config.IMAGE_PREPROCESS_WORKERS or os.cpu_count() or 1
+                try:
+                    # spawn: fork procesu z wątkami (httpx, pule wątków) grozi zakleszczeniem
+                    _pool = ProcessPoolExecutor(
+                        max_workers=max(1, workers),
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+                    atexit.register(shutdown_preprocess_pool)
+                except (OSError, ValueError, NotImplementedError) as e:
+                    logger.warning("Image preprocessing: process pool unavailable, using threads: %s", e)
+                    _pool_failed = True
+    return _pool
+
+
+def shutdown_preprocess_pool() -> None:
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def preprocess_async(path: Path | str) -> PreprocessedImage | None:
+    """Preprocessing jednego zdjęcia w puli procesów (lub w wątku); None przy błędzie dekodowania."""
+    global _pool_failed
+    settings = _settings()
+    pool = get_preprocess_pool()
+    if pool is not None:
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                pool, _preprocess_worker, str(path), settings
+            )
+        except BrokenProcessPool as e:
+            logger.warning("Image preprocessing: process pool broken, using threads: %s", e)
+            _pool_failed = True
+            shutdown_preprocess_pool()
+    return await asyncio.to_thread(_preprocess_worker, str(path), settings)
+
+
+async def preprocess_images_async(paths: list[Path]) -> dict[str, PreprocessedImage]:
+    """Wszystkie zdjęcia równolegle; wynik: image_key(ścieżka) → PreprocessedImage (bez nieudanych)."""
+    results = await asyncio.gather(*(preprocess_async(p) for p in paths))
+    out = {image_key(p): r for p, r in zip(paths, results) if r is not None}
+    if len(out) < len(paths):
+        logger.debug("Image preprocessing: %s/%s images could not be decoded", len(paths) - len(out), len(paths))
+    return out
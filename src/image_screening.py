@@ -0,0 +1,174 @@
+"""
+Połączona ocena zdjęć w jednym wywołaniu Claude na batch: AI matching (ten sam produkt)
++ filtr jakości (unikalność, wiarygodność źródła).
+
+Alternatywa dla filter_matching_images → filter_quality: każdy obraz wysyłany raz zamiast dwa razy.
+Progi jak w trybie dwuetapowym: PRODUCT_MATCH_MIN_CONFIDENCE, IMAGE_UNIQUENESS_MIN_SCORE, SOURCE_TRUST_MIN_SCORE.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import re
+from pathlib import Path
+from typing import Any
+
+import config
+from src.claude_client import map_concurrent_async, message_with_images_async, run_with_claude
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_SCREENING = """Jesteś asystentem weryfikującym zdjęcia produktów pod kątem budowania unikalnego opisu SEO.
+Otrzymujesz zdjęcia ponumerowane (1, 2, 3, ...), nazwę produktu, opcjonalnie kod EAN i domeny źródeł.
+Dla każdego zdjęcia oceniasz jednocześnie:
+1) Czy przedstawia TEN SAM produkt (ten sam artykuł, ten sam EAN): to samo opakowanie/wygląd, ten sam kod kreskowy jeśli widoczny.
+   Inny produkt, mockup, samo logo, sam tekst, nieczytelne, inne opakowanie (np. inna pojemność) = nie ten sam produkt.
+2) Czy zdjęcie wnosi coś UNIKALNEGO do opisu (nowy kąt, opakowanie, etykieta, skład, wymiary) – czy to duplikat / mockup / stock.
+3) Czy źródło (domena/strona) budzi zaufanie (sklep, producent, serwis porównawczy) czy jest wątpliwe.
+Odpowiedz WYŁĄCZNIE poprawnym JSON (bez markdown, bez ```), w formacie:
+{"images": [{"index": 1, "same_product": true, "confidence": 0.95, "uniqueness_score": 0.8, "source_trust_score": 0.7, "keep": true, "reason": "krótki powód"}, ...]}
+- index: numer zdjęcia (1-based)
+- same_product: czy to ten sam produkt; confidence: 0-1 pewność
+- uniqueness_score: 0-1 (jak bardzo zdjęcie wnosi coś unikalnego)
+- source_trust_score: 0-1 (wiarygodność źródła)
+- keep: true jeśli warto zostawić do opisu
+- reason: krótkie uzasadnienie"""
+
+USER_SCREENING_TEMPLATE = """Produkt: {product_name}
+EAN: {ean}
+Źródła (jeśli znane): {sources_text}
+
+Zdjęcia są ponumerowane w kolejności załączników (pierwsze zdjęcie = 1, drugie = 2, itd.).
+Dla każdego zdjęcia: same_product, confidence, uniqueness_score, source_trust_score, keep, reason.
+Odpowiedz tylko JSON."""
+
+
+def _parse_screening_response(text: str) -> dict[str, Any] | None:
+    raw = text.strip()
+    if raw.startswith("```"):
+        raw = re.sub(r"^```\w*\n?", "", raw)
+        raw = re.sub(r"\n?```\s*$", "", raw)
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        return None
+
+
+BATCH_SIZE = 10
+MAX_TOKENS = 3072
+
+
+def screening_user_text(
+    product_name: str,
+    ean: str | None = None,
+    source_domains: list[str] | None = None,
+) -> str:
+    sources_text = ", ".join(source_domains[:20]) if source_domains else "nie podano"
+    return USER_SCREENING_TEMPLATE.format(
+        product_name=product_name,
+        ean=ean or "nie podano",
+        sources_text=sources_text,
+    )
+
+
+def apply_screening_response(
+    batch: list[Path],
+    response: str | None,
+) -> tuple[list[tuple[bool, bool]], dict[str, Any] | None]:
+    """
+    Werdykty dla jednego batcha (None = błąd wywołania): lista (przeszło matching,
+    przeszło jakość) dla każdego zdjęcia + sparsowana odpowiedź.
+    """
+    parsed = _parse_screening_response(response) if response is not None else None
+    if not parsed:
+        # w razie błędu zostawiamy wszystkie w batchu
+        return [(True, True)] * len(batch), None
+
+    images = parsed.get("images") or []
+    min_conf = config.PRODUCT_MATCH_MIN_CONFIDENCE
+    min_uniqueness = config.IMAGE_UNIQUENESS_MIN_SCORE
+    min_trust = config.SOURCE_TRUST_MIN_SCORE
+    verdicts: list[tuple[bool, bool]] = []
+    for i in range(len(batch)):
+        item = next((m for m in images if m.get("index") == i + 1), None)
+        if not item:
+            verdicts.append((True, True))
+            continue
+        same = item.get("same_product", True)
+        conf = float(item.get("confidence", 0.5))
+        keep = item.get("keep", True)
+        u = float(item.get("uniqueness_score", 0.5))
+        t = float(item.get("source_trust_score", 0.5))
+        verdicts.append((
+            bool(same and conf >= min_conf),
+            bool(keep and u >= min_uniqueness and t >= min_trust),
+        ))
+    return verdicts, parsed
+
+
+def split_screening_verdicts(
+    image_paths: list[Path],
+    verdicts: list[tuple[bool, bool]],
+) -> tuple[list[Path], list[Path], list[Path], list[Path]]:
+    """
+    (zaakceptowane przez matching, odrzucone przez matching, zostawione, odrzucone przez jakość).
+    Jak w trybie dwuetapowym: gdy matching odrzuci wszystko, ocena jakości obejmuje wszystkie zdjęcia.
+    """
+    matched = [p for p, (m, _) in zip(image_paths, verdicts) if m]
+    rejected_match = [p for p, (m, _) in zip(image_paths, verdicts) if not m]
+    candidates = [(p, q) for p, (m, q) in zip(image_paths, verdicts) if m or not matched]
+    keep = [p for p, q in candidates if q]
+    rejected_quality = [p for p, q in candidates if not q]
+    return matched, rejected_match, keep, rejected_quality
+
+
+async def screen_batch_async(
+    batch: list[Path],
+    user: str,
+) -> tuple[list[tuple[bool, bool]], dict[str, Any] | None]:
+    """Jeden batch (też w trybie strumieniowym): (przeszło matching, przeszło jakość) dla każdego zdjęcia + odpowiedź."""
+    try:
+        response = await message_with_images_async(SYSTEM_SCREENING, user, batch, max_tokens=MAX_TOKENS)
+    except Exception as e:
+        logger.warning("Image screening API error: %s", e)
+        response = None
+    return apply_screening_response(batch, response)
+
+
+async def screen_images_async(
+    image_paths: list[Path],
+    product_name: str,
+    ean: str | None = None,
+    source_domains: list[str] | None = None,
+) -> tuple[list[Path], list[Path], list[Path], list[Path], dict[str, Any]]:
+    """
+    Matching + jakość w jednym wywołaniu na batch (batche równolegle, wyniki w kolejności zdjęć).
+
+    Zwraca: (zaakceptowane przez matching, odrzucone przez matching,
+             zostawione po ocenie jakości, odrzucone przez jakość, surowe odpowiedzi).
+    Jak w trybie dwuetapowym: gdy matching odrzuci wszystko, ocena jakości obejmuje wszystkie zdjęcia.
+    """
+    if not image_paths:
+        return [], [], [], [], {}
+
+    user = screening_user_text(product_name, ean, source_domains)
+    batches = [image_paths[start : start + BATCH_SIZE] for start in range(0, len(image_paths), BATCH_SIZE)]
+    verdicts: list[tuple[bool, bool]] = []
+    all_parsed: list[dict[str, Any]] = []
+    for batch_verdicts, parsed in await map_concurrent_async(lambda b: screen_batch_async(b, user), batches):
+        verdicts.extend(batch_verdicts)
+        if parsed is not None:
+            all_parsed.append(parsed)
+
+    matched, rejected_match, keep, rejected_quality = split_screening_verdicts(image_paths, verdicts)
+    return matched, rejected_match, keep, rejected_quality, {"batches": all_parsed}
+
+
+def screen_images(
+    image_paths: list[Path],
+    product_name: str,
+    ean: str | None = None,
+    source_domains: list[str] | None = None,
+) -> tuple[list[Path], list[Path], list[Path], list[Path], dict[str, Any]]:
+    """Jak screen_images_async, poza pętlą zdarzeń (run_with_claude)."""
+    return run_with_claude(screen_images_async(image_paths, product_name, ean, source_domains))
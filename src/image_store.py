@@ -1,10 +1,16 @@
 """
-Pomniejszanie zdjęć do zapisu w bazie (tylko te wykorzystane w pipeline).
+Pomniejszanie zdjęć do zapisu w bazie (tylko te wykorzystane w pipeline)
+oraz do wysyłki do Claude Vision (limit boku, megapikseli i bajtów).
+
+Duże JPEG-i dekodowane w zmniejszonej skali (draft – skalowanie DCT 1/2…1/8), pozostałe formaty
+pomniejszane wstępnie przez reduce(); końcowe skalowanie LANCZOS. Obrazy powyżej IMAGE_MAX_PIXELS
+nie są dekodowane. Zapis do bazy: JPEG, WebP lub AVIF (IMAGE_STORE_FORMAT, jakość per format).
 """
 from __future__ import annotations
 
 import io
 import logging
+import math
 from pathlib import Path
 from typing import Optional
 
@@ -14,33 +20,225 @@ import config
 
 logger = logging.getLogger(__name__)
 
+# formaty przyjmowane przez Claude bez konwersji (PIL format → media type)
+_VISION_PASSTHROUGH = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "GIF": "image/gif",
+}
+_MIN_VISION_QUALITY = 50
+# draft / reduce() do co najmniej _REDUCING_GAP × rozmiar docelowy, dalej LANCZOS –
+# wynik praktycznie nieodróżnialny od pełnego LANCZOS z oryginału, wielokrotnie szybciej
+_REDUCING_GAP = 2.0
+
+# formaty zapisu do bazy: nazwa → (format PIL, content type, nazwa ustawienia jakości w config)
+_STORE_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg", "IMAGE_STORE_QUALITY"),
+    "webp": ("WEBP", "image/webp", "IMAGE_STORE_WEBP_QUALITY"),
+    "avif": ("AVIF", "image/avif", "IMAGE_STORE_AVIF_QUALITY"),
+}
+_unsupported_warned: set[str] = set()
+
+
+def check_image_size(img: Image.Image) -> None:
+    """Odrzuca obraz o liczbie pikseli > IMAGE_MAX_PIXELS (przed dekodowaniem – rozmiar z nagłówka)."""
+    w, h = img.size
+    if w * h > config.IMAGE_MAX_PIXELS:
+        raise Image.DecompressionBombError(
+            f"Image {w}x{h} exceeds IMAGE_MAX_PIXELS ({config.IMAGE_MAX_PIXELS})"
+        )
+
+
+def store_format(name: str | None = None) -> str:
+    """Format zapisu do bazy (jpeg/webp/avif); nieznany lub bez kodeka w Pillow → jpeg."""
+    name = (name or config.IMAGE_STORE_FORMAT or "jpeg").lower()
+    name = "jpeg" if name == "jpg" else name
+    if name in _STORE_FORMATS and _encoder_available(_STORE_FORMATS[name][0]):
+        return name
+    if name not in _unsupported_warned:
+        _unsupported_warned.add(name)
+        logger.warning("Image store format %r not available in Pillow, using JPEG", name)
+    return "jpeg"
+
+
+def _encoder_available(pil_format: str) -> bool:
+    Image.init()
+    return pil_format in Image.SAVE
+
+
+def _to_rgb(img: Image.Image) -> Image.Image:
+    """RGB bez przezroczystości – przezroczyste tło zamieniane na białe (typowe packshoty)."""
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    return img.convert("RGB")
+
+
+def _fit_size(w: int, h: int, max_px: int, max_pixels: int | None = None) -> tuple[int, int]:
+    """Wymiary po pomniejszeniu z zachowaniem proporcji (nigdy nie powiększa)."""
+    if w > max_px or h > max_px:
+        if w >= h:
+            w, h = max_px, max(1, int(h * max_px / w))
+        else:
+            w, h = max(1, int(w * max_px / h)), max_px
+    if max_pixels and w * h > max_pixels:
+        scale = math.sqrt(max_pixels / (w * h))
+        w, h = max(1, int(w * scale)), max(1, int(h * scale))
+    return w, h
+
+
+def _encode_jpeg(img: Image.Image, quality: int) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=quality, optimize=True)
+    return buf.getvalue()
+
+
+def _encode(img: Image.Image, fmt: str, quality: int) -> bytes:
+    if fmt == "jpeg":
+        return _encode_jpeg(img, quality)
+    buf = io.BytesIO()
+    if fmt == "webp":
+        img.save(buf, format="WEBP", quality=quality, method=4)
+    else:
+        img.save(buf, format=_STORE_FORMATS[fmt][0], quality=quality)
+    return buf.getvalue()
+
 
 def resize_image_for_storage(
     path: Path | str,
     max_px: Optional[int] = None,
     quality: Optional[int] = None,
+    fmt: Optional[str] = None,
 ) -> tuple[bytes, str, int, int]:
     """
     Czyta obraz z dysku, pomniejsza (z zachowaniem proporcji) i zwraca (bytes, content_type, width, height).
 
     max_px: maksymalna długość dłuższego boku (domyślnie z config).
-    quality: jakość JPEG 1–100 (domyślnie z config).
-    Zawsze zwraca JPEG (content_type image/jpeg) dla mniejszego rozmiaru.
+    quality: jakość 1–100 (domyślnie z config dla danego formatu).
+    fmt: jpeg / webp / avif (domyślnie IMAGE_STORE_FORMAT).
+    Duży JPEG dekodowany od razu w zmniejszonej skali (draft); obraz > IMAGE_MAX_PIXELS – wyjątek.
     """
     path = Path(path)
-    max_px = max_px or config.IMAGE_STORE_MAX_PX
-    quality = quality or config.IMAGE_STORE_QUALITY
     if not path.exists():
         raise FileNotFoundError(str(path))
-    img = Image.open(path).convert("RGB")
+    rgb = decode_rgb(path, storage_max_px=max_px)
+    return storage_variant(rgb, max_px=max_px, quality=quality, fmt=fmt)
+
+
+def decode_rgb(source: Path | str | bytes, storage_max_px: Optional[int] = None) -> Image.Image:
+    """
+    Dekoduje obraz do RGB – wspólne źródło wariantu do bazy i dla Claude (resize_image_for_storage
+    i preprocessing dają te same bajty, więc ten sam sha256 w image_blobs).
+
+    Duży JPEG dekodowany w zmniejszonej skali (draft) do _REDUCING_GAP × większy z rozmiarów
+    docelowych (baza: storage_max_px / IMAGE_STORE_MAX_PX, Claude: CLAUDE_IMAGE_MAX_PX
+    i CLAUDE_IMAGE_MAX_MEGAPIXELS). Obraz > IMAGE_MAX_PIXELS – wyjątek.
+    """
+    fp = io.BytesIO(source) if isinstance(source, bytes) else Path(source)
+    with Image.open(fp) as img:
+        check_image_size(img)
+        w, h = img.size
+        store_w, store_h = _fit_size(w, h, storage_max_px or config.IMAGE_STORE_MAX_PX)
+        vision_w, vision_h = _fit_size(
+            w, h, config.CLAUDE_IMAGE_MAX_PX, int(config.CLAUDE_IMAGE_MAX_MEGAPIXELS * 1_000_000)
+        )
+        target = (max(store_w, vision_w), max(store_h, vision_h))
+        if img.format == "JPEG" and target != (w, h):
+            img.draft("RGB", (int(target[0] * _REDUCING_GAP), int(target[1] * _REDUCING_GAP)))
+        return _to_rgb(img)
+
+
+def storage_variant(
+    rgb: Image.Image,
+    max_px: Optional[int] = None,
+    quality: Optional[int] = None,
+    fmt: Optional[str] = None,
+) -> tuple[bytes, str, int, int]:
+    """Wariant do bazy z już zdekodowanego obrazu RGB (jak resize_image_for_storage)."""
+    max_px = max_px or config.IMAGE_STORE_MAX_PX
+    fmt = store_format(fmt)
+    _, content_type, quality_setting = _STORE_FORMATS[fmt]
+    quality = quality or getattr(config, quality_setting)
+    img = rgb
     w, h = img.size
-    if w > max_px or h > max_px:
-        if w >= h:
-            new_w, new_h = max_px, int(h * max_px / w)
-        else:
-            new_w, new_h = int(w * max_px / h), max_px
-        img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+    new_w, new_h = _fit_size(w, h, max_px)
+    if (new_w, new_h) != (w, h):
+        img = img.resize((new_w, new_h), Image.Resampling.LANCZOS, reducing_gap=_REDUCING_GAP)
         w, h = img.size
-    buf = io.BytesIO()
-    img.save(buf, format="JPEG", quality=quality, optimize=True)
-    return buf.getvalue(), "image/jpeg", w, h
+    return _encode(img, fmt, quality), content_type, w, h
+
+
+def prepare_image_for_vision(
+    source: Path | str | bytes,
+    max_px: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    quality: Optional[int] = None,
+) -> tuple[bytes, str, int, int]:
+    """
+    Przygotowuje obraz do wysłania do Claude. Zwraca (bytes, media_type, width, height).
+    source: ścieżka do pliku albo jego zawartość (bytes – bez ponownego czytania z dysku).
+
+    Plik mieszczący się w limitach (bok, megapiksele, bajty) w formacie akceptowanym przez API
+    idzie bez zmian. W pozostałych przypadkach: pomniejszenie jak w resize_image_for_storage
+    (max_px / CLAUDE_IMAGE_MAX_MEGAPIXELS) i JPEG; gdy wynik przekracza max_bytes – najpierw
+    niższa jakość (do 50), potem dalsze zmniejszanie wymiarów.
+    """
+    if isinstance(source, bytes):
+        raw = source
+        name = "<bytes>"
+    else:
+        path = Path(source)
+        if not path.exists():
+            raise FileNotFoundError(str(path))
+        raw = path.read_bytes()
+        name = path.name
+    img = Image.open(io.BytesIO(raw))
+    check_image_size(img)
+    return vision_variant(img, raw, max_px=max_px, max_bytes=max_bytes, quality=quality, name=name)
+
+
+def vision_variant(
+    img: Image.Image,
+    raw: bytes,
+    max_px: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    quality: Optional[int] = None,
+    rgb: Image.Image | None = None,
+    name: str = "<bytes>",
+) -> tuple[bytes, str, int, int]:
+    """
+    Wariant dla Claude z otwartego obrazu img (raw – jego plik); jak prepare_image_for_vision.
+    rgb: obraz już zdekodowany do RGB (wspólny z wariantem do bazy) – bez ponownej konwersji.
+    """
+    max_px = max_px or config.CLAUDE_IMAGE_MAX_PX
+    max_bytes = max_bytes or config.CLAUDE_IMAGE_MAX_BYTES
+    quality = quality or config.CLAUDE_IMAGE_QUALITY
+    max_pixels = int(config.CLAUDE_IMAGE_MAX_MEGAPIXELS * 1_000_000)
+    w, h = img.size
+    fit_w, fit_h = _fit_size(w, h, max_px, max_pixels)
+    media_type = _VISION_PASSTHROUGH.get(img.format or "")
+    if media_type and (fit_w, fit_h) == (w, h) and len(raw) <= max_bytes:
+        return raw, media_type, w, h
+
+    img = rgb if rgb is not None else _to_rgb(img)
+    if (fit_w, fit_h) != (w, h):
+        img = img.resize((fit_w, fit_h), Image.Resampling.LANCZOS)
+    data = _encode_jpeg(img, quality)
+    q = quality
+    while len(data) > max_bytes and q > _MIN_VISION_QUALITY:
+        q = max(_MIN_VISION_QUALITY, q - 10)
+        data = _encode_jpeg(img, q)
+    while len(data) > max_bytes and min(img.size) > 64:
+        img = img.resize(
+            (max(1, int(img.width * 0.75)), max(1, int(img.height * 0.75))),
+            Image.Resampling.LANCZOS,
+        )
+        data = _encode_jpeg(img, q)
+    logger.debug(
+        "Vision payload %s: %sx%s → %sx%s, %s bytes (q=%s)",
+        name, w, h, img.width, img.height, len(data), q,
+    )
+    return data, "image/jpeg", img.width, img.height
@@ -1,27 +1,111 @@
 """
-Główny pipeline: EAN → źródła (SerpAPI/Google) → pobieranie → analiza kosztów →
-AI matching → filtrowanie jakości → analiza zdjęć → weryfikacja opisu (EAN, wymiary) →
+Główny pipeline: EAN → źródła (SerpAPI/Google) → pobieranie → deduplikacja (perceptual hash) →
+analiza kosztów → AI matching → filtrowanie jakości → analiza zdjęć → weryfikacja opisu (EAN, wymiary) →
 zapis do plików i do bazy (Vercel Postgres); w bazie tylko pomniejszone zdjęcia wykorzystane.
+
+Implementacja na asyncio (run_pipeline_async): niezależne kroki nakładają się – wyniki organic
+równolegle z wyszukiwaniem obrazów, pobieranie startuje z pierwszą partią wyników, zapis runu
+do bazy w tle podczas matchingu. run_pipeline to synchroniczna nakładka (asyncio.run).
+Tryb strumieniowy (streaming / STREAMING_STAGES): zdjęcia przechodzą do matchingu i jakości
+w miarę pobierania (src.stage_stream).
 """
 from __future__ import annotations
 
+import asyncio
+import base64
 import json
 import logging
+import math
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
-from typing import Any
+from typing import Any, Awaitable, Callable, Iterable
 
 import config
 from src.ean_lookup import lookup_product, ProductInfo
-from src.source_search import search_image_sources, ImageSource
-from src.image_downloader import download_sources
+from src.source_search import search_image_sources_async, ImageSource
+from src.image_downloader import DownloadResult, download_images_async
+from src.claude_client import image_payload_scope, register_image_payload, run_with_claude, usage_scope
+from src.image_dedup import NearDuplicateIndex, dedupe_images, image_signature
+from src.image_preprocess import PreprocessedImage, image_key, preprocess_async, preprocess_images_async
 from src.cost_estimate import estimate_generation_cost
-from src.product_matching import filter_matching_images
-from src.quality_filter import filter_quality
-from src.image_analyzer import analyze_images_for_description
-from src.description_verification import verify_description_and_extract_data
+from src.product_matching import filter_matching_images_async
+from src.quality_filter import filter_quality_async
+from src.image_screening import screen_images_async, split_screening_verdicts
+from src.image_analyzer import analyze_images_for_description_async
+from src.description_verification import (
+    generate_verified_description_async,
+    verify_description_and_extract_data_async,
+)
+from src.run_checkpoint import RunCheckpoint
+from src import image_screening, product_matching, quality_filter, stage_stream
 
 logger = logging.getLogger(__name__)
 
+# Generowanie opisu: "two_step" = analiza + osobna weryfikacja, "single" = jedno wywołanie
+GENERATION_MODES = ("two_step", "single")
+
+
+@dataclass
+class PreparedRun:
+    """
+    Stan runu po etapach bez Claude (lookup, wyszukiwanie, pobieranie, deduplikacja, kosztorys).
+    finished=True – run zakończony wcześniej (błąd / brak zdjęć), wynik już zapisany.
+    Serializowalny (to_dict / from_dict) – tryb wsadowy (src.bulk) trzyma go w pliku stanu.
+    """
+    result: dict[str, Any]
+    out_dir: Path | None = None
+    product_name: str = ""
+    product_ean: str = ""
+    paths: list[Path] = field(default_factory=list)
+    source_domains: list[str] = field(default_factory=list)
+    path_to_url: dict[str, str] = field(default_factory=dict)
+    run_id: str | None = None
+    finished: bool = False
+    checkpoint: RunCheckpoint | None = field(default=None, repr=False, compare=False)
+    # zapis runu (kosztorys) do bazy w tle – run_id znany po wait_for_run_id()
+    run_id_task: asyncio.Task | None = field(default=None, repr=False, compare=False)
+    # wyniki preprocessingu (image_key → PreprocessedImage); tylko w pamięci, bez serializacji
+    preprocessed: dict[str, PreprocessedImage] = field(default_factory=dict, repr=False, compare=False)
+
+    async def wait_for_run_id(self) -> str | None:
+        if self.run_id_task is not None:
+            task, self.run_id_task = self.run_id_task, None
+            self.run_id = await task
+            if self.run_id:
+                self.result["run_id"] = self.run_id
+                if self.checkpoint is not None:
+                    self.checkpoint.put("db_run", {"ean": self.result["ean"]}, {"run_id": self.run_id})
+        return self.run_id
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "result": self.result,
+            "out_dir": str(self.out_dir) if self.out_dir else None,
+            "product_name": self.product_name,
+            "product_ean": self.product_ean,
+            "paths": [str(p) for p in self.paths],
+            "source_domains": self.source_domains,
+            "path_to_url": self.path_to_url,
+            "run_id": self.run_id,
+            "finished": self.finished,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> PreparedRun:
+        return cls(
+            result=data["result"],
+            out_dir=Path(data["out_dir"]) if data.get("out_dir") else None,
+            product_name=data.get("product_name", ""),
+            product_ean=data.get("product_ean", ""),
+            paths=[Path(p) for p in data.get("paths", [])],
+            source_domains=data.get("source_domains", []),
+            path_to_url=data.get("path_to_url", {}),
+            run_id=data.get("run_id"),
+            finished=data.get("finished", False),
+        )
+
 
 def run_pipeline(
     ean: str,
@@ -30,22 +114,424 @@ def run_pipeline(
     output_subdir: str | None = None,
     estimate_only: bool = False,
     save_to_db: bool = True,
+    fused_filter: bool | None = None,
+    generation_mode: str | None = None,
+    resume: bool = False,
+    streaming: bool | None = None,
 ) -> dict[str, Any]:
     """
     Pełny przebieg dla jednego EAN.
 
     1. Identyfikacja produktu po EAN
     2. Wyszukanie źródeł (SerpAPI Google Images + organic, fallback DuckDuckGo)
-    3. Pobranie min. min_images zdjęć
+    3. Pobranie min. min_images zdjęć; lokalne usunięcie prawie-duplikatów (perceptual hash)
     4. Analiza kosztów przed generowaniem (cost_estimate); opcjonalnie zapis runu do bazy
     5. Jeśli estimate_only=True – zwraca wynik z cost_estimate i (opcjonalnie) run_id, bez wywołań Claude
     6. AI matching → filtrowanie jakości → analiza zdjęć → weryfikacja opisu
     7. Zapis do data/output/ oraz do bazy (run + tylko pomniejszone zdjęcia wykorzystane)
+
+    fused_filter: matching + jakość w jednym wywołaniu na batch (domyślnie config.FUSED_FILTERING).
+    generation_mode: "two_step" (analiza + weryfikacja) lub "single" (jedno wywołanie);
+        domyślnie config.GENERATION_MODE.
+    resume: pomiń etapy, których wejścia nie zmieniły się od poprzedniego runu
+        (checkpoint etapów w {output_dir}/stages.json, src.run_checkpoint).
+    streaming: matching / jakość startują w trakcie pobierania (domyślnie config.STREAMING_STAGES).
     """
-    min_images = min_images or config.MIN_IMAGES_TO_FETCH
+    return run_with_claude(run_pipeline_async(
+        ean,
+        min_images=min_images,
+        output_subdir=output_subdir,
+        estimate_only=estimate_only,
+        save_to_db=save_to_db,
+        fused_filter=fused_filter,
+        generation_mode=generation_mode,
+        resume=resume,
+        streaming=streaming,
+    ))
+
+
+async def run_pipeline_async(
+    ean: str,
+    *,
+    min_images: int | None = None,
+    output_subdir: str | None = None,
+    estimate_only: bool = False,
+    save_to_db: bool = True,
+    fused_filter: bool | None = None,
+    generation_mode: str | None = None,
+    resume: bool = False,
+    streaming: bool | None = None,
+) -> dict[str, Any]:
+    """
+    Pełny przebieg dla jednego EAN (asyncio; ten sam słownik wyniku co run_pipeline).
+    Wiele EAN-ów może być w toku w jednej pętli zdarzeń (np. asyncio.gather).
+
+    1. Identyfikacja produktu po EAN
+    2. Wyszukanie źródeł (SerpAPI Google Images + organic, fallback DuckDuckGo)
+    3. Pobranie min. min_images zdjęć; lokalne usunięcie prawie-duplikatów (perceptual hash)
+    4. Analiza kosztów przed generowaniem (cost_estimate); opcjonalnie zapis runu do bazy
+    5. Jeśli estimate_only=True – zwraca wynik z cost_estimate i (opcjonalnie) run_id, bez wywołań Claude
+    6. AI matching → filtrowanie jakości → analiza zdjęć → weryfikacja opisu
+    7. Zapis do data/output/ oraz do bazy (run + tylko pomniejszone zdjęcia wykorzystane)
+
+    fused_filter: matching + jakość w jednym wywołaniu na batch (domyślnie config.FUSED_FILTERING).
+    generation_mode: "two_step" (analiza + weryfikacja) lub "single" (jedno wywołanie);
+        domyślnie config.GENERATION_MODE.
+    resume: pomiń etapy, których wejścia nie zmieniły się od poprzedniego runu
+        (checkpoint etapów w {output_dir}/stages.json, src.run_checkpoint).
+    streaming: pobrane zdjęcia trafiają do batchy matchingu (i dalej jakości) od razu, bez czekania
+        na koniec pobierania (src.stage_stream; domyślnie config.STREAMING_STAGES).
+        Nie dotyczy estimate_only ani resume (etapy z checkpointu – tryb wsadowy).
+    """
+    if fused_filter is None:
+        fused_filter = config.FUSED_FILTERING
+    generation_mode = resolve_generation_mode(generation_mode)
+    if streaming is None:
+        streaming = config.STREAMING_STAGES
+    streaming = streaming and not estimate_only and not resume
+
+    # 5–7) Wywołania Claude – każdy obraz przygotowany (pomniejszenie + base64) raz na run
+    with image_payload_scope(), usage_scope() as usage:
+        if streaming:
+            prep, keep = await _prepare_and_filter_streaming(
+                ean,
+                min_images=min_images,
+                output_subdir=output_subdir,
+                save_to_db=save_to_db,
+                fused_filter=fused_filter,
+                generation_mode=generation_mode,
+            )
+            if prep.finished:
+                return prep.result
+        else:
+            prep = await prepare_run_async(
+                ean,
+                min_images=min_images,
+                output_subdir=output_subdir,
+                save_to_db=save_to_db,
+                fused_filter=fused_filter,
+                generation_mode=generation_mode,
+                resume=resume,
+            )
+            if prep.finished:
+                return prep.result
+            if estimate_only:
+                await prep.wait_for_run_id()
+                _save_result(prep.result, prep.out_dir)
+                return prep.result
+            keep = await _filter_images(prep, fused_filter)
+        result = prep.result
+
+        # 6–7) Opis bazowy z zdjęć + weryfikacja opisu, EAN, wymiary z zdjęć
+        warnings: list[str] = []
+        base_desc, verified = await _describe(
+            keep, prep.product_name, generation_mode, checkpoint=prep.checkpoint, warnings=warnings
+        )
+        result["base_description"] = base_desc
+        result["verified"] = verified
+        if warnings:
+            result["warnings"] = warnings
+    result["claude_usage"] = usage.to_dict()
+
+    await finish_run_async(prep, keep, save_to_db=save_to_db)
+    return result
+
+
+async def _filter_images(prep: PreparedRun, fused_filter: bool) -> list[Path]:
+    """5) AI matching + jakość (wsadowo, po pobraniu wszystkich zdjęć); zwraca zdjęcia do opisu."""
+    result, paths, ckpt = prep.result, prep.paths, prep.checkpoint
+    if fused_filter:
+        # matching + jakość w jednym wywołaniu na batch
+        async def screen() -> tuple[dict[str, Any], bool]:
+            m, rm, k, rq, raw = await screen_images_async(
+                paths, prep.product_name, prep.product_ean, source_domains=prep.source_domains
+            )
+            out = {"matched": m, "rejected_matching": rm, "keep": k, "rejected_quality": rq}
+            return _paths_to_str(out), _all_batches_ok(raw, paths, image_screening.BATCH_SIZE)
+
+        screened = await _run_stage(ckpt, "screening", _screening_inputs(prep, paths), screen)
+        matched = record_matching(
+            result, paths, _str_to_paths(screened["matched"]), _str_to_paths(screened["rejected_matching"])
+        )
+        return record_quality(
+            result, matched, _str_to_paths(screened["keep"]), _str_to_paths(screened["rejected_quality"])
+        )
+
+    # AI matching – ten sam produkt
+    async def match() -> tuple[dict[str, Any], bool]:
+        m, rm, raw = await filter_matching_images_async(paths, prep.product_name, prep.product_ean)
+        out = {"matched": m, "rejected": rm}
+        return _paths_to_str(out), _all_batches_ok(raw, paths, product_matching.BATCH_SIZE)
+
+    matching = await _run_stage(ckpt, "matching", _matching_inputs(prep, paths), match)
+    matched = record_matching(
+        result, paths, _str_to_paths(matching["matched"]), _str_to_paths(matching["rejected"])
+    )
+
+    # Jakość – odrzuć wątpliwe i niewnoszące unikalności
+    async def quality() -> tuple[dict[str, Any], bool]:
+        k, rq, raw = await filter_quality_async(matched, prep.product_name, source_domains=prep.source_domains)
+        out = {"keep": k, "rejected": rq}
+        return _paths_to_str(out), _all_batches_ok(raw, matched, quality_filter.BATCH_SIZE)
+
+    quality_out = await _run_stage(ckpt, "quality", _quality_inputs(prep, matched), quality)
+    return record_quality(
+        result, matched, _str_to_paths(quality_out["keep"]), _str_to_paths(quality_out["rejected"])
+    )
+
+
+async def _prepare_and_filter_streaming(
+    ean: str,
+    *,
+    min_images: int | None,
+    output_subdir: str | None,
+    save_to_db: bool,
+    fused_filter: bool,
+    generation_mode: str,
+) -> tuple[PreparedRun, list[Path]]:
+    """
+    Kroki 1–5 w trybie strumieniowym: pobrane zdjęcia (po deduplikacji przyrostowej) trafiają
+    do batchy matchingu, zaakceptowane – do batchy jakości, zanim skończy się pobieranie.
+    Wynik jak w trybie wsadowym: kolejność zdjęć wg URL-i, te same pola result i checkpointy etapów.
+    Deduplikacja zostawia te same zdjęcia co dedupe_images: większa kopia pobrana później zastępuje
+    przyjętą – zastąpiona, jeszcze w buforze batcha, nie jest wysyłana, a ocenionej wcześniej
+    werdykty są pomijane.
+    """
+    prep, images_subdir = _begin_run(ean, output_subdir, resume=False)
+    if prep.finished:
+        return prep, []
+    await _lookup_stage(prep)
+
+    downloaded: asyncio.Queue = asyncio.Queue()
+    inbox: asyncio.Queue = asyncio.Queue()
+    index = NearDuplicateIndex() if config.IMAGE_DEDUP_ENABLED else None
+
+    def on_download(d: DownloadResult) -> None:
+        if d.path is not None:
+            # preprocessing startuje od razu (pula procesów); deduplikacja czeka na wynik w kolejności pobrań
+            pending = asyncio.ensure_future(preprocess_async(d.path)) if config.IMAGE_PREPROCESS_ENABLED else None
+            downloaded.put_nowait((d.path, d.index, pending))
+
+    async def dedupe() -> None:
+        try:
+            while (item := await downloaded.get()) is not stage_stream.END:
+                path, order, pending = item
+                image = await pending if pending is not None else None
+                if image is not None:
+                    prep.preprocessed[image_key(path)] = image
+                    _register_preprocessed([image])
+                if index is None:
+                    new = True
+                else:
+                    sig = image.signature if image is not None else await asyncio.to_thread(image_signature, path)
+                    # order = pozycja URL-a: remis w grupie rozstrzygany jak w dedupe_images
+                    new = sig is None or index.add(path, sig, order=order)
+                if new:
+                    inbox.put_nowait(path)
+        finally:
+            inbox.put_nowait(stage_stream.END)
+
+    superseded = (lambda path: not index.is_kept(path)) if index is not None else None
+    tasks = [
+        asyncio.create_task(dedupe()),
+        asyncio.create_task(_stream_filters(prep, inbox, fused_filter, drop=superseded)),
+    ]
+    try:
+        paths = await _collect_images(prep, min_images, images_subdir, on_download=on_download)
+        downloaded.put_nowait(stage_stream.END)
+        _, filtered = await asyncio.gather(*tasks)
+    finally:
+        for t in tasks:
+            t.cancel()
+    if prep.finished:
+        return prep, []
+
+    result, ckpt = prep.result, prep.checkpoint
+    if index is not None:
+        duplicates = index.dropped()
+        kept = [p for p in paths if p not in duplicates]
+        ckpt.put("dedup", _dedup_inputs(prep, paths), {"keep": [str(p) for p in kept], "removed": len(duplicates)})
+        result["duplicates_removed"] = len(duplicates)
+        if duplicates:
+            logger.info("Dedup (streaming): %s near-duplicates removed", len(duplicates))
+        paths = kept
+    result["after_dedup"] = len(paths)
+    prep.paths = paths
+    _estimate_cost(prep, save_to_db=save_to_db, fused_filter=fused_filter, generation_mode=generation_mode)
+
+    # werdykty w kolejności zdjęć (jak w trybie wsadowym), nie w kolejności ukończenia batchy;
+    # bez zdjęć ocenionych, zanim zastąpiła je większa kopia
+    position = {p: i for i, p in enumerate(paths)}
+
+    def ordered(items: list[Path]) -> list[Path]:
+        return sorted((p for p in items if p in position), key=position.__getitem__)
+
+    if fused_filter:
+        verdicts, ok = filtered
+        m, rm, k, rq = split_screening_verdicts(paths, [verdicts[p] for p in paths])
+        if ok:
+            out = {"matched": m, "rejected_matching": rm, "keep": k, "rejected_quality": rq}
+            ckpt.put("screening", _screening_inputs(prep, paths), _paths_to_str(out))
+        matched = record_matching(result, paths, m, rm)
+        return prep, record_quality(result, matched, k, rq)
+
+    matching, quality = filtered
+    m, rm = ordered(matching.accepted), ordered(matching.rejected)
+    if matching.all_batches_ok:
+        ckpt.put("matching", _matching_inputs(prep, paths), _paths_to_str({"matched": m, "rejected": rm}))
+    matched = record_matching(result, paths, m, rm)
+    if not m:
+        # matching odrzucił wszystko – jakość oceniana na wszystkich zdjęciach (jak w trybie wsadowym)
+        k, rq, raw = await filter_quality_async(matched, prep.product_name, source_domains=prep.source_domains)
+        quality_ok = _all_batches_ok(raw, matched, quality_filter.BATCH_SIZE)
+    else:
+        k, rq, quality_ok = ordered(quality.accepted), ordered(quality.rejected), quality.all_batches_ok
+    if quality_ok:
+        ckpt.put("quality", _quality_inputs(prep, matched), _paths_to_str({"keep": k, "rejected": rq}))
+    return prep, record_quality(result, matched, k, rq)
+
+
+async def _stream_filters(
+    prep: PreparedRun,
+    inbox: asyncio.Queue,
+    fused_filter: bool,
+    drop: Callable[[Path], bool] | None = None,
+) -> tuple[Any, Any]:
+    """
+    Etapy Claude na strumieniu zdjęć z inbox (wspólny limit CLAUDE_CONCURRENCY).
+    fused_filter: (ścieżka → werdykt (matching, jakość), czy wszystkie batche OK);
+    inaczej: (StageOutcome matchingu, StageOutcome jakości).
+    drop: zdjęcia pomijane przy wysyłce batcha (zastąpione większą kopią – deduplikacja).
+    """
+    limit = asyncio.Semaphore(max(1, config.CLAUDE_CONCURRENCY))
+    linger_s = config.STREAM_LINGER_S
+
+    if fused_filter:
+        verdicts: dict[Path, tuple[bool, bool]] = {}
+
+        async def screen(batch: list[Path]) -> tuple[list[Path], list[Path], dict[str, Any] | None]:
+            # domeny źródeł znane do tej pory (wyszukiwanie zwykle kończy się przed pierwszym batchem)
+            user = image_screening.screening_user_text(prep.product_name, prep.product_ean, prep.source_domains)
+            batch_verdicts, parsed = await image_screening.screen_batch_async(batch, user)
+            verdicts.update(zip(batch, batch_verdicts))
+            return batch, [], parsed
+
+        outcome = await stage_stream.run_stage(
+            inbox, screen, batch_size=image_screening.BATCH_SIZE, linger_s=linger_s, limit=limit, name="screening",
+            drop=drop,
+        )
+        return verdicts, outcome.all_batches_ok
+
+    matched: asyncio.Queue = asyncio.Queue()
+    matching_user = product_matching.matching_user_text(prep.product_name, prep.product_ean)
+
+    async def quality(batch: list[Path]) -> tuple[list[Path], list[Path], dict[str, Any] | None]:
+        user = quality_filter.quality_user_text(prep.product_name, prep.source_domains)
+        return await quality_filter.quality_batch_async(batch, user)
+
+    return tuple(await asyncio.gather(
+        stage_stream.run_stage(
+            inbox,
+            lambda batch: product_matching.match_batch_async(batch, matching_user),
+            batch_size=product_matching.BATCH_SIZE,
+            linger_s=linger_s,
+            limit=limit,
+            outbox=matched,
+            name="matching",
+            drop=drop,
+        ),
+        stage_stream.run_stage(
+            matched, quality, batch_size=quality_filter.BATCH_SIZE, linger_s=linger_s, limit=limit, name="quality",
+            drop=drop,
+        ),
+    ))
+
+
+def prepare_run(
+    ean: str,
+    *,
+    min_images: int | None = None,
+    output_subdir: str | None = None,
+    save_to_db: bool = True,
+    fused_filter: bool = False,
+    generation_mode: str = "two_step",
+    resume: bool = False,
+) -> PreparedRun:
+    """
+    Kroki 1–4 run_pipeline (bez wywołań Claude): lookup, źródła, pobieranie, deduplikacja,
+    kosztorys i (opcjonalnie) zapis runu do bazy. Każdy etap zapisywany w checkpoincie
+    (prep.checkpoint); resume=True pomija etapy o niezmienionych wejściach.
+    """
+
+    async def prepare() -> PreparedRun:
+        prep = await prepare_run_async(
+            ean,
+            min_images=min_images,
+            output_subdir=output_subdir,
+            save_to_db=save_to_db,
+            fused_filter=fused_filter,
+            generation_mode=generation_mode,
+            resume=resume,
+        )
+        await prep.wait_for_run_id()
+        return prep
+
+    return run_with_claude(prepare())
+
+
+async def prepare_run_async(
+    ean: str,
+    *,
+    min_images: int | None = None,
+    output_subdir: str | None = None,
+    save_to_db: bool = True,
+    fused_filter: bool = False,
+    generation_mode: str = "two_step",
+    resume: bool = False,
+) -> PreparedRun:
+    """
+    Kroki 1–4 run_pipeline (bez wywołań Claude): lookup, źródła, pobieranie, deduplikacja,
+    kosztorys i (opcjonalnie) zapis runu do bazy. Każdy etap zapisywany w checkpoincie
+    (prep.checkpoint); resume=True pomija etapy o niezmienionych wejściach.
+    Wyniki organic pobierane równolegle z obrazami, pobieranie zdjęć startuje z pierwszą partią
+    wyników; zapis runu do bazy idzie w tle (prep.wait_for_run_id()).
+    """
+    prep, images_subdir = _begin_run(ean, output_subdir, resume=resume)
+    if prep.finished:
+        return prep
+    await _lookup_stage(prep)
+    paths = await _collect_images(prep, min_images, images_subdir)
+    if prep.finished:
+        return prep
+
+    # 3a) Preprocessing: każde zdjęcie dekodowane raz (pula procesów) – warianty dla Claude i bazy, dHash
+    if config.IMAGE_PREPROCESS_ENABLED:
+        prep.preprocessed = await preprocess_images_async(paths)
+        _register_preprocessed(prep.preprocessed.values())
+
+    # 3b) Deduplikacja lokalna – mniej zdjęć do matchingu = mniej batchy Claude
+    if config.IMAGE_DEDUP_ENABLED:
+        signatures = {key: image.signature for key, image in prep.preprocessed.items()}
+
+        async def dedupe() -> tuple[dict[str, Any], bool]:
+            kept, duplicates, _ = await asyncio.to_thread(dedupe_images, paths, None, signatures)
+            return {"keep": [str(p) for p in kept], "removed": len(duplicates)}, True
+
+        deduped = await _run_stage(prep.checkpoint, "dedup", _dedup_inputs(prep, paths), dedupe)
+        paths = _str_to_paths(deduped["keep"])
+        prep.result["duplicates_removed"] = deduped["removed"]
+    prep.result["after_dedup"] = len(paths)
+    prep.paths = paths
+
+    _estimate_cost(prep, save_to_db=save_to_db, fused_filter=fused_filter, generation_mode=generation_mode)
+    return prep
+
+
+def _begin_run(ean: str, output_subdir: str | None, resume: bool) -> tuple[PreparedRun, Path | None]:
+    """Katalogi wyniku i zdjęć, szkielet result, checkpoint etapów; (prep, katalog zdjęć)."""
     ean_clean = "".join(c for c in str(ean).strip() if c.isdigit())
     if not ean_clean:
-        return {"error": "Invalid EAN", "ean": ean}
+        return PreparedRun(result={"error": "Invalid EAN", "ean": ean}, finished=True), None
 
     out_dir = config.OUTPUT_DIR
     if output_subdir:
@@ -61,6 +547,7 @@ def run_pipeline(
         "product": None,
         "sources_found": 0,
         "images_downloaded": 0,
+        "after_dedup": 0,
         "after_matching": 0,
         "after_quality_filter": 0,
         "base_description": "",
@@ -68,118 +555,292 @@ def run_pipeline(
         "organic_results": [],
         "output_dir": str(out_dir),
     }
+    ckpt = RunCheckpoint(out_dir, resume=resume)
+    return PreparedRun(result=result, out_dir=out_dir, checkpoint=ckpt), images_subdir
 
-    # 1) Lookup produktu
-    product = lookup_product(ean_clean)
-    result["product"] = {
+
+async def _lookup_stage(prep: PreparedRun) -> None:
+    """1) Lookup produktu."""
+    ean_clean = prep.result["ean"]
+
+    async def lookup() -> tuple[dict[str, Any], bool]:
+        info = await asyncio.to_thread(lookup_product, ean_clean)
+        return {k: v for k, v in asdict(info).items() if k != "raw"}, True
+
+    product = ProductInfo(**await _run_stage(prep.checkpoint, "lookup", {"ean": ean_clean}, lookup))
+    prep.result["product"] = {
         "name": product.name,
         "ean": product.ean,
         "brand": product.brand,
         "categories": product.categories,
     }
+    prep.product_name = product.name
+    prep.product_ean = product.ean
     logger.info("Product: %s (EAN %s)", product.name, product.ean)
 
-    # 2) Źródła: SerpAPI (obrazy + organic) / DuckDuckGo
-    sources, organic = search_image_sources(
-        product.name,
-        ean=product.ean,
-        min_count=min_images,
-    )
+
+async def _collect_images(
+    prep: PreparedRun,
+    min_images: int | None,
+    images_subdir: Path,
+    on_download: Callable[[DownloadResult], None] | None = None,
+) -> list[Path]:
+    """
+    2–3) Źródła i pobieranie; zwraca pobrane zdjęcia w kolejności URL-i.
+    Brak źródeł / zdjęć: błąd w result, wynik zapisany, prep.finished.
+    on_download: każde zakończone pobranie (tryb strumieniowy).
+    """
+    min_images = min_images or config.MIN_IMAGES_TO_FETCH
+    result, ckpt = prep.result, prep.checkpoint
+
+    # 2–3) Źródła: SerpAPI (obrazy + organic) / DuckDuckGo; pobieranie każdej partii wyników od razu
+    search_inputs = {"product": [prep.product_name, prep.product_ean], "min_count": min_images}
+    searched = ckpt.get("search", search_inputs)
+    downloads: list[DownloadResult] | None = None
+    if searched is not None:
+        sources = [ImageSource(**x) for x in searched["sources"]]
+        organic = searched["organic"]
+    else:
+        sources, organic, downloads = await _search_and_download(
+            prep, min_images, images_subdir, on_download=on_download
+        )
+        if sources:
+            ckpt.put("search", search_inputs, {"sources": [asdict(x) for x in sources], "organic": organic})
     result["sources_found"] = len(sources)
     result["organic_results"] = [
         {"title": o.get("title"), "link": o.get("link")} for o in organic[:10]
     ]
     if not sources:
         result["error"] = "No image sources found"
-        _save_result(result, out_dir)
-        return result
+        _save_result(result, prep.out_dir)
+        prep.finished = True
+        return []
 
     urls = [s.image_url for s in sources]
-    source_domains = [s.source_domain for s in sources if s.source_domain]
+    prep.source_domains = [s.source_domain for s in sources if s.source_domain]
+
+    # 3) Pobieranie (równoległe; wyniki w kolejności urls); przy wznowieniu pliki muszą istnieć
+    download_inputs = {"urls": urls, "dir": str(images_subdir)}
+    if downloads is not None:
+        if any(d.path for d in downloads):
+            ckpt.put("download", download_inputs, _downloads_to_json(downloads))
+    else:
+        async def download() -> tuple[list[dict[str, Any]], bool]:
+            done = await download_images_async(urls, images_subdir, on_result=on_download)
+            return _downloads_to_json(done), any(d.path for d in done)
 
-    # 3) Pobieranie
-    paths = download_sources(urls, subdir=output_subdir or ean_clean)
+        downloads = [
+            DownloadResult(**{**d, "path": Path(d["path"]) if d["path"] else None})
+            for d in await _run_stage(
+                ckpt,
+                "download",
+                download_inputs,
+                download,
+                valid=lambda out: all(Path(d["path"]).exists() for d in out if d["path"]),
+            )
+        ]
+    paths = [d.path for d in downloads if d.path is not None]
+    prep.path_to_url = {str(d.path.resolve()): d.url for d in downloads if d.path is not None}
     result["images_downloaded"] = len(paths)
+    result["downloads"] = [d.to_dict() for d in downloads]
     if not paths:
         result["error"] = "No images downloaded"
-        _save_result(result, out_dir)
-        return result
+        _save_result(result, prep.out_dir)
+        prep.finished = True
+    return paths
 
-    # 4) Analiza kosztów przed generowaniem
-    cost_estimate = estimate_generation_cost(len(paths))
+
+def _estimate_cost(
+    prep: PreparedRun,
+    *,
+    save_to_db: bool,
+    fused_filter: bool,
+    generation_mode: str,
+) -> None:
+    """4) Analiza kosztów przed generowaniem; zapis runu do bazy w tle (prep.run_id_task)."""
+    ean_clean, result = prep.result["ean"], prep.result
+    cost_estimate = estimate_generation_cost(
+        len(prep.paths), fused_filter=fused_filter, generation_mode=generation_mode
+    )
     result["cost_estimate"] = cost_estimate
-    run_id: str | None = None
-    if save_to_db and config.POSTGRES_URL:
-        try:
-            from src.db import save_run
-            run_id = save_run(
-                ean_clean,
-                product_name=product.name,
-                cost_estimate=cost_estimate,
-                result=None,
-            )
-            result["run_id"] = run_id
-            logger.info("Cost estimate: ~%.4f USD (run_id=%s)", cost_estimate.get("estimated_usd", 0), run_id)
-        except Exception as e:
-            logger.warning("DB save run (cost estimate) failed: %s", e)
+    saved_run = prep.checkpoint.get("db_run", {"ean": ean_clean}) if save_to_db and config.POSTGRES_URL else None
+    if saved_run:
+        # wznowienie: ten sam run w bazie (wynik dopisany na końcu)
+        prep.run_id = saved_run["run_id"]
+        result["run_id"] = prep.run_id
+    elif save_to_db and config.POSTGRES_URL:
+        # zapis runu w tle – matching nie czeka na bazę
+        prep.run_id_task = asyncio.create_task(
+            _save_run_estimate(ean_clean, prep.product_name, cost_estimate)
+        )
     else:
         logger.info("Cost estimate: ~%.4f USD", cost_estimate.get("estimated_usd", 0))
 
-    if estimate_only:
-        _save_result(result, out_dir)
-        return result
 
-    # 5) AI matching – ten sam produkt
-    matched, rejected_match, _ = filter_matching_images(
-        paths, product.name, product.ean
-    )
-    result["after_matching"] = len(matched)
-    result["rejected_matching_count"] = len(rejected_match)
+async def _search_and_download(
+    prep: PreparedRun,
+    min_images: int,
+    images_subdir: Path,
+    on_download: Callable[[DownloadResult], None] | None = None,
+) -> tuple[list[ImageSource], list[dict[str, Any]], list[DownloadResult]]:
+    """
+    Wyszukiwanie źródeł z pobieraniem każdej partii wyników, gdy tylko napłynie.
+    Jeden deadline etapu (DOWNLOAD_DEADLINE_S od startu) – każda partia dostaje pozostały czas.
+    """
+    tasks: list[asyncio.Task] = []
+    started = 0
+    deadline = time.monotonic() + config.DOWNLOAD_DEADLINE_S
+
+    def start_download(found: list[ImageSource]) -> None:
+        nonlocal started
+        urls = [s.image_url for s in found]
+        prep.source_domains.extend(s.source_domain for s in found if s.source_domain)
+        tasks.append(asyncio.create_task(
+            download_images_async(
+                urls,
+                images_subdir,
+                start_index=started,
+                deadline_s=max(0.0, deadline - time.monotonic()),
+                on_result=on_download,
+            )
+        ))
+        started += len(urls)
+
+    try:
+        sources, organic = await search_image_sources_async(
+            prep.product_name,
+            ean=prep.product_ean,
+            min_count=min_images,
+            on_sources=start_download,
+            include_organic=True,
+        )
+        batches = await asyncio.gather(*tasks)
+    finally:
+        for t in tasks:
+            t.cancel()
+    return sources, organic, [d for batch in batches for d in batch]
+
+
+async def _save_run_estimate(ean: str, product_name: str, cost_estimate: dict[str, Any]) -> str | None:
+    """Zapis runu z kosztorysem do bazy (save_run_async, bez blokowania pętli); None przy błędzie."""
+    try:
+        from src.db import save_run_async
+        run_id = await save_run_async(
+            ean,
+            product_name=product_name,
+            cost_estimate=cost_estimate,
+            result=None,
+        )
+        logger.info("Cost estimate: ~%.4f USD (run_id=%s)", cost_estimate.get("estimated_usd", 0), run_id)
+        return run_id
+    except Exception as e:
+        logger.warning("DB save run (cost estimate) failed: %s", e)
+        return None
+
+
+def _register_preprocessed(images: Iterable[PreprocessedImage]) -> None:
+    """Warianty dla Claude z preprocessingu do rejestru obrazów runu (image_payload_scope)."""
+    for image in images:
+        register_image_payload(Path(image.path), image.sha256, *image.vision)
+
+
+def _downloads_to_json(downloads: list[DownloadResult]) -> list[dict[str, Any]]:
+    return [{**asdict(d), "path": str(d.path) if d.path else None} for d in downloads]
+
+
+def record_matching(
+    result: dict[str, Any],
+    paths: list[Path],
+    matched: list[Path],
+    rejected: list[Path],
+) -> list[Path]:
+    """Zapisuje liczniki matchingu w wyniku; gdy nic nie przeszło – zostawia wszystkie zdjęcia."""
+    result["rejected_matching_count"] = len(rejected)
     if not matched:
         matched = paths  # fallback: zostaw wszystkie
-        result["after_matching"] = len(matched)
+    result["after_matching"] = len(matched)
+    return matched
 
-    # 5) Jakość – odrzuć wątpliwe i niewnoszące unikalności
-    keep, rejected_quality, _ = filter_quality(
-        matched, product.name, source_domains=source_domains
-    )
+
+def record_quality(
+    result: dict[str, Any],
+    matched: list[Path],
+    keep: list[Path],
+    rejected: list[Path],
+) -> list[Path]:
+    """Zapisuje liczniki filtra jakości; gdy nic nie przeszło – zostawia zdjęcia po matchingu."""
     result["after_quality_filter"] = len(keep)
-    result["rejected_quality_count"] = len(rejected_quality)
-    if not keep:
-        keep = matched
-
-    # 6) Opis bazowy z zdjęć
-    base_desc = analyze_images_for_description(keep)
-    result["base_description"] = base_desc
-
-    # 7) Weryfikacja opisu + EAN, wymiary z zdjęć
-    verified = verify_description_and_extract_data(
-        keep,
-        product.name,
-        base_desc,
-        lang=config.OUTPUT_LANG,
-    )
-    result["verified"] = verified
+    result["rejected_quality_count"] = len(rejected)
+    return keep or matched
+
+
+def finish_run(prep: PreparedRun, keep: list[Path], save_to_db: bool = True) -> None:
+    """Zapis do bazy (wynik runu + wykorzystane zdjęcia) i do data/output/."""
+    finish_runs([(prep, keep)], save_to_db=save_to_db)
+
+
+def _runs_to_save(
+    runs: list[tuple[PreparedRun, list[Path]]],
+    save_to_db: bool,
+) -> list[tuple[PreparedRun, list[Path]]]:
+    return [(prep, keep) for prep, keep in runs if prep.run_id] if save_to_db and config.POSTGRES_URL else []
+
 
-    # Zapis do bazy: aktualizacja runu (wynik) + tylko wykorzystane zdjęcia (pomniejszone)
-    if save_to_db and config.POSTGRES_URL and run_id:
+def _run_records(runs: list[tuple[PreparedRun, list[Path]]]) -> list[Any]:
+    """RunRecord (src.db) dla każdego runu: wynik + tylko wykorzystane zdjęcia (pomniejszone)."""
+    from src.db import RunRecord
+    return [
+        RunRecord(
+            ean=prep.result["ean"],
+            result=prep.result,
+            run_id=prep.run_id,
+            image_paths=keep,
+            # URL źródłowy każdego zapisywanego zdjęcia (z wyników pobierania)
+            source_urls=[prep.path_to_url.get(str(Path(p).resolve())) for p in keep],
+            # warianty do bazy z preprocessingu (bez ponownego dekodowania przy zapisie)
+            storage={
+                image_key(p): prep.preprocessed[image_key(p)].storage
+                for p in keep if image_key(p) in prep.preprocessed
+            },
+        )
+        for prep, keep in runs
+    ]
+
+
+def _record_saved(runs: list[tuple[PreparedRun, list[Path]]], saved: list[tuple[str, int]]) -> None:
+    for (prep, _), (run_id, saved_count) in zip(runs, saved):
+        prep.result["images_saved_to_db"] = saved_count
+        logger.info("Saved %s used images to DB (run_id=%s)", saved_count, run_id)
+
+
+def finish_runs(runs: list[tuple[PreparedRun, list[Path]]], save_to_db: bool = True) -> None:
+    """
+    Jak finish_run dla wielu runów (np. EAN-y zakończone w jednym kroku bulk): jeden zapis do bazy –
+    upsert wyników runów i zdjęcia wszystkich runów jednym COPY.
+    """
+    to_save = _runs_to_save(runs, save_to_db)
+    if to_save:
         try:
-            from src.db import save_run, save_used_images
-            save_run(ean_clean, result=result, run_id=run_id)
-            # URL-e w tej samej kolejności co paths (paths[i] ↔ urls[i])
-            path_to_index = {str(Path(p).resolve()): i for i, p in enumerate(paths)}
-            source_urls_for_keep = [
-                urls[path_to_index[str(Path(p).resolve())]] if str(Path(p).resolve()) in path_to_index else None
-                for p in keep
-            ]
-            saved_count = save_used_images(run_id, ean_clean, keep, source_urls_for_keep)
-            result["images_saved_to_db"] = saved_count
-            logger.info("Saved %s used images to DB (run_id=%s)", saved_count, run_id)
+            from src.db import save_runs
+            _record_saved(to_save, save_runs(_run_records(to_save)))
         except Exception as e:
             logger.warning("DB save result/images failed: %s", e)
 
-    _save_result(result, out_dir)
-    return result
+    for prep, _ in runs:
+        _save_result(prep.result, prep.out_dir)
+
+
+async def finish_run_async(prep: PreparedRun, keep: list[Path], save_to_db: bool = True) -> None:
+    """Jak finish_run; czeka na zapis runu w tle, zapis do bazy przez save_runs_async."""
+    await prep.wait_for_run_id()
+    to_save = _runs_to_save([(prep, keep)], save_to_db)
+    if to_save:
+        try:
+            from src.db import save_runs_async
+            _record_saved(to_save, await save_runs_async(_run_records(to_save)))
+        except Exception as e:
+            logger.warning("DB save result/images failed: %s", e)
+    await asyncio.to_thread(_save_result, prep.result, prep.out_dir)
 
 
 def run_pipeline_from_selected_images(
@@ -189,15 +850,41 @@ def run_pipeline_from_selected_images(
     uploaded_images_base64: list[str] | None = None,
     work_dir: Path | str | None = None,
     save_to_db: bool = False,
+    generation_mode: str | None = None,
 ) -> dict[str, Any]:
     """
     Generuje opis na podstawie wybranych przez użytkownika zdjęć (bez wyszukiwania i AI matching).
     image_urls: lista URL-i do pobrania.
     uploaded_images_base64: opcjonalna lista base64 (data URL lub surowy base64) wgranych zdjęć.
     work_dir: katalog roboczy (np. /tmp dla serverless). Domyślnie IMAGES_DIR/ean.
+    generation_mode: "two_step" lub "single" (jak w run_pipeline).
     """
-    import base64
-    import uuid as _uuid
+    return run_with_claude(run_pipeline_from_selected_images_async(
+        ean,
+        product_name,
+        image_urls,
+        uploaded_images_base64=uploaded_images_base64,
+        work_dir=work_dir,
+        save_to_db=save_to_db,
+        generation_mode=generation_mode,
+    ))
+
+
+async def run_pipeline_from_selected_images_async(
+    ean: str,
+    product_name: str,
+    image_urls: list[str],
+    uploaded_images_base64: list[str] | None = None,
+    work_dir: Path | str | None = None,
+    save_to_db: bool = False,
+    generation_mode: str | None = None,
+) -> dict[str, Any]:
+    """
+    Jak run_pipeline_from_selected_images, na asyncio. Wiele produktów w jednej pętli
+    (np. /api/batch_generate) dzieli limit jednoczesnych wywołań Claude (config.CLAUDE_CONCURRENCY);
+    zakresy usage/payload są per zadanie (kontekst asyncio.Task).
+    """
+    generation_mode = resolve_generation_mode(generation_mode)
     ean_clean = "".join(c for c in str(ean).strip() if c.isdigit())
     if not ean_clean:
         return {"error": "Invalid EAN", "ean": ean}
@@ -216,24 +903,11 @@ def run_pipeline_from_selected_images(
     paths: list[Path] = []
     # 1) Pobierz z URL-i
     if image_urls:
-        from src.image_downloader import download_sources_to_dir
-        urls_dir = work_dir / "urls"
-        urls_dir.mkdir(parents=True, exist_ok=True)
-        paths = download_sources_to_dir(image_urls, urls_dir)
+        downloads = await download_images_async(image_urls, work_dir / "urls")
+        paths = [r.path for r in downloads if r.path is not None]
     # 2) Zapisz wgrane (base64) do plików
     if uploaded_images_base64:
-        upload_dir = work_dir / "uploads"
-        upload_dir.mkdir(parents=True, exist_ok=True)
-        for i, b64 in enumerate(uploaded_images_base64):
-            raw = b64.split(",", 1)[-1].strip() if isinstance(b64, str) else b64
-            try:
-                data = base64.b64decode(raw)
-            except Exception:
-                continue
-            ext = ".jpg"
-            path = upload_dir / f"upload_{i:02d}_{_uuid.uuid4().hex[:8]}{ext}"
-            path.write_bytes(data)
-            paths.append(path)
+        paths.extend(await asyncio.to_thread(_write_uploads, uploaded_images_base64, work_dir / "uploads"))
 
     if not paths:
         result["error"] = "No images to analyze (URLs failed or no uploads)"
@@ -241,15 +915,179 @@ def run_pipeline_from_selected_images(
     result["images_used"] = len(paths)
 
     # 3) Analiza opisu (bez matching/quality – użytkownik zweryfikował)
-    base_desc = analyze_images_for_description(paths)
-    result["base_description"] = base_desc
-    verified = verify_description_and_extract_data(
-        paths, product_name, base_desc, lang=config.OUTPUT_LANG
-    )
-    result["verified"] = verified
+    with image_payload_scope(), usage_scope() as usage:
+        if config.IMAGE_PREPROCESS_ENABLED:
+            _register_preprocessed((await preprocess_images_async(paths)).values())
+        warnings: list[str] = []
+        base_desc, verified = await _describe(paths, product_name, generation_mode, warnings=warnings)
+        result["base_description"] = base_desc
+        result["verified"] = verified
+        if warnings:
+            result["warnings"] = warnings
+    result["claude_usage"] = usage.to_dict()
     return result
 
 
+def _write_uploads(uploaded_images_base64: list[str], upload_dir: Path) -> list[Path]:
+    """Wgrane zdjęcia (data URL lub surowy base64) → pliki; niepoprawne base64 pomijane."""
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    paths: list[Path] = []
+    for i, b64 in enumerate(uploaded_images_base64):
+        raw = b64.split(",", 1)[-1].strip() if isinstance(b64, str) else b64
+        try:
+            data = base64.b64decode(raw)
+        except Exception:
+            continue
+        ext = ".jpg"
+        path = upload_dir / f"upload_{i:02d}_{uuid.uuid4().hex[:8]}{ext}"
+        path.write_bytes(data)
+        paths.append(path)
+    return paths
+
+
+def resolve_generation_mode(generation_mode: str | None) -> str:
+    mode = generation_mode or config.GENERATION_MODE
+    if mode not in GENERATION_MODES:
+        raise ValueError(f"generation_mode must be one of {GENERATION_MODES}, got {mode!r}")
+    return mode
+
+
+async def _describe(
+    image_paths: list[Path],
+    product_name: str,
+    generation_mode: str,
+    checkpoint: RunCheckpoint | None = None,
+    warnings: list[str] | None = None,
+) -> tuple[str, dict[str, Any]]:
+    """
+    Opis bazowy + wynik weryfikacji (schemat `verified`) w wybranym trybie.
+    checkpoint: zapis etapów (analiza, weryfikacja / opis jednym wywołaniem); nieudane nie są zapisywane.
+    warnings: tu trafiają ostrzeżenia runu (np. odpowiedź weryfikacji nie była poprawnym JSON-em).
+    """
+    def warn(stage_warnings: list[str]) -> bool:
+        """Przenosi ostrzeżenia etapu do warnings; True gdy ich nie było (etap do checkpointu)."""
+        if warnings is not None:
+            warnings.extend(stage_warnings)
+        return not stage_warnings
+
+    images = checkpoint.file_digests(image_paths[: config.MAX_IMAGES_TO_ANALYZE]) if checkpoint else []
+    if generation_mode == "single":
+        async def describe() -> tuple[dict[str, Any], bool]:
+            stage_warnings: list[str] = []
+            base, verified = await generate_verified_description_async(
+                image_paths, product_name, lang=config.OUTPUT_LANG, warnings=stage_warnings
+            )
+            ok = warn(stage_warnings) and bool(base) and "error" not in verified
+            return {"base_description": base, "verified": verified}, ok
+
+        out = await _run_stage(checkpoint, "describe", {
+            "images": images, "product": product_name, "lang": config.OUTPUT_LANG, "model": config.CLAUDE_MODEL,
+        }, describe)
+        return out["base_description"], out["verified"]
+
+    async def analyze() -> tuple[str, bool]:
+        text = await analyze_images_for_description_async(image_paths)
+        return text, bool(text)
+
+    base_desc = await _run_stage(checkpoint, "analyze", {
+        "images": images, "model": config.CLAUDE_MODEL,
+    }, analyze)
+
+    async def verify() -> tuple[dict[str, Any], bool]:
+        stage_warnings: list[str] = []
+        verified = await verify_description_and_extract_data_async(
+            image_paths,
+            product_name,
+            base_desc,
+            lang=config.OUTPUT_LANG,
+            warnings=stage_warnings,
+        )
+        return verified, warn(stage_warnings) and "error" not in verified
+
+    verified = await _run_stage(checkpoint, "verify", {
+        "images": images,
+        "product": product_name,
+        "base_description": base_desc,
+        "lang": config.OUTPUT_LANG,
+        "model": config.CLAUDE_MODEL,
+    }, verify)
+    return base_desc, verified
+
+
+async def _run_stage(
+    checkpoint: RunCheckpoint | None,
+    stage: str,
+    inputs: dict[str, Any],
+    compute: Callable[[], Awaitable[tuple[Any, bool]]],
+    valid: Callable[[Any], bool] | None = None,
+) -> Any:
+    """
+    Wynik etapu z checkpointu (resume, te same wejścia, valid(wynik)) albo compute() → (wynik, czy zapisać).
+    Wynik musi być serializowalny do JSON.
+    """
+    if checkpoint is not None:
+        saved = checkpoint.get(stage, inputs)
+        if saved is not None and (valid is None or valid(saved)):
+            return saved
+    output, ok = await compute()
+    if checkpoint is not None and ok:
+        checkpoint.put(stage, inputs, output)
+    return output
+
+
+def _filter_settings() -> dict[str, Any]:
+    """Ustawienia wpływające na werdykty matchingu / jakości (część wejść etapu)."""
+    return {
+        "model": config.CLAUDE_MODEL,
+        "min_confidence": config.PRODUCT_MATCH_MIN_CONFIDENCE,
+        "min_uniqueness": config.IMAGE_UNIQUENESS_MIN_SCORE,
+        "min_trust": config.SOURCE_TRUST_MIN_SCORE,
+    }
+
+
+def _dedup_inputs(prep: PreparedRun, images: list[Path]) -> dict[str, Any]:
+    return {"images": prep.checkpoint.file_digests(images), "max_distance": config.IMAGE_DEDUP_MAX_DISTANCE}
+
+
+def _screening_inputs(prep: PreparedRun, images: list[Path]) -> dict[str, Any]:
+    return {
+        "images": prep.checkpoint.file_digests(images),
+        "product": [prep.product_name, prep.product_ean],
+        "sources": prep.source_domains,
+        "settings": _filter_settings(),
+    }
+
+
+def _matching_inputs(prep: PreparedRun, images: list[Path]) -> dict[str, Any]:
+    return {
+        "images": prep.checkpoint.file_digests(images),
+        "product": [prep.product_name, prep.product_ean],
+        "settings": _filter_settings(),
+    }
+
+
+def _quality_inputs(prep: PreparedRun, images: list[Path]) -> dict[str, Any]:
+    return {
+        "images": prep.checkpoint.file_digests(images),
+        "product": prep.product_name,
+        "sources": prep.source_domains,
+        "settings": _filter_settings(),
+    }
+
+
+def _all_batches_ok(raw: dict[str, Any], images: list[Path], batch_size: int) -> bool:
+    """Czy każdy batch dostał czytelną odpowiedź (inaczej wynik etapu to fallback – nie zapisujemy)."""
+    return len(raw.get("batches", [])) == math.ceil(len(images) / batch_size)
+
+
+def _paths_to_str(groups: dict[str, list[Path]]) -> dict[str, list[str]]:
+    return {k: [str(p) for p in v] for k, v in groups.items()}
+
+
+def _str_to_paths(items: list[str]) -> list[Path]:
+    return [Path(p) for p in items]
+
+
 def _save_result(result: dict[str, Any], out_dir: Path) -> None:
     out_dir = Path(out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
@@ -11,7 +11,7 @@ from pathlib import Path
 from typing import Any
 
 import config
-from src.claude_client import message_with_images
+from src.claude_client import map_concurrent_async, message_with_images_async, run_with_claude
 
 logger = logging.getLogger(__name__)
 
@@ -48,55 +48,90 @@ def _parse_matching_response(text: str) -> dict[str, Any] | None:
         return None
 
 
-def filter_matching_images(
+BATCH_SIZE = 10  # limit zdjęć w jednym wywołaniu (kontekst)
+MAX_TOKENS = 2048
+
+
+def matching_user_text(product_name: str, ean: str | None = None) -> str:
+    return USER_MATCHING_TEMPLATE.format(product_name=product_name, ean=ean or "nie podano")
+
+
+def apply_matching_response(
+    batch: list[Path],
+    response: str | None,
+) -> tuple[list[Path], list[Path], dict[str, Any] | None]:
+    """
+    Werdykty dla jednego batcha z odpowiedzi Claude (None = błąd wywołania).
+    Zwraca (zaakceptowane, odrzucone, sparsowana odpowiedź lub None).
+    """
+    parsed = _parse_matching_response(response) if response is not None else None
+    if not parsed:
+        # błąd API / nieczytelna odpowiedź – zostawiamy wszystkie w batchu jako zaakceptowane
+        return list(batch), [], None
+
+    accepted: list[Path] = []
+    rejected: list[Path] = []
+    matches = parsed.get("matches") or []
+    min_conf = config.PRODUCT_MATCH_MIN_CONFIDENCE
+    for i, path in enumerate(batch):
+        # numeracja zdjęć w prompcie zaczyna się od 1 w każdym wywołaniu
+        idx_1based = i + 1
+        item = next((m for m in matches if m.get("index") == idx_1based), None)
+        if not item:
+            accepted.append(path)
+            continue
+        same = item.get("same_product", True)
+        conf = float(item.get("confidence", 0.5))
+        if same and conf >= min_conf:
+            accepted.append(path)
+        else:
+            rejected.append(path)
+    return accepted, rejected, parsed
+
+
+async def match_batch_async(
+    batch: list[Path],
+    user: str,
+) -> tuple[list[Path], list[Path], dict[str, Any] | None]:
+    """Jeden batch (też w trybie strumieniowym): (zaakceptowane, odrzucone, sparsowana odpowiedź lub None)."""
+    try:
+        response = await message_with_images_async(SYSTEM_MATCHING, user, batch, max_tokens=MAX_TOKENS)
+    except Exception as e:
+        logger.warning("Product matching API error: %s", e)
+        response = None
+    return apply_matching_response(batch, response)
+
+
+async def filter_matching_images_async(
     image_paths: list[Path],
     product_name: str,
     ean: str | None = None,
 ) -> tuple[list[Path], list[Path], dict[str, Any]]:
     """
     Claude ocenia każde zdjęcie: ten sam produkt czy nie.
+    Batche wysyłane równolegle (config.CLAUDE_CONCURRENCY); wyniki scalane w kolejności zdjęć.
     Zwraca: (ścieżki zdjęć uznanych za ten sam produkt, odrzucone, surowa odpowiedź JSON).
     """
     if not image_paths:
         return [], [], {}
 
-    ean = ean or "nie podano"
-    user = USER_MATCHING_TEMPLATE.format(product_name=product_name, ean=ean)
-    # Limit zdjęć w jednym wywołaniu (kontekst)
-    batch_size = 10
+    user = matching_user_text(product_name, ean)
+    batches = [image_paths[start : start + BATCH_SIZE] for start in range(0, len(image_paths), BATCH_SIZE)]
     accepted: list[Path] = []
     rejected: list[Path] = []
     all_parsed: list[dict[str, Any]] = []
+    for acc, rej, parsed in await map_concurrent_async(lambda b: match_batch_async(b, user), batches):
+        accepted.extend(acc)
+        rejected.extend(rej)
+        if parsed is not None:
+            all_parsed.append(parsed)
+    return accepted, rejected, {"batches": all_parsed}
 
-    for start in range(0, len(image_paths), batch_size):
-        batch = image_paths[start : start + batch_size]
-        try:
-            response = message_with_images(SYSTEM_MATCHING, user, batch, max_tokens=2048)
-        except Exception as e:
-            logger.warning("Product matching API error: %s", e)
-            # w razie błędu zostawiamy wszystkie w batchu jako zaakceptowane
-            accepted.extend(batch)
-            continue
-
-        parsed = _parse_matching_response(response)
-        if not parsed:
-            accepted.extend(batch)
-            continue
-
-        matches = parsed.get("matches") or []
-        min_conf = config.PRODUCT_MATCH_MIN_CONFIDENCE
-        for i, path in enumerate(batch):
-            idx_1based = start + i + 1
-            item = next((m for m in matches if m.get("index") == idx_1based), None)
-            if not item:
-                accepted.append(path)
-                continue
-            same = item.get("same_product", True)
-            conf = float(item.get("confidence", 0.5))
-            if same and conf >= min_conf:
-                accepted.append(path)
-            else:
-                rejected.append(path)
-        all_parsed.append(parsed)
 
-    return accepted, rejected, {"batches": all_parsed}
+def filter_matching_images(
+    image_paths: list[Path],
+    product_name: str,
+    ean: str | None = None,
+) -> tuple[list[Path], list[Path], dict[str, Any]]:
+    """Jak filter_matching_images_async, poza pętlą zdarzeń (run_with_claude)."""
+    return run_with_claude(filter_matching_images_async(image_paths, product_name, ean))
@@ -12,7 +12,7 @@ from pathlib import Path
 from typing import Any
 
 import config
-from src.claude_client import message_with_images
+from src.claude_client import map_concurrent_async, message_with_images_async, run_with_claude
 
 logger = logging.getLogger(__name__)
 
@@ -48,58 +48,95 @@ def _parse_quality_response(text: str) -> dict[str, Any] | None:
         return None
 
 
-def filter_quality(
+BATCH_SIZE = 10
+MAX_TOKENS = 2048
+
+
+def quality_user_text(product_name: str, source_domains: list[str] | None = None) -> str:
+    sources_text = ", ".join(source_domains[:20]) if source_domains else "nie podano"
+    return USER_QUALITY_TEMPLATE.format(
+        product_name=product_name,
+        sources_text=sources_text,
+    )
+
+
+def apply_quality_response(
+    batch: list[Path],
+    response: str | None,
+) -> tuple[list[Path], list[Path], dict[str, Any] | None]:
+    """
+    Werdykty dla jednego batcha z odpowiedzi Claude (None = błąd wywołania).
+    Zwraca (do zostawienia, odrzucone, sparsowana odpowiedź lub None).
+    """
+    parsed = _parse_quality_response(response) if response is not None else None
+    if not parsed:
+        return list(batch), [], None
+
+    keep_paths: list[Path] = []
+    drop_paths: list[Path] = []
+    images = parsed.get("images") or []
+    min_uniqueness = config.IMAGE_UNIQUENESS_MIN_SCORE
+    min_trust = config.SOURCE_TRUST_MIN_SCORE
+    for i, path in enumerate(batch):
+        # numeracja zdjęć w prompcie zaczyna się od 1 w każdym wywołaniu
+        idx_1based = i + 1
+        item = next((m for m in images if m.get("index") == idx_1based), None)
+        if not item:
+            keep_paths.append(path)
+            continue
+        keep = item.get("keep", True)
+        u = float(item.get("uniqueness_score", 0.5))
+        t = float(item.get("source_trust_score", 0.5))
+        if keep and u >= min_uniqueness and t >= min_trust:
+            keep_paths.append(path)
+        else:
+            drop_paths.append(path)
+    return keep_paths, drop_paths, parsed
+
+
+async def quality_batch_async(
+    batch: list[Path],
+    user: str,
+) -> tuple[list[Path], list[Path], dict[str, Any] | None]:
+    """Jeden batch (też w trybie strumieniowym): (do zostawienia, odrzucone, sparsowana odpowiedź lub None)."""
+    try:
+        response = await message_with_images_async(SYSTEM_QUALITY, user, batch, max_tokens=MAX_TOKENS)
+    except Exception as e:
+        logger.warning("Quality filter API error: %s", e)
+        response = None
+    return apply_quality_response(batch, response)
+
+
+async def filter_quality_async(
     image_paths: list[Path],
     product_name: str,
     source_domains: list[str] | None = None,
 ) -> tuple[list[Path], list[Path], dict[str, Any]]:
     """
     Claude ocenia unikalność i wiarygodność każdego zdjęcia.
+    Batche wysyłane równolegle (config.CLAUDE_CONCURRENCY); wyniki scalane w kolejności zdjęć.
     Zwraca: (ścieżki do zostawienia, odrzucone, surowa odpowiedź).
     """
     if not image_paths:
         return [], [], {}
 
-    sources_text = ", ".join(source_domains[:20]) if source_domains else "nie podano"
-    user = USER_QUALITY_TEMPLATE.format(
-        product_name=product_name,
-        sources_text=sources_text,
-    )
-    batch_size = 10
+    user = quality_user_text(product_name, source_domains)
+    batches = [image_paths[start : start + BATCH_SIZE] for start in range(0, len(image_paths), BATCH_SIZE)]
     keep_paths: list[Path] = []
     drop_paths: list[Path] = []
     all_parsed: list[dict[str, Any]] = []
+    for keep, drop, parsed in await map_concurrent_async(lambda b: quality_batch_async(b, user), batches):
+        keep_paths.extend(keep)
+        drop_paths.extend(drop)
+        if parsed is not None:
+            all_parsed.append(parsed)
+    return keep_paths, drop_paths, {"batches": all_parsed}
 
-    for start in range(0, len(image_paths), batch_size):
-        batch = image_paths[start : start + batch_size]
-        try:
-            response = message_with_images(SYSTEM_QUALITY, user, batch, max_tokens=2048)
-        except Exception as e:
-            logger.warning("Quality filter API error: %s", e)
-            keep_paths.extend(batch)
-            continue
-
-        parsed = _parse_quality_response(response)
-        if not parsed:
-            keep_paths.extend(batch)
-            continue
-
-        images = parsed.get("images") or []
-        min_uniqueness = config.IMAGE_UNIQUENESS_MIN_SCORE
-        min_trust = config.SOURCE_TRUST_MIN_SCORE
-        for i, path in enumerate(batch):
-            idx_1based = start + i + 1
-            item = next((m for m in images if m.get("index") == idx_1based), None)
-            if not item:
-                keep_paths.append(path)
-                continue
-            keep = item.get("keep", True)
-            u = float(item.get("uniqueness_score", 0.5))
-            t = float(item.get("source_trust_score", 0.5))
-            if keep and u >= min_uniqueness and t >= min_trust:
-                keep_paths.append(path)
-            else:
-                drop_paths.append(path)
-        all_parsed.append(parsed)
 
-    return keep_paths, drop_paths, {"batches": all_parsed}
+def filter_quality(
+    image_paths: list[Path],
+    product_name: str,
+    source_domains: list[str] | None = None,
+) -> tuple[list[Path], list[Path], dict[str, Any]]:
+    """Jak filter_quality_async, poza pętlą zdarzeń (run_with_claude)."""
+    return run_with_claude(filter_quality_async(image_paths, product_name, source_domains))
@@ -0,0 +1,57 @@
+"""
+Trwały cache odpowiedzi Claude (SQLite, src.cache_store).
+
+Klucz: model, system prompt, tekst użytkownika, max_tokens oraz uporządkowana lista
+hashy treści załączonych obrazów (wraz z wymiarami faktycznie wysłanymi).
+Ponowny run dla tego samego EAN-u / tego samego wyboru zdjęć nie płaci drugi raz.
+Wyłączenie: CLAUDE_CACHE_ENABLED=0 (lub --no-cache w CLI).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import threading
+
+import config
+from src.cache_store import SqliteCache
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = "claude_responses"
+
+_cache: SqliteCache | None = None
+_cache_lock = threading.Lock()
+_cache_failed = False
+
+
+def response_cache_key(
+    model: str,
+    system: str,
+    user_text: str,
+    max_tokens: int,
+    image_keys: list[str],
+) -> str:
+    """Klucz wpisu: sha256 z parametrów żądania i hashy obrazów (kolejność ma znaczenie)."""
+    raw = json.dumps(
+        [model, system, user_text, max_tokens, image_keys],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def get_response_cache() -> SqliteCache | None:
+    """Wspólny cache odpowiedzi; None gdy wyłączony (config.CLAUDE_CACHE_ENABLED) lub niedostępny."""
+    global _cache, _cache_failed
+    if not config.CLAUDE_CACHE_ENABLED or _cache_failed:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None and not _cache_failed:
+                try:
+                    _cache = SqliteCache(NAMESPACE, max_entries=config.CLAUDE_CACHE_MAX_ENTRIES)
+                except Exception as e:
+                    logger.warning("Claude response cache disabled (%s): %s", config.CACHE_DB_PATH, e)
+                    _cache_failed = True
+    return _cache
@@ -0,0 +1,79 @@
+"""
+Checkpoint etapów run_pipeline w katalogu wyniku (data/output/{EAN}/stages.json).
+
+Każdy zakończony etap (lookup, źródła, pobieranie, deduplikacja, matching, jakość, analiza,
+weryfikacja) zapisuje wynik razem z odciskiem swoich wejść (sha256 z parametrów i treści zdjęć).
+Przy wznowieniu (resume=True) etap, którego wejścia się nie zmieniły, jest pomijany, a jego wynik
+odczytany z pliku – przerwany run kończy się w sekundy, bez ponownych wywołań API.
+Nieudane etapy (błąd API, odpowiedź niebędąca poprawnym JSON-em) nie są zapisywane.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+STAGES_FILE = "stages.json"
+
+
+def fingerprint(inputs: Any) -> str:
+    raw = json.dumps(inputs, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class RunCheckpoint:
+    """Stan etapów jednego runu; zapis atomowy po każdym etapie."""
+
+    def __init__(self, out_dir: Path, resume: bool = False) -> None:
+        self.path = Path(out_dir) / STAGES_FILE
+        self.resume = resume
+        self._stages: dict[str, Any] = {}
+        self._digests: dict[str, str] = {}
+        if resume and self.path.exists():
+            try:
+                self._stages = json.loads(self.path.read_text(encoding="utf-8"))
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning("Cannot read stage checkpoint %s: %s", self.path, e)
+
+    def get(self, stage: str, inputs: Any) -> Any | None:
+        """Zapisany wynik etapu, jeśli resume i wejścia bez zmian; inaczej None."""
+        if not self.resume:
+            return None
+        entry = self._stages.get(stage)
+        if not entry or entry.get("fingerprint") != fingerprint(inputs):
+            return None
+        logger.info("Resume: stage %s skipped (inputs unchanged)", stage)
+        return entry["output"]
+
+    def put(self, stage: str, inputs: Any, output: Any) -> None:
+        self._stages[stage] = {
+            "fingerprint": fingerprint(inputs),
+            "output": output,
+            "saved_at": time.time(),
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        try:
+            tmp.write_text(json.dumps(self._stages, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning("Cannot write stage checkpoint %s: %s", self.path, e)
+
+    def file_digests(self, paths: list[Path]) -> list[str]:
+        """sha256 treści plików (wejście etapów na zdjęciach); brak pliku = pusty odcisk."""
+        out: list[str] = []
+        for p in paths:
+            key = str(Path(p).resolve())
+            if key not in self._digests:
+                try:
+                    self._digests[key] = hashlib.sha256(Path(p).read_bytes()).hexdigest()
+                except OSError:
+                    self._digests[key] = ""
+            out.append(self._digests[key])
+        return out
@@ -3,18 +3,41 @@ Wyszukiwanie źródeł zdjęć i stron produktu.
 
 Priorytet: SerpAPI (Google Images + Google Search) → fallback DuckDuckGo Images.
 Każde źródło ma URL obrazu, URL strony (jeśli znany) i metadane do późniejszej oceny wiarygodności.
+
+Wyniki dostawców cache’owane per (dostawca, zapytanie, strona) w SQLite (SEARCH_CACHE_TTL_S) –
+powtórzone zapytanie nie zużywa limitu SerpAPI. search_more_sources stronicuje wyniki kursorem
+(SerpAPI ijn, offset DuckDuckGo) i pomija URL-e już zwrócone.
 """
 from __future__ import annotations
 
+import asyncio
+import base64
+import hashlib
+import json
 import logging
-from dataclasses import dataclass
-from typing import Any
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeout
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Iterable
 from urllib.parse import urlparse
 
 import config
+from src.cache_store import SqliteCache
 
 logger = logging.getLogger(__name__)
 
+CACHE_NAMESPACE = "search_results"
+
+# Wyników na stronę: Google Images (SerpAPI, parametr ijn) / DuckDuckGo (offset emulowany max_results)
+SERPAPI_IMAGES_PAGE_SIZE = 100
+DUCKDUCKGO_PAGE_SIZE = 50
+
+_cache: SqliteCache | None = None
+_cache_lock = threading.Lock()
+_cache_failed = False
+
 
 @dataclass
 class ImageSource:
@@ -36,47 +59,104 @@ class ImageSource:
                 pass
 
 
-def _search_serpapi_images(query: str, count: int) -> list[ImageSource]:
-    """SerpAPI – Google Images. Wymaga SERPAPI_API_KEY."""
+def get_search_cache() -> SqliteCache | None:
+    """Cache wyników wyszukiwania; None gdy wyłączony (config.SEARCH_CACHE_ENABLED) lub niedostępny."""
+    global _cache, _cache_failed
+    if not config.SEARCH_CACHE_ENABLED or _cache_failed:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None and not _cache_failed:
+                try:
+                    _cache = SqliteCache(CACHE_NAMESPACE, max_entries=config.SEARCH_CACHE_MAX_ENTRIES)
+                except Exception as e:
+                    logger.warning("Search result cache disabled (%s): %s", config.CACHE_DB_PATH, e)
+                    _cache_failed = True
+    return _cache
+
+
+def _cached_page(
+    provider: str,
+    query: str,
+    page: int,
+    fetch: Callable[[], list[Any]],
+) -> list[Any]:
+    """Strona wyników dostawcy z cache albo fetch(); puste strony nie są zapisywane, błąd fetch() propaguje."""
+    cache = get_search_cache()
+    key = hashlib.sha256(json.dumps([provider, query, page], ensure_ascii=False).encode("utf-8")).hexdigest()
+    if cache is not None:
+        hit = cache.get(key)
+        if hit is not None:
+            logger.debug("Search cache hit: %s %r page %s", provider, query, page)
+            return hit
+    found = fetch()
+    if cache is not None and found:
+        cache.set(key, found, ttl_s=config.SEARCH_CACHE_TTL_S)
+    return found
+
+
+def _serpapi_images_page(query: str, page: int) -> list[ImageSource]:
+    """Jedna strona Google Images (SerpAPI, ijn=page); z cache."""
     if not config.SERPAPI_API_KEY:
         return []
+    found = _cached_page(
+        "serpapi_images", query, page, lambda: [asdict(x) for x in _fetch_serpapi_images(query, page)]
+    )
+    return [ImageSource(**x) for x in found]
+
+
+def _search_serpapi_images(query: str, count: int) -> list[ImageSource]:
+    """SerpAPI – Google Images (pierwsza strona). Wymaga SERPAPI_API_KEY."""
     try:
-        from serpapi import GoogleSearch
-        params = {
-            "engine": "google_images",
-            "q": query,
-            "api_key": config.SERPAPI_API_KEY,
-            "num": min(count, 100),
-            "hl": "pl",
-            "gl": "pl",
-        }
-        search = GoogleSearch(params)
-        data = search.get_dict()
-        out: list[ImageSource] = []
-        for obj in data.get("images_results", [])[:count]:
-            img_url = obj.get("original") or obj.get("image") or obj.get("thumbnail")
-            if not img_url:
-                continue
-            link = obj.get("link")  # strona, z której pochodzi obraz
-            out.append(ImageSource(
-                image_url=img_url,
-                page_url=link,
-                title=obj.get("title"),
-                source_domain=urlparse(link).netloc if link else None,
-                width=obj.get("original_width"),
-                height=obj.get("original_height"),
-                raw_serp_snippet=obj.get("title") or "",
-            ))
-        return out
+        return _serpapi_images_page(query, 0)[:count]
     except Exception as e:
         logger.warning("SerpAPI Google Images failed: %s", e)
         return []
 
 
+def _fetch_serpapi_images(query: str, page: int) -> list[ImageSource]:
+    """Strona Google Images (SerpAPI); błąd dostawcy propaguje (stronicowanie odróżnia go od końca wyników)."""
+    from serpapi import GoogleSearch
+    params = {
+        "engine": "google_images",
+        "q": query,
+        "api_key": config.SERPAPI_API_KEY,
+        "ijn": page,
+        "hl": "pl",
+        "gl": "pl",
+    }
+    search = GoogleSearch(params)
+    data = search.get_dict()
+    error = data.get("error")
+    # "Google hasn't returned any results" = koniec wyników; inne błędy (limit, klucz) – jak wyjątek
+    if error and not data.get("images_results") and "returned any results" not in error:
+        raise RuntimeError(error)
+    out: list[ImageSource] = []
+    for obj in data.get("images_results", []):
+        img_url = obj.get("original") or obj.get("image") or obj.get("thumbnail")
+        if not img_url:
+            continue
+        link = obj.get("link")  # strona, z której pochodzi obraz
+        out.append(ImageSource(
+            image_url=img_url,
+            page_url=link,
+            title=obj.get("title"),
+            source_domain=urlparse(link).netloc if link else None,
+            width=obj.get("original_width"),
+            height=obj.get("original_height"),
+            raw_serp_snippet=obj.get("title") or "",
+        ))
+    return out
+
+
 def _search_serpapi_organic(query: str, count: int) -> list[dict[str, Any]]:
-    """SerpAPI – zwykłe wyniki Google (strony). Przydatne do oceny źródeł / kontekstu."""
+    """SerpAPI – zwykłe wyniki Google (strony). Przydatne do oceny źródeł / kontekstu. Z cache."""
     if not config.SERPAPI_API_KEY:
         return []
+    return _cached_page(f"serpapi_organic:{count}", query, 0, lambda: _fetch_serpapi_organic(query, count))
+
+
+def _fetch_serpapi_organic(query: str, count: int) -> list[dict[str, Any]]:
     try:
         from serpapi import GoogleSearch
         params = {
@@ -95,63 +175,253 @@ def _search_serpapi_organic(query: str, count: int) -> list[dict[str, Any]]:
         return []
 
 
+def _duckduckgo_images_page(query: str, page: int) -> list[ImageSource]:
+    """Jedna strona DuckDuckGo Images (DUCKDUCKGO_PAGE_SIZE wyników od page * rozmiar); z cache."""
+    found = _cached_page(
+        "duckduckgo_images", query, page, lambda: [asdict(x) for x in _fetch_duckduckgo_images(query, page)]
+    )
+    return [ImageSource(**x) for x in found]
+
+
 def _search_duckduckgo_images(query: str, count: int) -> list[ImageSource]:
-    """Fallback: DuckDuckGo Images (bez klucza API)."""
+    """Fallback: DuckDuckGo Images (bez klucza API; pierwsza strona)."""
     try:
-        from duckduckgo_search import DDGS
-        with DDGS() as ddgs:
-            results = list(ddgs.images(query, max_results=count))
-        out: list[ImageSource] = []
-        for r in results:
-            img_url = r.get("image") or r.get("url")
-            if not img_url:
-                continue
-            out.append(ImageSource(
-                image_url=img_url,
-                page_url=r.get("url"),
-                title=r.get("title"),
-                source_domain=urlparse(r["url"]).netloc if r.get("url") else None,
-                raw_serp_snippet=r.get("title") or "",
-            ))
-        return out
+        return _duckduckgo_images_page(query, 0)[:count]
     except Exception as e:
         logger.warning("DuckDuckGo images failed: %s", e)
         return []
 
 
+def _fetch_duckduckgo_images(query: str, page: int) -> list[ImageSource]:
+    """Strona DuckDuckGo Images; błąd dostawcy propaguje (stronicowanie odróżnia go od końca wyników)."""
+    from duckduckgo_search import DDGS
+    # DDGS nie ma offsetu – pobierz do końca strony i odetnij poprzednie
+    offset = page * DUCKDUCKGO_PAGE_SIZE
+    with DDGS() as ddgs:
+        results = list(ddgs.images(query, max_results=offset + DUCKDUCKGO_PAGE_SIZE))[offset:]
+    out: list[ImageSource] = []
+    for r in results:
+        img_url = r.get("image") or r.get("url")
+        if not img_url:
+            continue
+        out.append(ImageSource(
+            image_url=img_url,
+            page_url=r.get("url"),
+            title=r.get("title"),
+            source_domain=urlparse(r["url"]).netloc if r.get("url") else None,
+            raw_serp_snippet=r.get("title") or "",
+        ))
+    return out
+
+
+def build_query(product_name: str, ean: str | None = None) -> str:
+    """Zapytanie: product_name + opcjonalnie EAN."""
+    return f"{product_name} {ean}" if ean else f"{product_name}"
+
+
+def _add_unique(
+    sources: list[ImageSource],
+    seen_urls: set[str],
+    found: list[ImageSource],
+    cap: int,
+) -> list[ImageSource]:
+    """Dopisuje nowe (po URL obrazu) źródła do sources, najwyżej do cap; zwraca dopisane."""
+    added: list[ImageSource] = []
+    for s in found:
+        if len(sources) >= cap:
+            break
+        if s.image_url not in seen_urls:
+            seen_urls.add(s.image_url)
+            sources.append(s)
+            added.append(s)
+    return added
+
+
 def search_image_sources(
     product_name: str,
     ean: str | None = None,
     min_count: int | None = None,
+    include_organic: bool = False,
 ) -> tuple[list[ImageSource], list[dict[str, Any]]]:
     """
-    Wyszukuje źródła zdjęć (min. min_count) oraz wyniki Google (organic) do oceny kontekstu.
+    Wyszukuje źródła zdjęć (min. min_count) oraz – gdy include_organic – wyniki Google (organic)
+    do oceny kontekstu; bez include_organic lista organic jest pusta (bez zapytania i kosztu).
 
+    Dostawcy odpytywani równolegle, każdy z limitem SEARCH_PROVIDER_TIMEOUT_S (po nim – brak wyników
+    z tego dostawcy). Scalanie jak dotąd: najpierw SerpAPI, DuckDuckGo tylko gdy SerpAPI dało
+    mniej niż min_count; duplikaty po URL obrazu pomijane.
     Zapytanie: product_name + opcjonalnie EAN. Zwraca (lista ImageSource, lista wyników Google).
     """
     min_count = min_count or config.MIN_IMAGES_TO_FETCH
-    query = f"{product_name}"
-    if ean:
-        query = f"{product_name} {ean}"
+    query = build_query(product_name, ean)
+    cap = min_count * 2  # zwracamy więcej niż min_count, potem filtrowanie
 
     sources: list[ImageSource] = []
     seen_urls: set[str] = set()
 
-    # 1) SerpAPI Google Images
-    serp_sources = _search_serpapi_images(query, min_count * 2)
-    for s in serp_sources:
-        if s.image_url not in seen_urls:
-            seen_urls.add(s.image_url)
-            sources.append(s)
-    # 2) Fallback DuckDuckGo
-    if len(sources) < min_count:
-        ddg = _search_duckduckgo_images(query, min_count * 2)
-        for s in ddg:
-            if s.image_url not in seen_urls:
-                seen_urls.add(s.image_url)
-                sources.append(s)
-
-    # Wyniki Google (organic) – do weryfikacji źródeł / „na koniec wyniki Google”
-    organic = _search_serpapi_organic(query, 10)
-
-    return sources[: min_count * 2], organic  # zwracamy więcej niż min_count, potem filtrowanie
+    pool = ThreadPoolExecutor(max_workers=3)
+    try:
+        images = pool.submit(_search_serpapi_images, query, cap)
+        ddg = pool.submit(_search_duckduckgo_images, query, cap)
+        # Wyniki Google (organic) – do weryfikacji źródeł / „na koniec wyniki Google”
+        organic_f = pool.submit(_search_serpapi_organic, query, 10) if include_organic else None
+        deadline = time.monotonic() + config.SEARCH_PROVIDER_TIMEOUT_S
+
+        # 1) SerpAPI Google Images
+        _add_unique(sources, seen_urls, _provider_result(images, "SerpAPI images", deadline), cap)
+        # 2) Fallback DuckDuckGo
+        if len(sources) < min_count:
+            _add_unique(sources, seen_urls, _provider_result(ddg, "DuckDuckGo images", deadline), cap)
+        organic = _provider_result(organic_f, "SerpAPI organic", deadline) if organic_f else []
+    finally:
+        # dostawca po limicie czasu kończy w tle – nie czekamy
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    return sources, organic
+
+
+def _provider_result(future: Future, name: str, deadline: float) -> list[Any]:
+    """Wynik dostawcy albo [] po przekroczeniu limitu czasu."""
+    try:
+        return future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FuturesTimeout:
+        logger.warning("%s timed out after %ss", name, config.SEARCH_PROVIDER_TIMEOUT_S)
+        return []
+
+
+# Dostawcy stronicowani w search_more_sources (kolejność = priorytet): funkcja strony, rozmiar strony
+_PAGED_PROVIDERS: dict[str, tuple[Callable[[str, int], list[ImageSource]], int]] = {
+    "serpapi": (_serpapi_images_page, SERPAPI_IMAGES_PAGE_SIZE),
+    "duckduckgo": (_duckduckgo_images_page, DUCKDUCKGO_PAGE_SIZE),
+}
+
+
+def encode_cursor(offsets: dict[str, int | None]) -> str | None:
+    """Kursor (nieprzezroczysty token) z offsetów dostawców; None gdy wszyscy wyczerpani."""
+    if all(v is None for v in offsets.values()):
+        return None
+    raw = json.dumps(offsets, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str | None) -> dict[str, int | None]:
+    """Offsety dostawców z kursora; brak / niepoprawny kursor = od początku."""
+    offsets: dict[str, int | None] = {name: 0 for name in _PAGED_PROVIDERS}
+    if not cursor:
+        return offsets
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        logger.debug("Invalid search cursor: %r", cursor)
+        return offsets
+    if not isinstance(data, dict):
+        logger.debug("Invalid search cursor: %r", cursor)
+        return offsets
+    for name in offsets:
+        v = data.get(name, 0)
+        offsets[name] = v if v is None or (isinstance(v, int) and v >= 0) else 0
+    return offsets
+
+
+def search_more_sources(
+    product_name: str,
+    ean: str | None = None,
+    *,
+    cursor: str | None = None,
+    exclude_urls: Iterable[str] = (),
+    min_count: int | None = None,
+) -> tuple[list[ImageSource], str | None]:
+    """
+    Kolejna porcja źródeł (min. min_count nowych, o ile są): od pozycji z kursora, najpierw SerpAPI
+    (kolejne strony ijn), potem DuckDuckGo; URL-e z exclude_urls i już zwrócone są pomijane.
+    Strony już pobrane (np. pierwsza z search_image_sources) czytane z cache – bez ponownego zapytania.
+    Zwraca (nowe źródła, następny kursor lub None, gdy wyniki się skończyły).
+    Na jedno wywołanie najwyżej SEARCH_MORE_MAX_PAGES stron na dostawcę.
+    """
+    min_count = min_count or config.MIN_IMAGES_TO_FETCH
+    query = build_query(product_name, ean)
+    offsets = decode_cursor(cursor)
+    seen = set(exclude_urls)
+    sources: list[ImageSource] = []
+
+    for name, (fetch_page, page_size) in _PAGED_PROVIDERS.items():
+        pages = 0
+        while offsets[name] is not None and len(sources) < min_count and pages < config.SEARCH_MORE_MAX_PAGES:
+            offset = offsets[name]
+            page, skip = divmod(offset, page_size)
+            try:
+                found = fetch_page(query, page)[skip:]
+            except Exception as e:
+                # błąd przejściowy – offset zostaje w kursorze, kolejne wywołanie spróbuje ponownie
+                logger.warning("Search more %s page %s failed: %s", name, page, e)
+                break
+            pages += 1
+            if not found:
+                offsets[name] = None  # dostawca wyczerpany (albo bez klucza API)
+                break
+            for i, src in enumerate(found):
+                if len(sources) >= min_count:
+                    # reszta strony zostaje na następne wywołanie
+                    offsets[name] = offset + i
+                    break
+                if src.image_url not in seen:
+                    seen.add(src.image_url)
+                    sources.append(src)
+            else:
+                offsets[name] = (page + 1) * page_size
+        if len(sources) >= min_count:
+            break
+
+    logger.info("Search more %r: %s new sources", query, len(sources))
+    return sources, encode_cursor(offsets)
+
+
+async def search_image_sources_async(
+    product_name: str,
+    ean: str | None = None,
+    min_count: int | None = None,
+    on_sources: Callable[[list[ImageSource]], None] | None = None,
+    include_organic: bool = False,
+) -> tuple[list[ImageSource], list[dict[str, Any]]]:
+    """
+    Jak search_image_sources (dostawcy równolegle, limit czasu na dostawcę, to samo scalanie),
+    na asyncio. on_sources(nowe_źródła) wywoływane, gdy tylko napłynie partia
+    (SerpAPI, potem ewentualnie DuckDuckGo) – np. aby od razu zacząć pobieranie.
+    Klienci SerpAPI / DuckDuckGo są synchroniczni – działają w wątkach.
+    """
+    min_count = min_count or config.MIN_IMAGES_TO_FETCH
+    query = build_query(product_name, ean)
+    cap = min_count * 2
+
+    sources: list[ImageSource] = []
+    seen_urls: set[str] = set()
+
+    def add(found: list[ImageSource]) -> None:
+        added = _add_unique(sources, seen_urls, found, cap)
+        if added and on_sources is not None:
+            on_sources(added)
+
+    def start(fn: Callable[..., list[Any]], *args: Any) -> asyncio.Task:
+        return asyncio.create_task(
+            asyncio.wait_for(asyncio.to_thread(fn, *args), config.SEARCH_PROVIDER_TIMEOUT_S)
+        )
+
+    async def result(task: asyncio.Task, name: str) -> list[Any]:
+        try:
+            return await task
+        except asyncio.TimeoutError:
+            logger.warning("%s timed out after %ss", name, config.SEARCH_PROVIDER_TIMEOUT_S)
+            return []
+
+    tasks = [start(_search_serpapi_images, query, cap), start(_search_duckduckgo_images, query, cap)]
+    if include_organic:
+        tasks.append(start(_search_serpapi_organic, query, 10))
+    try:
+        add(await result(tasks[0], "SerpAPI images"))
+        if len(sources) < min_count:
+            add(await result(tasks[1], "DuckDuckGo images"))
+        organic = await result(tasks[2], "SerpAPI organic") if include_organic else []
+    finally:
+        for t in tasks:
+            t.cancel()
+    return sources, organic
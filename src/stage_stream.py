@@ -0,0 +1,122 @@
+"""
+Strumieniowe przekazywanie zdjęć między etapami pipeline’u (tryb STREAMING_STAGES).
+
+Pobrane zdjęcia trafiają do kolejki (asyncio.Queue) od razu; batch etapu Claude jest wysyłany,
+gdy uzbiera się batch_size zdjęć albo po linger_s od pierwszego zdjęcia w buforze. Ogon pobierania
+(wolne hosty, deadline) chowa się za wywołaniami Claude. Zaakceptowane zdjęcia płyną tak samo
+do kolejki następnego etapu. Koniec strumienia: END w kolejce.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+END = None
+
+# judge(batch) → (zaakceptowane, odrzucone, sparsowana odpowiedź lub None)
+Judge = Callable[[list[Any]], Awaitable[tuple[list[Any], list[Any], Any]]]
+
+
+async def iter_batches(
+    queue: asyncio.Queue,
+    batch_size: int,
+    linger_s: float,
+) -> AsyncIterator[list[Any]]:
+    """Batche z kolejki: pełny batch od razu, niepełny po linger_s od pierwszego elementu; END kończy."""
+    loop = asyncio.get_running_loop()
+    buf: list[Any] = []
+    flush_at = 0.0
+    getter: asyncio.Future | None = None
+    try:
+        while True:
+            if getter is None:
+                getter = asyncio.ensure_future(queue.get())
+            timeout = max(0.0, flush_at - loop.time()) if buf else None
+            done, _ = await asyncio.wait({getter}, timeout=timeout)
+            if not done:
+                yield buf
+                buf = []
+                continue
+            item, getter = getter.result(), None
+            if item is END:
+                if buf:
+                    yield buf
+                return
+            if not buf:
+                flush_at = loop.time() + linger_s
+            buf.append(item)
+            if len(buf) >= batch_size:
+                yield buf
+                buf = []
+    finally:
+        if getter is not None:
+            getter.cancel()
+
+
+@dataclass
+class StageOutcome:
+    """Wynik etapu strumieniowego (kolejność ukończenia batchy – sortuje wywołujący)."""
+
+    accepted: list[Any] = field(default_factory=list)
+    rejected: list[Any] = field(default_factory=list)
+    batches: int = 0
+    parsed: list[dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def all_batches_ok(self) -> bool:
+        """Czy każdy batch dostał czytelną odpowiedź (jak _all_batches_ok w pipeline)."""
+        return len(self.parsed) == self.batches
+
+
+async def run_stage(
+    inbox: asyncio.Queue,
+    judge: Judge,
+    *,
+    batch_size: int,
+    linger_s: float,
+    limit: asyncio.Semaphore,
+    outbox: asyncio.Queue | None = None,
+    name: str = "stage",
+    drop: Callable[[Any], bool] | None = None,
+) -> StageOutcome:
+    """
+    Wysyła batche z inbox do judge(batch) → (zaakceptowane, odrzucone, odpowiedź lub None),
+    równolegle w granicach limit (wspólny semafor wszystkich etapów runu).
+    Zaakceptowane trafiają do outbox zaraz po zakończeniu batcha; na końcu END do outbox.
+    drop(item): elementy nieaktualne w chwili wysyłki batcha (np. zdjęcie zastąpione większą kopią)
+    są pomijane; batch bez elementów nie jest wysyłany.
+    """
+    outcome = StageOutcome()
+    tasks: list[asyncio.Task] = []
+
+    async def run(batch: list[Any]) -> None:
+        async with limit:
+            if drop is not None:
+                batch = [item for item in batch if not drop(item)]
+                if not batch:
+                    return
+            outcome.batches += 1
+            accepted, rejected, parsed = await judge(batch)
+        outcome.accepted.extend(accepted)
+        outcome.rejected.extend(rejected)
+        if parsed is not None:
+            outcome.parsed.append(parsed)
+        if outbox is not None:
+            for item in accepted:
+                outbox.put_nowait(item)
+        logger.debug("Stream %s: batch of %s done (%s accepted)", name, len(batch), len(accepted))
+
+    try:
+        async for batch in iter_batches(inbox, batch_size, linger_s):
+            tasks.append(asyncio.create_task(run(batch)))
+        await asyncio.gather(*tasks)
+    finally:
+        for t in tasks:
+            t.cancel()
+        if outbox is not None:
+            outbox.put_nowait(END)
+    return outcome
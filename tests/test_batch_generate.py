@@ -0,0 +1,68 @@
+"""/api/batch_generate: strumień NDJSON z handler._generate – pipeline podmieniony, bez gniazda."""
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+import threading
+import time
+
+from api.batch_generate import TIMEOUT_ERROR, handler
+
+
+class _Socket(io.BytesIO):
+    """wfile zapamiętujący wątek każdego zapisu."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.threads: set[str] = set()
+
+    def write(self, data: bytes) -> int:
+        self.threads.add(threading.current_thread().name)
+        return super().write(data)
+
+
+def _product(ean: str, name: str = "Produkt") -> dict:
+    return {"ean": ean, "product_name": name, "image_urls": ["https://shop.example/a.jpg"], "uploaded": []}
+
+
+def test_generate_streams_lines_and_waits_for_cancelled_work(tmp_path):
+    writes_after_cancel: list[str] = []
+
+    def slow_write(work_dir):
+        time.sleep(0.5)
+        work_dir.mkdir(parents=True, exist_ok=True)
+        (work_dir / "late.txt").write_text("x")
+        writes_after_cancel.append(work_dir.name)
+
+    async def fake_run_async(ean, product_name, *, work_dir, **kwargs):
+        if ean == "slow":
+            await asyncio.to_thread(slow_write, work_dir)
+        elif ean == "broken":
+            await asyncio.sleep(0.005)
+            raise RuntimeError("boom")
+        else:
+            await asyncio.sleep(0.05 if ean == "a" else 0.01)
+        return {"ean": ean, "description": f"opis {ean}"}
+
+    h = handler.__new__(handler)
+    h.wfile = _Socket()
+    products = [_product("a"), _product("slow"), _product("b"), _product("broken"), _product("x", name="")]
+
+    async def main():
+        await h._generate(products, None, tmp_path, 5, fake_run_async, 0.2)
+        return list(writes_after_cancel)
+
+    finished_before_return = asyncio.run(main())
+
+    lines = [json.loads(line) for line in h.wfile.getvalue().decode("utf-8").splitlines()]
+    # linie w kolejności ukończenia, nie wejścia
+    assert [line.get("index") for line in lines] == [4, 3, 2, 0, 1, None]
+    assert lines[0]["error"] == "Wymagane: productName"
+    assert lines[1] == {"index": 3, "ean": "broken", "error": "boom"}
+    assert lines[3] == {"index": 0, "ean": "a", "description": "opis a"}
+    assert lines[4] == {"index": 1, "ean": "slow", "error": TIMEOUT_ERROR}
+    assert lines[-1] == {"done": True, "count": 5}
+    # zapisy poza wątkiem pętli; wątek anulowanego produktu skończył przed powrotem
+    assert threading.main_thread().name not in h.wfile.threads
+    assert finished_before_return == ["001"]
@@ -0,0 +1,148 @@
+"""
+Tryb wsadowy end-to-end na LocalBatchBackend: etapy bez Claude zastąpione gotowym PreparedRun
+(lokalne zdjęcia), odpowiedzi Claude z respondera – bez sieci i bez API.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+from typing import Any
+
+import pytest
+from PIL import Image
+
+import config
+from src import bulk, claude_client, image_screening
+from src.pipeline import PreparedRun
+
+EANS = ["5900000000011", "5900000000028"]
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "CLAUDE_CACHE_ENABLED", False)
+
+    async def fake_prepare_run_async(ean: str, **kwargs: Any) -> PreparedRun:
+        await asyncio.sleep(0.01 * (int(ean[-2]) % 3))  # EAN-y kończą przygotowanie w innej kolejności
+        img_dir = tmp_path / "images" / ean
+        img_dir.mkdir(parents=True)
+        paths = []
+        for i, color in enumerate([(200, 30, 30), (30, 200, 30), (30, 30, 200)]):
+            path = img_dir / f"{i:03d}.jpg"
+            Image.new("RGB", (64, 48), color).save(path, format="JPEG")
+            paths.append(path)
+        return PreparedRun(
+            result={"ean": ean, "product_name": f"Produkt {ean}", "images_downloaded": len(paths)},
+            out_dir=tmp_path / "output" / ean,
+            product_name=f"Produkt {ean}",
+            product_ean=ean,
+            paths=paths,
+            source_domains=["example.com"],
+        )
+
+    monkeypatch.setattr(bulk, "prepare_run_async", fake_prepare_run_async)
+    return tmp_path
+
+
+def _responder(params: dict[str, Any]) -> dict[str, Any]:
+    """Screening: zdjęcie 2 to inny produkt; opis + weryfikacja: stały opis."""
+    prompt = json.dumps(params, ensure_ascii=False)
+    if image_screening.SYSTEM_SCREENING[:60] in prompt:
+        images = [
+            {"index": i, "same_product": i != 2, "confidence": 0.95, "keep": True,
+             "uniqueness_score": 0.9, "source_trust_score": 0.9}
+            for i in (1, 2, 3)
+        ]
+        text = json.dumps({"images": images})
+    else:
+        text = json.dumps({
+            "description_base": "Opis bazowy",
+            "description_verified": "Opis zweryfikowany",
+            "description_confidence": 0.9,
+        })
+    return {"text": text, "usage": {"input_tokens": 100, "output_tokens": 10}, "error": None}
+
+
+def _runner(root: Path, **kwargs: Any) -> bulk.BulkRunner:
+    backend = bulk.LocalBatchBackend(root / "batches", responder=_responder, pending_polls=1)
+    return bulk.BulkRunner(
+        root / "state.json",
+        backend,
+        fused_filter=True,
+        generation_mode="single",
+        save_to_db=False,
+        **kwargs,
+    )
+
+
+def test_local_batch_end_to_end(workspace):
+    runner = _runner(workspace)
+    runner.add_eans(EANS)
+    results = runner.run(poll_interval_s=0)
+
+    assert [r["ean"] for r in results] == EANS
+    for ean, result in zip(EANS, results):
+        assert result["bulk"] is True
+        assert result["after_matching"] == 2
+        assert result["rejected_matching_count"] == 1
+        assert result["verified"]["description_verified"] == "Opis zweryfikowany"
+        assert result["claude_usage"]["requests"] == 2
+        saved = json.loads((workspace / "output" / ean / "result.json").read_text(encoding="utf-8"))
+        assert saved["verified"]["description_verified"] == "Opis zweryfikowany"
+
+    state = json.loads((workspace / "state.json").read_text(encoding="utf-8"))
+    assert all(item["stage"] == bulk.DONE for item in state["items"])
+    assert state["batches"] == {}
+
+
+def test_resume_after_crash_while_finishing(workspace, monkeypatch):
+    # jedno żądanie na batch: wysyłka (i zapis stanu) w trakcie _advance, po zakończeniu wcześniejszego EAN-u
+    monkeypatch.setattr(config, "BULK_MAX_BATCH_REQUESTS", 1)
+    eans = EANS + ["5900000000035"]
+    runner = _runner(workspace)
+    runner.backend.pending_polls = 0
+    runner.add_eans(eans[:1])
+    runner.step()  # screening wysłany
+    runner.step()  # screening gotowy → describe wysłany
+    runner.add_eans(eans[1:])
+
+    def crash(runs, save_to_db=True):
+        raise RuntimeError("crash while saving results")
+
+    real_finish_runs = bulk.finish_runs
+    monkeypatch.setattr(bulk, "finish_runs", crash)
+    with pytest.raises(RuntimeError):
+        runner.step()  # pierwszy EAN kończy się, dwa kolejne wysyłają screening w osobnych batchach
+
+    # zapisany stan nie może oznaczać EAN-u jako zakończonego przed zapisem jego wyniku
+    state = json.loads((workspace / "state.json").read_text(encoding="utf-8"))
+    assert state["items"][0]["stage"] != bulk.DONE
+    assert not (workspace / "output").exists()
+
+    monkeypatch.setattr(bulk, "finish_runs", real_finish_runs)
+    results = _runner(workspace).run(poll_interval_s=0)
+    assert [r["verified"]["description_verified"] for r in results] == ["Opis zweryfikowany"] * 3
+    for ean in eans:
+        assert (workspace / "output" / ean / "result.json").exists()
+
+
+def test_images_encoded_once_per_ean_across_stages(workspace, monkeypatch):
+    encoded: list[int] = []
+    real_prepare = claude_client.prepare_image_for_vision
+
+    def counting_prepare(raw: bytes):
+        encoded.append(len(raw))
+        return real_prepare(raw)
+
+    monkeypatch.setattr(claude_client, "prepare_image_for_vision", counting_prepare)
+    monkeypatch.setattr(config, "BULK_PREPARE_CONCURRENCY", 2)
+    eans = EANS + ["5900000000035"]
+    runner = _runner(workspace)
+    runner.add_eans(eans)
+    assert [item["ean"] for item in runner.items] == eans
+
+    runner.run(poll_interval_s=0)
+    # screening (3 zdjęcia) + describe (2 z nich) – każde zdjęcie EAN-u kodowane raz
+    assert len(encoded) == 3 * len(eans)
+    assert not runner._payloads
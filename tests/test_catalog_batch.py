@@ -0,0 +1,69 @@
+"""Tryb katalogu: jedna pętla, limit workers, checkpoint z trybem runu."""
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any
+
+import pytest
+
+from src import catalog_batch
+
+EANS = [f"59000000000{i:02d}" for i in range(6)]
+
+
+@pytest.fixture
+def pipeline_calls(monkeypatch):
+    calls: list[dict[str, Any]] = []
+    state = {"running": 0, "max_running": 0, "loops": set()}
+
+    async def fake_run_pipeline_async(ean: str, **kwargs: Any) -> dict[str, Any]:
+        calls.append({"ean": ean, **kwargs})
+        state["loops"].add(id(asyncio.get_running_loop()))
+        state["running"] += 1
+        state["max_running"] = max(state["max_running"], state["running"])
+        await asyncio.sleep(0.01)
+        state["running"] -= 1
+        if ean == EANS[-1]:
+            return {"ean": ean, "error": "No image sources found"}
+        return {"ean": ean, "claude_usage": {"usd": 0.01}, "output_dir": f"/out/{ean}"}
+
+    monkeypatch.setattr(catalog_batch, "run_pipeline_async", fake_run_pipeline_async)
+    return calls, state
+
+
+def test_catalog_runs_on_one_loop_with_worker_limit(tmp_path, pipeline_calls):
+    calls, state = pipeline_calls
+    summary = catalog_batch.run_catalog(EANS, tmp_path / "ckpt.jsonl", workers=2)
+
+    assert sorted(c["ean"] for c in calls) == EANS
+    assert len(state["loops"]) == 1
+    assert state["max_running"] == 2
+    assert summary.done == 5 and summary.failed == [(EANS[-1], "No image sources found")]
+    assert summary.usd == pytest.approx(0.05)
+
+    # wznowienie: pominięte zakończone, ponowiony tylko EAN z błędem
+    calls.clear()
+    summary = catalog_batch.run_catalog(EANS, tmp_path / "ckpt.jsonl", workers=2)
+    assert [c["ean"] for c in calls] == [EANS[-1]]
+    assert summary.skipped == 5
+
+
+def test_estimate_only_does_not_count_as_full_run(tmp_path, pipeline_calls):
+    calls, _ = pipeline_calls
+    checkpoint = tmp_path / "ckpt.jsonl"
+    catalog_batch.run_catalog(EANS[:2], checkpoint, workers=2, estimate_only=True)
+    entries = [json.loads(line) for line in checkpoint.read_text(encoding="utf-8").splitlines()]
+    assert {e["mode"] for e in entries} == {"estimate"}
+
+    calls.clear()
+    assert catalog_batch.run_catalog(EANS[:2], checkpoint, workers=2, estimate_only=True).skipped == 2
+    assert calls == []
+
+    summary = catalog_batch.run_catalog(EANS[:2], checkpoint, workers=2)
+    assert summary.skipped == 0 and summary.done == 2
+    assert all(not c.get("estimate_only") for c in calls)
+
+    # pełny przebieg zalicza też kolejny kosztorys
+    calls.clear()
+    assert catalog_batch.run_catalog(EANS[:2], checkpoint, workers=2, estimate_only=True).skipped == 2
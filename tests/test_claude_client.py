@@ -0,0 +1,48 @@
+"""Układ żądania do Claude (build_message_params): prompt caching i wspólny prefiks zdjęć."""
+from __future__ import annotations
+
+import pytest
+from PIL import Image
+
+import config
+from src.claude_client import SHARED_IMAGE_SYSTEM, build_message_params
+
+
+@pytest.fixture
+def images(tmp_path):
+    paths = []
+    for i, color in enumerate([(200, 30, 30), (30, 200, 30)]):
+        path = tmp_path / f"{i}.png"
+        Image.new("RGB", (80, 60), color).save(path)
+        paths.append(path)
+    return paths
+
+
+def test_shared_image_prefix_puts_images_first(images, monkeypatch):
+    monkeypatch.setattr(config, "PROMPT_CACHING_ENABLED", True)
+    analyze, keys = build_message_params("system analizy", "opisz", images, share_image_prefix=True)
+    verify, _ = build_message_params("system weryfikacji", "zweryfikuj", images, share_image_prefix=True)
+
+    assert analyze["system"] == [{"type": "text", "text": SHARED_IMAGE_SYSTEM, "cache_control": {"type": "ephemeral"}}]
+    content = analyze["messages"][0]["content"]
+    assert [b["type"] for b in content] == ["image", "image", "text"]
+    assert "cache_control" not in content[0] and content[1]["cache_control"] == {"type": "ephemeral"}
+    assert content[2]["text"] == "system analizy\n\nopisz"
+    assert [k.split(":")[1] for k in keys] == ["80x60", "80x60"]
+    # etapy różnią się dopiero po zdjęciach – prefiks (system + obrazy) identyczny
+    assert verify["system"] == analyze["system"]
+    assert verify["messages"][0]["content"][:2] == content[:2]
+
+
+def test_default_layout_caches_system_prompt_only(images, monkeypatch):
+    monkeypatch.setattr(config, "PROMPT_CACHING_ENABLED", True)
+    params, _ = build_message_params("system", "tekst", images)
+    assert params["system"] == [{"type": "text", "text": "system", "cache_control": {"type": "ephemeral"}}]
+    content = params["messages"][0]["content"]
+    assert content[0] == {"type": "text", "text": "tekst"}
+    assert all("cache_control" not in b for b in content)
+
+    monkeypatch.setattr(config, "PROMPT_CACHING_ENABLED", False)
+    params, _ = build_message_params("system", "tekst", images, share_image_prefix=True)
+    assert params["system"] == [{"type": "text", "text": "system"}]
+    assert all("cache_control" not in b for b in params["messages"][0]["content"])
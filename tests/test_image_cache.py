@@ -0,0 +1,58 @@
+"""ImageCache: deduplikacja treści, eviction LRU, scalanie indeksu między procesami."""
+from __future__ import annotations
+
+import json
+from types import SimpleNamespace
+
+from src import image_cache
+from src.image_cache import INDEX_FILE, ImageCache
+
+
+def _file(tmp_path, name: str, data: bytes):
+    path = tmp_path / "src" / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+
+def test_same_content_is_stored_once_and_materialized(tmp_path):
+    cache = ImageCache(tmp_path / "cache", 10_000)
+    blob = cache.put("https://a.example/1.jpg", _file(tmp_path, "1.jpg", b"a" * 100))
+    assert cache.put("https://b.example/copy.jpg", _file(tmp_path, "copy.jpg", b"a" * 100)) == blob
+    assert len(list((tmp_path / "cache" / "blobs").rglob("*.jpg"))) == 1
+
+    assert cache.lookup("https://b.example/copy.jpg") == blob
+    assert cache.lookup("https://c.example/none.jpg") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    dest = cache.materialize(blob, tmp_path / "run", "img_00")
+    assert dest == tmp_path / "run" / "img_00.jpg" and dest.read_bytes() == b"a" * 100
+
+
+def test_eviction_drops_least_recently_used(tmp_path, monkeypatch):
+    clock = iter(range(1000, 2000))
+    monkeypatch.setattr(image_cache, "time", SimpleNamespace(time=lambda: next(clock)))
+    cache = ImageCache(tmp_path / "cache", 250)
+    first = cache.put("https://a.example/1.jpg", _file(tmp_path, "1.jpg", b"1" * 100))
+    cache.put("https://a.example/2.jpg", _file(tmp_path, "2.jpg", b"2" * 100))
+    assert cache.lookup("https://a.example/1.jpg") == first  # 1 używany później niż 2
+
+    cache.put("https://a.example/3.jpg", _file(tmp_path, "3.jpg", b"3" * 100))
+
+    assert cache.lookup("https://a.example/2.jpg") is None
+    assert cache.lookup("https://a.example/1.jpg") == first
+    assert cache.lookup("https://a.example/3.jpg") is not None
+    assert len(list((tmp_path / "cache" / "blobs").rglob("*.jpg"))) == 2
+
+
+def test_flush_merges_entries_written_by_another_process(tmp_path):
+    root = tmp_path / "cache"
+    ours, theirs = ImageCache(root, 10_000), ImageCache(root, 10_000)
+    theirs.put("https://b.example/theirs.jpg", _file(tmp_path, "theirs.jpg", b"t" * 50))
+    theirs.flush()
+    ours.put("https://a.example/ours.jpg", _file(tmp_path, "ours.jpg", b"o" * 50))
+    ours.flush()  # nie nadpisuje wpisu zapisanego w międzyczasie
+
+    index = json.loads((root / INDEX_FILE).read_text(encoding="utf-8"))
+    assert set(index["urls"]) == {"https://a.example/ours.jpg", "https://b.example/theirs.jpg"}
+    assert ImageCache(root, 10_000).lookup("https://b.example/theirs.jpg") is not None
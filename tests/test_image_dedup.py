@@ -0,0 +1,72 @@
+"""Deduplikacja lokalna (dHash): sygnatury z obu ścieżek, dedupe_images, NearDuplicateIndex."""
+from __future__ import annotations
+
+import pytest
+from PIL import Image, ImageDraw
+
+from src.image_dedup import NearDuplicateIndex, dedupe_images, image_signature
+from src.image_preprocess import image_key, preprocess_image
+
+
+def _photo(size: tuple[int, int]) -> Image.Image:
+    """Zdjęcie z wyraźną strukturą (dHash zależy od gradientów, nie od koloru)."""
+    img = Image.linear_gradient("L").resize(size).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    w, h = size
+    draw.ellipse((w // 5, h // 5, w * 3 // 5, h * 4 // 5), fill=(220, 40, 40))
+    draw.rectangle((w * 2 // 3, h // 10, w * 9 // 10, h // 2), fill=(20, 20, 160))
+    return img
+
+
+@pytest.mark.parametrize("size, fmt", [((3000, 2000), "JPEG"), ((640, 480), "JPEG"), ((1200, 800), "PNG")])
+def test_signature_same_in_preprocessing_and_dedup(tmp_path, size, fmt):
+    # drobna tekstura: hash z pełnego dekodowania i z draft JPEG (1/8) różniłby się o kilka bitów
+    path = tmp_path / f"photo.{fmt.lower()}"
+    Image.effect_noise(size, 60).convert("RGB").save(path, format=fmt, quality=90)
+
+    assert preprocess_image(path).signature == image_signature(path)
+
+
+def test_dedupe_keeps_largest_copy_with_mixed_signatures(tmp_path):
+    small, large, other = tmp_path / "small.jpg", tmp_path / "large.jpg", tmp_path / "other.jpg"
+    _photo((400, 300)).save(small, format="JPEG", quality=70)
+    _photo((2400, 1800)).save(large, format="JPEG", quality=90)
+    _photo((1600, 1200)).rotate(90, expand=True).save(other, format="JPEG")
+
+    # duża kopia z preprocessingu, pozostałe liczone w dedupe_images
+    signatures = {image_key(large): preprocess_image(large).signature}
+    keep, removed, details = dedupe_images([small, large, other], signatures=signatures)
+
+    assert keep == [large, other]
+    assert removed == [small]
+    assert details["groups"] == [{"kept": "large.jpg", "dropped": ["small.jpg"]}]
+
+
+def test_streaming_index_matches_batch_dedup(tmp_path):
+    # łańcuch a–b–c (odległości 3, 3; a–c = 6 > max) tworzy jedną grupę przechodnio; d osobno
+    sigs = {
+        "a.jpg": (0b000000, 400, 300),
+        "b.jpg": (0b000111, 1600, 1200),
+        "c.jpg": (0b111111, 800, 600),
+        "d.jpg": (0xFFFF0000, 800, 600),
+        "e.jpg": (0b111111, 800, 600),  # jak c, ale większy plik
+    }
+    paths = []
+    for i, name in enumerate(sigs):
+        path = tmp_path / name
+        path.write_bytes(b"x" * (100 + 10 * i))
+        paths.append(path)
+    signatures = {image_key(p): sigs[p.name] for p in paths}
+    keep, removed, _ = dedupe_images(paths, max_distance=4, signatures=signatures)
+
+    index = NearDuplicateIndex(max_distance=4)
+    arrival = [paths[i] for i in (0, 2, 3, 4, 1)]  # kolejność pobierania ≠ kolejność listy
+    assert index.add(arrival[0], sigs["a.jpg"], order=0)
+    assert index.add(arrival[1], sigs["c.jpg"], order=2)  # a i c w osobnych grupach, dopóki nie przyjdzie b
+    assert index.add(arrival[2], sigs["d.jpg"], order=3)
+    assert index.add(arrival[3], sigs["e.jpg"], order=4)  # e zastępuje c (te same piksele, większy plik)
+    assert not index.is_kept(paths[2]) and index.is_kept(paths[0])
+    assert index.add(arrival[4], sigs["b.jpg"], order=1)  # b łączy grupy i zastępuje przyjęte wcześniej
+
+    assert index.dropped() == set(removed)
+    assert [p for p in paths if index.is_kept(p)] == keep == [paths[1], paths[3]]
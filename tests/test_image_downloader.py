@@ -0,0 +1,106 @@
+"""Pobieranie zdjęć (download_images_async) na httpx.MockTransport – bez sieci."""
+from __future__ import annotations
+
+import asyncio
+import io
+
+import httpx
+import pytest
+from PIL import Image
+
+from src import image_downloader
+from src.image_cache import ImageCache
+
+
+def _jpeg(size: tuple[int, int] = (32, 24)) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", size, (120, 40, 200)).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+JPEG = _jpeg()
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    image_cache = ImageCache(tmp_path / "cache", 10 * 1024 * 1024)
+    monkeypatch.setattr(image_downloader, "get_image_cache", lambda: image_cache)
+    return image_cache
+
+
+def _download(urls, dest, handler, **kwargs):
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await image_downloader.download_images_async(urls, dest, client=client, **kwargs)
+
+    return asyncio.run(main())
+
+
+async def _handler(request: httpx.Request) -> httpx.Response:
+    path = request.url.path
+    if path == "/ok.png":  # rozszerzenie z URL-a nie decyduje – liczy się treść
+        return httpx.Response(200, headers={"content-type": "image/png"}, content=JPEG)
+    if path == "/html":
+        return httpx.Response(200, headers={"content-type": "text/html"}, content=b"<html></html>")
+    if path == "/fake":
+        return httpx.Response(200, headers={"content-type": "image/jpeg"}, content=b"<html>not an image</html>")
+    if path == "/declared-big":
+        return httpx.Response(
+            200, headers={"content-type": "image/jpeg", "content-length": str(50 * 1024 * 1024)}, content=JPEG
+        )
+    if path == "/missing":
+        return httpx.Response(404)
+    if path == "/slow":
+        await asyncio.sleep(5)
+    return httpx.Response(200, headers={"content-type": "image/jpeg"}, content=JPEG)
+
+
+def test_download_rejects_and_keeps_order(tmp_path, cache):
+    urls = [f"https://shop.example/{p}" for p in ("ok.png", "html", "fake", "declared-big", "missing")]
+    results = _download(urls, tmp_path / "img", _handler)
+
+    assert [r.url for r in results] == urls
+    ok = results[0]
+    assert ok.path is not None and ok.path.suffix == ".jpg" and ok.path.read_bytes() == JPEG
+    assert "non-image content-type" in results[1].error
+    assert "unsupported image format" in results[2].error
+    assert "Content-Length" in results[3].error
+    assert results[4].error == "HTTP 404"
+    assert not list((tmp_path / "img").glob("*.part"))
+
+
+def test_download_size_cap_while_streaming(tmp_path, cache, monkeypatch):
+    monkeypatch.setattr(image_downloader, "MAX_SIZE_MB", 0.01)  # ~10 KB, bez Content-Length w odpowiedzi
+    big = _jpeg((800, 800)) + b"\0" * 20_000
+
+    def handler(request):
+        return httpx.Response(200, headers={"content-type": "image/jpeg"}, stream=httpx.ByteStream(big))
+
+    [result] = _download(["https://shop.example/big.jpg"], tmp_path / "img", handler)
+    assert result.path is None and result.error.startswith("too large")
+    assert not any((tmp_path / "img").iterdir())
+
+
+def test_download_deadline_cancels_without_late_writes(tmp_path, cache):
+    urls = ["https://a.example/1.jpg", "https://b.example/slow"]
+    results = _download(urls, tmp_path / "img", _handler, deadline_s=0.5)
+
+    assert results[0].path is not None
+    assert results[1].path is None and results[1].error == "deadline exceeded"
+    assert sorted(p.name for p in (tmp_path / "img").iterdir()) == [results[0].path.name]
+
+
+def test_download_reuses_cache_across_dirs(tmp_path, cache):
+    calls = []
+
+    def handler(request):
+        calls.append(str(request.url))
+        return httpx.Response(200, headers={"content-type": "image/jpeg"}, content=JPEG)
+
+    url = "https://shop.example/a.jpg"
+    first = _download([url], tmp_path / "run1", handler)[0]
+    second = _download([url], tmp_path / "run2", handler)[0]
+
+    assert calls == [url]
+    assert second.path.parent == tmp_path / "run2" and second.path.read_bytes() == first.path.read_bytes()
+    assert cache.hits == 1
@@ -0,0 +1,17 @@
+"""Wariant do bazy: preprocessing i resize_image_for_storage dają te same bajty (ten sam sha256 w image_blobs)."""
+from __future__ import annotations
+
+import pytest
+from PIL import Image
+
+from src.image_preprocess import preprocess_image
+from src.image_store import resize_image_for_storage
+
+
+@pytest.mark.parametrize("size, fmt", [((4000, 3000), "JPEG"), ((1200, 900), "JPEG"), ((3000, 4000), "PNG")])
+def test_storage_variant_matches_preprocessing(tmp_path, size, fmt):
+    path = tmp_path / f"image.{fmt.lower()}"
+    gradient = Image.linear_gradient("L").resize(size)
+    Image.merge("RGB", (gradient, Image.effect_noise(size, 50), gradient.rotate(40))).save(path, format=fmt)
+
+    assert preprocess_image(path).storage == resize_image_for_storage(path)
@@ -0,0 +1,75 @@
+"""Etapy run_pipeline bez sieci i API: wyszukiwanie + pobieranie partiami."""
+from __future__ import annotations
+
+import asyncio
+
+import config
+from src import pipeline
+from src.image_downloader import DownloadResult
+from src.pipeline import PreparedRun
+from src.source_search import ImageSource
+
+
+def test_search_batches_share_one_download_deadline(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "DOWNLOAD_DEADLINE_S", 1.0)
+    deadlines: list[float] = []
+
+    async def fake_search(product_name, ean=None, min_count=None, on_sources=None, include_organic=False):
+        first = [ImageSource(image_url="https://a.example/1.jpg")]
+        second = [ImageSource(image_url="https://b.example/2.jpg")]
+        on_sources(first)
+        await asyncio.sleep(0.4)  # druga partia (np. DuckDuckGo) po części czasu etapu
+        on_sources(second)
+        return first + second, []
+
+    async def fake_download(urls, dest_dir, *, start_index=0, deadline_s=None, on_result=None, **kwargs):
+        deadlines.append(deadline_s)
+        return [DownloadResult(url=u, index=start_index + i, error="x") for i, u in enumerate(urls)]
+
+    monkeypatch.setattr(pipeline, "search_image_sources_async", fake_search)
+    monkeypatch.setattr(pipeline, "download_images_async", fake_download)
+    prep = PreparedRun(result={"ean": "1"}, product_name="Produkt", product_ean="1")
+
+    sources, _, downloads = asyncio.run(pipeline._search_and_download(prep, 2, tmp_path))
+
+    assert [d.index for d in downloads] == [0, 1]
+    assert deadlines[0] > 0.9
+    assert deadlines[1] < 0.7  # pozostały czas etapu, nie pełny DOWNLOAD_DEADLINE_S
+
+
+def test_invalid_verify_reply_is_a_warning_and_not_checkpointed(tmp_path, monkeypatch):
+    from src import description_verification
+    from src.run_checkpoint import RunCheckpoint
+
+    analyze_calls, replies = [], ["to nie jest JSON", '{"description_verified": "opis ok", "description_confidence": 0.9}']
+
+    async def fake_analyze(image_paths):
+        analyze_calls.append(len(image_paths))
+        return "opis bazowy"
+
+    async def fake_message(system, user, batch, **kwargs):
+        return replies.pop(0)
+
+    monkeypatch.setattr(pipeline, "analyze_images_for_description_async", fake_analyze)
+    monkeypatch.setattr(description_verification, "message_with_images_async", fake_message)
+    image = tmp_path / "a.jpg"
+    image.write_bytes(b"jpeg")
+
+    warnings: list[str] = []
+    base, verified = asyncio.run(
+        pipeline._describe([image], "Produkt", "two_step", checkpoint=RunCheckpoint(tmp_path), warnings=warnings)
+    )
+    # schemat `verified` bez zmian (bez klucza "error"), błąd parsowania w ostrzeżeniach runu
+    assert base == "opis bazowy" and "error" not in verified
+    assert verified["description_verified"] == "opis bazowy"
+    assert warnings == ["verify: invalid JSON in response"]
+
+    # wznowienie: analiza z checkpointu, weryfikacja ponowiona
+    warnings = []
+    _, verified = asyncio.run(
+        pipeline._describe(
+            [image], "Produkt", "two_step", checkpoint=RunCheckpoint(tmp_path, resume=True), warnings=warnings
+        )
+    )
+    assert analyze_calls == [1]
+    assert verified["description_verified"] == "opis ok" and warnings == []
@@ -0,0 +1,84 @@
+"""Trwały cache (SqliteCache) i cache odpowiedzi Claude – klient API podmieniony, bez sieci."""
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+from src import cache_store, claude_client
+from src.cache_store import SqliteCache
+
+
+def test_sqlite_cache_ttl_lru_and_namespaces(tmp_path, monkeypatch):
+    db = tmp_path / "cache.sqlite"
+    now = [1000.0]
+    monkeypatch.setattr(cache_store, "time", SimpleNamespace(time=lambda: now[0]))
+    cache = SqliteCache("a", max_entries=2, path=db)
+    other = SqliteCache("b", max_entries=2, path=db)
+
+    cache.set("k1", {"v": 1})
+    cache.set("short", [1, 2], ttl_s=10)
+    other.set("k1", "inna przestrzeń")
+    assert cache.get("k1") == {"v": 1} and other.get("k1") == "inna przestrzeń"
+
+    now[0] += 20  # "short" wygasł; przy przepełnieniu usuwany przed żywymi wpisami
+    cache.set("k2", "x")
+    assert cache.get("short") is None
+    assert cache.get("k1") == {"v": 1} and cache.stats()["entries"] == 2
+
+    now[0] += 1
+    cache.get("k1")  # k1 świeższy niż k2
+    cache.set("k3", "y")
+    assert cache.get("k2") is None and cache.get("k1") == {"v": 1}
+    # druga instancja (inny proces) widzi te same wpisy
+    assert SqliteCache("a", max_entries=2, path=db).get("k3") == "y"
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """Cache odpowiedzi w tmp_path i klient z messages.create; zwraca (wysłane żądania, kolejka odpowiedzi)."""
+    requests: list[dict] = []
+    replies: list[str] = []
+
+    async def create(**params):
+        requests.append(params)
+        return SimpleNamespace(content=[SimpleNamespace(text=replies.pop(0))], usage=None)
+
+    cache = SqliteCache("claude_responses", max_entries=100, path=tmp_path / "cache.sqlite")
+    monkeypatch.setattr(claude_client, "get_response_cache", lambda: cache)
+    client = SimpleNamespace(messages=SimpleNamespace(create=create))
+    monkeypatch.setattr(claude_client, "get_async_client", lambda: client)
+    return requests, replies
+
+
+def _ask(image, **kwargs) -> str:
+    return asyncio.run(claude_client.message_with_images_async("system", "opisz", [image], **kwargs))
+
+
+def test_response_cache_skips_repeated_request(tmp_path, api):
+    requests, replies = api
+    image = tmp_path / "a.png"
+    Image.new("RGB", (64, 48), (10, 200, 30)).save(image)
+
+    replies.extend(["odpowiedź", "inna"])
+    assert _ask(image) == "odpowiedź"
+    assert _ask(image) == "odpowiedź"  # to samo żądanie i ta sama treść zdjęcia – z cache
+    assert len(requests) == 1
+
+    Image.new("RGB", (64, 48), (200, 10, 30)).save(image)  # ta sama ścieżka, inna treść
+    assert _ask(image) == "inna" and len(requests) == 2
+
+
+def test_response_failing_cacheable_is_not_stored(tmp_path, api):
+    requests, replies = api
+    image = tmp_path / "a.png"
+    Image.new("RGB", (64, 48), (10, 200, 30)).save(image)
+
+    replies.extend(["nie json", '{"ok": true}', "nieużywana"])
+    is_json = lambda text: text.startswith("{")
+    assert _ask(image, cacheable=is_json) == "nie json"
+    assert _ask(image, cacheable=is_json) == '{"ok": true}'
+    assert _ask(image, cacheable=is_json) == '{"ok": true}'
+    assert len(requests) == 2
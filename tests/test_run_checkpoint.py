@@ -0,0 +1,32 @@
+"""RunCheckpoint: wznowienie etapów i unieważnianie po zmianie wejść."""
+from __future__ import annotations
+
+from src.run_checkpoint import STAGES_FILE, RunCheckpoint
+
+
+def test_resume_reuses_stage_only_for_same_inputs(tmp_path):
+    image = tmp_path / "a.jpg"
+    image.write_bytes(b"first")
+    ckpt = RunCheckpoint(tmp_path)
+    inputs = {"images": ckpt.file_digests([image]), "model": "m1"}
+    ckpt.put("matching", inputs, {"matched": ["a.jpg"]})
+    assert (tmp_path / STAGES_FILE).exists()
+    assert ckpt.get("matching", inputs) is None  # bez resume checkpoint tylko zapisuje
+
+    resumed = RunCheckpoint(tmp_path, resume=True)
+    assert resumed.get("matching", {"model": "m1", "images": resumed.file_digests([image])}) == {"matched": ["a.jpg"]}
+    assert resumed.get("matching", {**inputs, "model": "m2"}) is None
+    assert resumed.get("quality", inputs) is None
+
+    # zmieniona treść zdjęcia = inny odcisk (nowa instancja – digesty liczone od nowa)
+    image.write_bytes(b"second")
+    changed = RunCheckpoint(tmp_path, resume=True)
+    assert changed.get("matching", {"images": changed.file_digests([image]), "model": "m1"}) is None
+
+
+def test_corrupt_checkpoint_starts_fresh(tmp_path):
+    (tmp_path / STAGES_FILE).write_text("{not json", encoding="utf-8")
+    ckpt = RunCheckpoint(tmp_path, resume=True)
+    assert ckpt.get("lookup", {}) is None
+    ckpt.put("lookup", {}, {"name": "x"})
+    assert RunCheckpoint(tmp_path, resume=True).get("lookup", {}) == {"name": "x"}
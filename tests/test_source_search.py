@@ -0,0 +1,110 @@
+"""Cache stron dostawców i stronicowanie search_more_sources kursorem – dostawcy podmienieni, bez sieci."""
+from __future__ import annotations
+
+import base64
+import json
+
+import pytest
+
+import config
+from src import source_search
+from src.cache_store import SqliteCache
+from src.source_search import ImageSource, decode_cursor, encode_cursor, search_more_sources
+
+PAGE = 4
+
+
+def _cursor(data) -> str:
+    return base64.urlsafe_b64encode(json.dumps(data).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    """serpapi: 2 pełne strony, potem koniec; duckduckgo: jedna strona. failing = strony kończące się błędem."""
+    calls: list[tuple[str, int]] = []
+    failing: set[tuple[str, int]] = set()
+    pages = {"serpapi": 2, "duckduckgo": 1}
+
+    def provider(name):
+        def fetch_page(query, page):
+            calls.append((name, page))
+            if (name, page) in failing:
+                raise RuntimeError("HTTP 429")
+            if page >= pages[name]:
+                return []
+            return [ImageSource(image_url=f"https://{name}.example/{page}-{i}.jpg") for i in range(PAGE)]
+        return fetch_page, PAGE
+
+    monkeypatch.setattr(source_search, "_PAGED_PROVIDERS", {name: provider(name) for name in pages})
+    monkeypatch.setattr(config, "SEARCH_MORE_MAX_PAGES", 5)
+    return calls, failing
+
+
+def test_cursor_round_trip_and_invalid_cursors(providers):
+    offsets = {"serpapi": 7, "duckduckgo": None}
+    assert decode_cursor(encode_cursor(offsets)) == offsets
+    assert encode_cursor({"serpapi": None, "duckduckgo": None}) is None
+
+    start = {"serpapi": 0, "duckduckgo": 0}
+    for bad in ("@@@", _cursor([1]), _cursor("x"), _cursor(None), _cursor({"serpapi": -3, "duckduckgo": "a"})):
+        assert decode_cursor(bad) == start
+
+
+def test_search_more_pages_through_providers(providers):
+    calls, _ = providers
+    first, cursor = search_more_sources("Produkt", min_count=6)
+    assert [s.image_url for s in first] == [f"https://serpapi.example/{p}-{i}.jpg" for p in (0, 1) for i in range(4)][:6]
+    assert decode_cursor(cursor) == {"serpapi": 6, "duckduckgo": 0}
+
+    second, cursor = search_more_sources("Produkt", cursor=cursor, min_count=6)
+    assert [s.image_url for s in second][:2] == ["https://serpapi.example/1-2.jpg", "https://serpapi.example/1-3.jpg"]
+    assert [s.image_url for s in second][2:] == [f"https://duckduckgo.example/0-{i}.jpg" for i in range(4)]
+    assert decode_cursor(cursor) == {"serpapi": None, "duckduckgo": 4}
+
+    third, cursor = search_more_sources("Produkt", cursor=cursor, min_count=6)
+    assert third == [] and cursor is None
+
+
+def test_provider_error_keeps_offset(providers):
+    calls, failing = providers
+    failing.add(("serpapi", 1))
+
+    first, cursor = search_more_sources("Produkt", min_count=6)
+    # błąd strony 1 SerpAPI: reszta z DuckDuckGo, offset SerpAPI zostaje do ponowienia
+    assert len(first) == 6
+    assert decode_cursor(cursor) == {"serpapi": PAGE, "duckduckgo": 2}
+
+    failing.clear()
+    second, cursor = search_more_sources("Produkt", cursor=cursor, min_count=4)
+    assert [s.image_url for s in second] == [f"https://serpapi.example/1-{i}.jpg" for i in range(4)]
+    assert decode_cursor(cursor)["serpapi"] == 2 * PAGE
+
+
+def test_provider_pages_are_cached_but_errors_and_empty_pages_are_not(tmp_path, monkeypatch):
+    cache = SqliteCache(source_search.CACHE_NAMESPACE, max_entries=100, path=tmp_path / "cache.sqlite")
+    monkeypatch.setattr(source_search, "get_search_cache", lambda: cache)
+    monkeypatch.setattr(config, "SERPAPI_API_KEY", "test")
+    fetched: list[int] = []
+    outcomes = {0: "ok", 1: "error", 2: "empty"}
+
+    def fake_fetch(query, page):
+        fetched.append(page)
+        if outcomes[page] == "error":
+            raise RuntimeError("HTTP 429")
+        if outcomes[page] == "empty":
+            return []
+        return [ImageSource(image_url=f"https://a.example/{page}.jpg", page_url="https://shop.example/p")]
+
+    monkeypatch.setattr(source_search, "_fetch_serpapi_images", fake_fetch)
+
+    first = source_search._serpapi_images_page("Produkt 590", 0)
+    assert source_search._serpapi_images_page("Produkt 590", 0) == first
+    assert first[0].source_domain == "shop.example"
+    assert source_search._search_serpapi_images("Produkt 590", 10) == first  # pierwsza strona z cache
+    assert fetched == [0]
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            source_search._serpapi_images_page("Produkt 590", 1)
+        assert source_search._serpapi_images_page("Produkt 590", 2) == []
+    assert fetched == [0, 1, 2, 1, 2]
@@ -0,0 +1,74 @@
+"""Tryb strumieniowy: batche z kolejki (pełne / po linger_s) i przekazanie między etapami."""
+from __future__ import annotations
+
+import asyncio
+
+from src.stage_stream import END, iter_batches, run_stage
+
+
+def test_iter_batches_full_now_partial_after_linger():
+    async def main():
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        start = loop.time()
+        for i in range(3):
+            queue.put_nowait(i)
+
+        async def producer():
+            await asyncio.sleep(0.3)
+            queue.put_nowait(3)
+            queue.put_nowait(END)
+
+        asyncio.create_task(producer())
+        out = []
+        async for batch in iter_batches(queue, batch_size=2, linger_s=0.1):
+            out.append((batch, loop.time() - start))
+        return out
+
+    (b0, t0), (b1, t1), (b2, t2) = asyncio.run(main())
+    # [0, 1] od razu; [2] po linger_s (nie czeka na producenta); [3] przy END
+    assert (b0, b1, b2) == ([0, 1], [2], [3])
+    assert t0 < 0.05 and 0.09 <= t1 < 0.25 and t2 >= 0.29
+
+
+def test_run_stage_hands_accepted_items_to_next_stage():
+    calls: list[tuple[str, list[int]]] = []
+    running = {"now": 0, "max": 0}
+
+    def judge(name, accept):
+        async def run(batch):
+            calls.append((name, batch))
+            running["now"] += 1
+            running["max"] = max(running["max"], running["now"])
+            await asyncio.sleep(0.02)
+            running["now"] -= 1
+            ok = [x for x in batch if accept(x)]
+            return ok, [x for x in batch if not accept(x)], {"n": len(batch)}
+        return run
+
+    async def main():
+        downloads, matched = asyncio.Queue(), asyncio.Queue()
+        limit = asyncio.Semaphore(2)  # wspólny dla obu etapów
+        matching = asyncio.create_task(run_stage(
+            downloads, judge("matching", lambda x: x % 2 == 0), batch_size=2, linger_s=0.05,
+            limit=limit, outbox=matched, name="matching", drop=lambda x: x == 4,
+        ))
+        quality = asyncio.create_task(run_stage(
+            matched, judge("quality", lambda x: x < 8), batch_size=3, linger_s=0.05, limit=limit, name="quality",
+        ))
+        for i in range(11):
+            downloads.put_nowait(i)
+            await asyncio.sleep(0.005)
+        downloads.put_nowait(END)
+        return await matching, await quality
+
+    m, q = asyncio.run(main())
+
+    assert sorted(m.accepted) == [0, 2, 6, 8, 10] and sorted(m.rejected) == [1, 3, 5, 7, 9]
+    assert m.all_batches_ok
+    assert sorted(q.accepted) == [0, 2, 6] and sorted(q.rejected) == [8, 10]
+    assert q.batches == len(q.parsed) >= 2  # partie quality ruszają, zanim matching skończy
+    # quality dostaje tylko zaakceptowane przez matching; 4 pominięte (drop) przed wysyłką
+    assert sorted(x for name, b in calls if name == "quality" for x in b) == [0, 2, 6, 8, 10]
+    assert all(4 not in b for _, b in calls)
+    assert running["max"] <= 2